@@ -37,6 +37,8 @@ import re
 from os import listdir
 import copy
 import numpy as np  # must have Blender > 2.7
+import heapq
+from collections import OrderedDict
 import csv
 import xml.etree.ElementTree as ET
 import datetime
@@ -534,20 +536,11 @@ def get_ctr_pt_from_ext_pt(mesh, cross_section, v_co, small_step, self, opt):
         else:
             if opt == "use_perimeter":
                 # Find point halfway around the perimeter of cross section
-                all_perimeter_dists = []
-                all_perimeter_inds = []
-                for vind in range(0, len(cross_section.data.vertices)):
-                    if vind == closest_vind:
-                        this_dist = 0
-                    else:
-                        select_shortest_path(cross_section, [closest_vind, vind])
-                        this_dist = get_total_length_of_edges(cross_section)
-
-                    all_perimeter_dists.append(this_dist)
-                    all_perimeter_inds.append(vind)  # in case cross_section.data.vertices not ordered
-
-                max_dist_ind = np.argmax(all_perimeter_dists)
-                furthest_vert_ind = all_perimeter_inds[max_dist_ind]
+                # (distances along the edges of the cross section, from closest_vind to all vertices at once)
+                graph = get_surface_graph(cross_section, face_diagonals=False)
+                all_perimeter_dists = geodesic_distances(graph, [closest_vind])
+                all_perimeter_dists[np.isinf(all_perimeter_dists)] = 0  # ignore disconnected vertices
+                furthest_vert_ind = int(np.argmax(all_perimeter_dists))
                 furthest_csvert_co = cross_section.data.vertices[furthest_vert_ind].co
 
             elif opt == "use_bdry_normal":
@@ -626,47 +619,149 @@ def get_ctr_pt_from_ext_pt(mesh, cross_section, v_co, small_step, self, opt):
     return(v_co)
 
 
-def select_shortest_path(obj, vinds):
-# Select shortest path on obj between the (2) vertices with indices in vinds
-    select_obj(obj)
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='DESELECT')
-    bpy.ops.object.mode_set(mode='OBJECT')
-    for vind in vinds:
-        obj.data.vertices[vind].select = True
-    bpy.ops.object.mode_set(mode='EDIT')
-    err = bpy.ops.mesh.shortest_path_select()  
-    bpy.ops.object.mode_set(mode='OBJECT')
-
-    # shortest_path_select() returns nothing if points are neighbors, so select them again
-    verts_out = [v for v in obj.data.vertices if v.select == True]
-    if len(verts_out) == 0:
-        for vind in vinds:
-            obj.data.vertices[vind].select = True
-
-
-
-def get_total_length_of_edges(ob):
-# Get length of all elected edges on an object
-    bpy.ops.object.mode_set(mode='EDIT')
-    select_as_vert = tuple(bpy.context.scene.tool_settings.mesh_select_mode)[1]
-    bpy.ops.mesh.select_mode(type="EDGE")
-    bpy.ops.object.mode_set(mode='OBJECT')
-    edges = [ed for ed in ob.data.edges if ed.select == True]
-
-    total_len = 0
-    for ed in edges:
-        v1 = ob.data.vertices[ed.vertices[0]].co
-        v2 = ob.data.vertices[ed.vertices[1]].co
-        total_len += (v1-v2).length
-    # bpy.context.scene.last_len = total_len
-
-    if not select_as_vert:
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_mode(type="VERT")
-        bpy.ops.object.mode_set(mode='OBJECT')
-
-    return(total_len)
+# cache of the surface graph of each mesh object used by the geodesic functions below
+# (as in NeuroMorph_Measurement_Tools),
+# rebuilt only when the mesh changes:  {object name: [mesh hash, graph]};
+# only the graph_cache_size most recently used graphs of existing objects are kept
+graph_cache = OrderedDict()
+graph_cache_size = 2
+
+
+# add a graph to graph_cache, dropping the graphs of deleted objects and the least recently used ones
+def store_surface_graph(key, entry):
+    graph_cache[key] = entry
+    graph_cache.move_to_end(key)
+    for old_key in [old_key for old_key in graph_cache if old_key not in bpy.data.objects]:
+        del graph_cache[old_key]
+    while len(graph_cache) > graph_cache_size:
+        graph_cache.popitem(last=False)
+
+
+# weighted vertex adjacency graph of a mesh in CSR form, with edge lengths as weights:
+# the neighbors of vertex v are indices[indptr[v]:indptr[v+1]];
+# if face_diagonals, vertices are also connected straight across quads and n-gons
+def build_surface_graph(co, edges, loop_verts, loop_totals, face_diagonals=True):
+    a = [edges[:,0]]
+    b = [edges[:,1]]
+    if face_diagonals:
+        loop_starts = np.cumsum(loop_totals) - loop_totals
+        for nsides in np.unique(loop_totals[loop_totals >= 4]):
+            face_starts = loop_starts[loop_totals == nsides]
+            face_verts = loop_verts[face_starts[:,None] + np.arange(nsides)]
+            for ii in range(nsides):
+                for jj in range(ii + 2, nsides - (ii == 0)):  # all pairs of non-neighboring corners
+                    a.append(face_verts[:,ii])
+                    b.append(face_verts[:,jj])
+    a = np.concatenate(a)
+    b = np.concatenate(b)
+    src = np.concatenate((a, b))
+    dst = np.concatenate((b, a))
+    order = np.argsort(src, kind='stable')
+    src = src[order]
+    dst = dst[order]
+    weights = np.linalg.norm(co[src].astype(np.float64) - co[dst], axis=1)
+    indptr = np.zeros(len(co) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(src, minlength=len(co)))
+
+    # kept as numpy arrays, far smaller than python lists; the searches below read the
+    # neighbors of each vertex they visit as python lists, which keeps the queue loops fast
+    return ({"indptr": indptr, "indices": dst, "weights": weights, "co": co})
+
+
+# return the surface graph of the mesh of obj, from graph_cache if the mesh has not changed
+def get_surface_graph(obj, face_diagonals=True):
+    mesh = obj.data
+    co, loop_verts, loop_totals = get_mesh_arrays(mesh)
+    edges = np.empty(len(mesh.edges) * 2, dtype=np.int32)
+    mesh.edges.foreach_get("vertices", edges)
+    edges = edges.reshape((-1, 2))
+    mesh_hash = hash((get_mesh_hash(co, loop_verts, loop_totals), edges.tobytes(), face_diagonals))
+    if obj.name in graph_cache and graph_cache[obj.name][0] == mesh_hash:
+        graph_cache.move_to_end(obj.name)
+        return (graph_cache[obj.name][1])
+
+    graph = build_surface_graph(co, edges, loop_verts, loop_totals, face_diagonals)
+    store_surface_graph(obj.name, [mesh_hash, graph])
+    return (graph)
+
+
+# shortest path on the surface graph between vertices src and dst, by A* search
+# with the straight-line distance to dst as heuristic:
+# returns (list of vertex indices from src to dst, length), or ([], inf) if they are not connected
+def geodesic_path(graph, src, dst):
+    indptr = graph["indptr"]
+    indices = graph["indices"]
+    weights = graph["weights"]
+    co = graph["co"]
+    co_dst = co[dst].astype(np.float64)
+
+    dists = {src: 0.0}
+    prev = {src: -1}
+    done = set()
+    queue = [(float(np.linalg.norm(co[src] - co_dst)), src)]
+    while queue:
+        f, v = heapq.heappop(queue)
+        if v in done:
+            continue
+        if v == dst:
+            path = [v]
+            while prev[path[-1]] >= 0:
+                path.append(prev[path[-1]])
+            return (path[::-1], dists[dst])
+        done.add(v)
+        dv = dists[v]
+        start, stop = indptr[v], indptr[v+1]
+        nbrs = indices[start:stop]
+        ests = np.linalg.norm(co[nbrs] - co_dst, axis=1)
+        for u, w, h in zip(nbrs.tolist(), weights[start:stop].tolist(), ests.tolist()):
+            du = dv + w
+            if u not in done and du < dists.get(u, math.inf):
+                dists[u] = du
+                prev[u] = v
+                heapq.heappush(queue, (du + h, u))
+    return ([], math.inf)
+
+
+# distance on the surface graph from the nearest of the vertices in sources to every vertex,
+# by Dijkstra's algorithm; vertices further than max_dist (or not connected) get inf
+def geodesic_distances(graph, sources, max_dist=math.inf):
+    indptr = graph["indptr"]
+    indices = graph["indices"]
+    weights = graph["weights"]
+    dists = [math.inf] * (len(indptr) - 1)
+    queue = []
+    for s in sources:
+        dists[s] = 0.0
+        queue.append((0.0, s))
+    heapq.heapify(queue)
+    while queue:
+        dv, v = heapq.heappop(queue)
+        if dv > dists[v]:
+            continue
+        start, stop = indptr[v], indptr[v+1]
+        for u, w in zip(indices[start:stop].tolist(), weights[start:stop].tolist()):
+            du = dv + w
+            if du < dists[u] and du <= max_dist:
+                dists[u] = du
+                heapq.heappush(queue, (du, u))
+    return (np.array(dists))
+
+
+# read vertex coordinates and face loops of a mesh into numpy arrays
+def get_mesh_arrays(mesh):
+    nverts = len(mesh.vertices)
+    co = np.empty(nverts * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    loop_verts = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_verts)
+    loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    return (co.reshape((nverts, 3)), loop_verts, loop_totals)
+
+
+# hash of the geometry of a mesh, changes whenever a vertex moves or the faces change
+def get_mesh_hash(co, loop_verts, loop_totals):
+    return hash((co.tobytes(), loop_verts.tobytes(), loop_totals.tobytes()))
 
 
 
@@ -1712,6 +1807,17 @@ class ProjectVesicles(bpy.types.Operator):
     def execute(self, context):
         # full_filename = define_filename(self, ".csv")
 
+        # Vesicles already reduced to a single point cloud object (Proximity Analysis add-on)
+        these_obs = [ob for ob in bpy.data.objects if ob.select]
+        point_clouds = [ob for ob in these_obs if "vesicle_names" in ob]
+        if len(these_obs) == 2 and len(point_clouds) == 1:
+            vesicle_obj = point_clouds[0]
+            centerline = [ob for ob in these_obs if ob != vesicle_obj][0]
+            convert_to_global_coords([centerline])
+            vesicle_ctrs = [vesicle_obj.matrix_world * v.co for v in vesicle_obj.data.vertices]
+            centerline["vesicle_counts"] = proj_points(centerline, vesicle_ctrs)
+            return {'FINISHED'}
+
         # Assign centerline and vesicle object from selected objects
         err, objs = assign_selected_objects(self)
         if err < 0:
@@ -1827,6 +1933,14 @@ def calc_center(obj):
 # Find closest point on centerline to each vesicle center point
 # Tally vesicles per centerline vertex
 def proj_vesicles(ctrline, vesicle_list):
+    vsc_ctrs = []
+    for vsc_name in vesicle_list:
+        vsc_obj = bpy.context.scene.objects[vsc_name]
+        vsc_ctrs.append(calc_center(vsc_obj))  # center point of vsc mesh
+    return (proj_points(ctrline, vsc_ctrs))
+
+# Tally points (vesicle centers) per closest centerline vertex
+def proj_points(ctrline, pts):
     nverts = len(ctrline.data.vertices)
     kdt = mathutils.kdtree.KDTree(nverts)
     for ii, vv in enumerate(ctrline.data.vertices):
@@ -1834,13 +1948,9 @@ def proj_vesicles(ctrline, vesicle_list):
     kdt.balance()
 
     vcounts = [0] * nverts  # count number vesicles that project to each point
-    for vsc_name in vesicle_list:
-        vsc_obj = bpy.context.scene.objects[vsc_name]
-        vsc_ctr = calc_center(vsc_obj)  # center point of vsc mesh
-
+    for pt in pts:
         # calculate closest ctrline point to center point
-        ctrline_co, ii, dist = kdt.find(vsc_ctr)
-        #print(vsc_name, dist, ii, vcounts[ii])
+        ctrline_co, ii, dist = kdt.find(pt)
         vcounts[ii] += 1
 
     return (vcounts)
@@ -28,6 +28,7 @@ bl_info = {
 
 import bpy
 from bpy.props import *
+from bpy.app.handlers import persistent
 import math
 import mathutils
 import os
@@ -35,20 +36,12 @@ import re
 from os.path import expanduser
 #import inspect
 import bmesh
+import numpy as np  # must have Blender > 2.7
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
     
 
-# get signed volume contribution from single triangle
-def get_vol_tri(tri):  
-    # tri = [p0, p1, p2],  pn = [x, y, z]
-    p0 = tri[0]
-    p1 = tri[1]
-    p2 = tri[2]
-    vcross = cross_product(p1,p2)
-    vdot = dot_product(p0, vcross)
-    vol = vdot/6
-    return vol
-
-
 def cross_product(v0, v1):
     x =   v0[1]*v1[2] - v0[2]*v1[1]
     y = -(v0[0]*v1[2] - v0[2]*v1[0])
@@ -61,15 +54,6 @@ def dot_product(v0,v1):
     return sum(vec)
 
 
-# get area of single triangle
-def get_area_tri(tri):
-    # tri = [p0, p1, p2]
-    p0 = tri[0]
-    p1 = tri[1]
-    p2 = tri[2]
-    area = mathutils.geometry.area_tri(p0, p1, p2)
-    return area
-
 def GetDist(a, b):
     dif = []
     for i in range(0,3):
@@ -334,81 +318,138 @@ class Length3D(bpy.types.Operator):
 
 
 
-def add_face_edges(obj, vert_inds):
-# add edges to connect vertices on each face across the face:
-# for each quadrilateral face, add the two diagonals,
-# for each n>4-sided face, add the centroid and edges connecting
-# it to each original vertex,
-# leave triangular faces as they are
-
-    bpy.ops.object.mode_set(mode='EDIT')
-    obj = bpy.context.object
-    data = obj.data
-    bm = bmesh.new()   # create an empty BMesh
-    bm.from_mesh(data)   # fill it in from a Mesh
-
-    # find shortest path using centroids of all faces;
-    # only add diagonal edges to quad faces that include
-    # vertices from this shortest path
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.mesh.poke()  # adds the centroid to each face and radial edges connecting it each vertex
-    bpy.ops.mesh.select_all(action='DESELECT')
-    bpy.ops.object.mode_set(mode='OBJECT')
-    for vind in vert_inds:
-        data.vertices[vind].select=True
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.shortest_path_select()
-    bpy.ops.object.mode_set(mode='OBJECT')
-
-    # store the indices of these vertices, then undo, then proceed
-    poke_path_inds = []
-    for v in data.vertices:
-        if v.select:
-            poke_path_inds.append(v.index)
-    # undo poke
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.ed.undo()
-    bpy.ops.object.mode_set(mode='OBJECT')
-
-    # handle quad faces
-    bm.verts.ensure_lookup_table()
-    for face in data.polygons:
-        if len(face.vertices) == 4:
-            on_path_flag = 0
-            for vert in face.vertices:
-                if vert in poke_path_inds:
-                    on_path_flag = 1
-                    break
-            if on_path_flag:
-                v0bm = bm.verts[face.vertices[0]]
-                v1bm = bm.verts[face.vertices[1]]
-                v2bm = bm.verts[face.vertices[2]]
-                v3bm = bm.verts[face.vertices[3]]
-                e1 = [v0bm, v2bm]
-                e2 = [v1bm, v3bm]
-                bm.edges.new(e1)
-                bm.edges.new(e2)
-    bm.edges.index_update()
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bm.to_mesh(data)
-    bpy.ops.object.mode_set(mode='EDIT')
-
-    # handle non-quad faces  (leave triangular faces as they are)
-    # if many faces with >4 sides might be slow
-    for face in bm.faces:  # use the bmesh data structure: pointers don't go away after context change
-        if len(face.verts) > 4:
-            bpy.ops.mesh.select_all(action='DESELECT')
-            face.select = True
-            bpy.ops.object.mode_set(mode='OBJECT')
-            bm.to_mesh(data)
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.poke()
-
-    bm.edges.index_update()
-    bmesh.update_edit_mesh(data, destructive=True)  # to update mesh in scene
-    bm.free()
-
+# cache of the surface graph of each mesh object used by the geodesic functions below,
+# rebuilt only when the mesh changes:  {(object name, face_diagonals): [update stamp, mesh hash, graph]};
+# only the graph_cache_size most recently used graphs of existing objects are kept
+graph_cache = OrderedDict()
+graph_cache_size = 2
+
+
+# add a graph to graph_cache, dropping the graphs of deleted objects and the least recently used ones
+def store_surface_graph(key, entry):
+    graph_cache[key] = entry
+    graph_cache.move_to_end(key)
+    for old_key in [old_key for old_key in graph_cache if old_key[0] not in bpy.data.objects]:
+        del graph_cache[old_key]
+    while len(graph_cache) > graph_cache_size:
+        graph_cache.popitem(last=False)
+
+
+# weighted vertex adjacency graph of a mesh in CSR form, with edge lengths as weights:
+# the neighbors of vertex v are indices[indptr[v]:indptr[v+1]];
+# if face_diagonals, vertices are also connected straight across quads and n-gons
+def build_surface_graph(co, edges, loop_verts, loop_totals, face_diagonals=True):
+    a = [edges[:,0]]
+    b = [edges[:,1]]
+    if face_diagonals:
+        loop_starts = np.cumsum(loop_totals) - loop_totals
+        for nsides in np.unique(loop_totals[loop_totals >= 4]):
+            face_starts = loop_starts[loop_totals == nsides]
+            face_verts = loop_verts[face_starts[:,None] + np.arange(nsides)]
+            for ii in range(nsides):
+                for jj in range(ii + 2, nsides - (ii == 0)):  # all pairs of non-neighboring corners
+                    a.append(face_verts[:,ii])
+                    b.append(face_verts[:,jj])
+    a = np.concatenate(a)
+    b = np.concatenate(b)
+    src = np.concatenate((a, b))
+    dst = np.concatenate((b, a))
+    order = np.argsort(src, kind='stable')
+    src = src[order]
+    dst = dst[order]
+    weights = np.linalg.norm(co[src].astype(np.float64) - co[dst], axis=1)
+    indptr = np.zeros(len(co) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(src, minlength=len(co)))
+
+    # kept as numpy arrays, far smaller than python lists; the searches below read the
+    # neighbors of each vertex they visit as python lists, which keeps the queue loops fast
+    return ({"indptr": indptr, "indices": dst, "weights": weights, "co": co})
+
+
+# return the surface graph of the mesh of obj, from graph_cache if the mesh has not changed
+def get_surface_graph(obj, face_diagonals=True):
+    key = (obj.name, face_diagonals)
+    entry = get_cache_entry(graph_cache, obj, key=key)
+    if entry is not None:
+        graph_cache.move_to_end(key)
+        return (entry[2])
+
+    mesh = obj.data
+    co, loop_verts, loop_totals = get_mesh_arrays(mesh)
+    edges = np.empty(len(mesh.edges) * 2, dtype=np.int32)
+    mesh.edges.foreach_get("vertices", edges)
+    edges = edges.reshape((-1, 2))
+    mesh_hash = hash((get_mesh_hash(co, loop_verts, loop_totals), edges.tobytes()))
+    entry = get_cache_entry(graph_cache, obj, mesh_hash, key)
+    if entry is not None:
+        graph_cache.move_to_end(key)
+        return (entry[2])
+
+    graph = build_surface_graph(co, edges, loop_verts, loop_totals, face_diagonals)
+    store_surface_graph(key, [get_update_stamp(obj), mesh_hash, graph])
+    return (graph)
+
+
+# shortest path on the surface graph between vertices src and dst, by A* search
+# with the straight-line distance to dst as heuristic:
+# returns (list of vertex indices from src to dst, length), or ([], inf) if they are not connected
+def geodesic_path(graph, src, dst):
+    indptr = graph["indptr"]
+    indices = graph["indices"]
+    weights = graph["weights"]
+    co = graph["co"]
+    co_dst = co[dst].astype(np.float64)
+
+    dists = {src: 0.0}
+    prev = {src: -1}
+    done = set()
+    queue = [(float(np.linalg.norm(co[src] - co_dst)), src)]
+    while queue:
+        f, v = heapq.heappop(queue)
+        if v in done:
+            continue
+        if v == dst:
+            path = [v]
+            while prev[path[-1]] >= 0:
+                path.append(prev[path[-1]])
+            return (path[::-1], dists[dst])
+        done.add(v)
+        dv = dists[v]
+        start, stop = indptr[v], indptr[v+1]
+        nbrs = indices[start:stop]
+        ests = np.linalg.norm(co[nbrs] - co_dst, axis=1)
+        for u, w, h in zip(nbrs.tolist(), weights[start:stop].tolist(), ests.tolist()):
+            du = dv + w
+            if u not in done and du < dists.get(u, math.inf):
+                dists[u] = du
+                prev[u] = v
+                heapq.heappush(queue, (du + h, u))
+    return ([], math.inf)
+
+
+# distance on the surface graph from the nearest of the vertices in sources to every vertex,
+# by Dijkstra's algorithm; vertices further than max_dist (or not connected) get inf
+def geodesic_distances(graph, sources, max_dist=math.inf):
+    indptr = graph["indptr"]
+    indices = graph["indices"]
+    weights = graph["weights"]
+    dists = [math.inf] * (len(indptr) - 1)
+    queue = []
+    for s in sources:
+        dists[s] = 0.0
+        queue.append((0.0, s))
+    heapq.heapify(queue)
+    while queue:
+        dv, v = heapq.heappop(queue)
+        if dv > dists[v]:
+            continue
+        start, stop = indptr[v], indptr[v+1]
+        for u, w in zip(indices[start:stop].tolist(), weights[start:stop].tolist()):
+            du = dv + w
+            if du < dists[u] and du <= max_dist:
+                dists[u] = du
+                heapq.heappush(queue, (du, u))
+    return (np.array(dists))
 
 
 class PathOnMesh(bpy.types.Operator):
@@ -422,54 +463,32 @@ class PathOnMesh(bpy.types.Operator):
         vert_inds = [vind for vind, vert in enumerate(obj.data.vertices) if vert.select == True]
         if len(vert_inds)==2:
 
-            # Temporarily add edges to connect vertices across each face
-            add_face_edges(obj, vert_inds)
-
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.select_all(action='DESELECT')
-            bpy.ops.object.mode_set(mode='OBJECT')
-
-            for vind in vert_inds:
-                obj.data.vertices[vind].select = True
+            # Convert to global coordinates, just in case this hasn't already been done
+            bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
 
-            # Calculate the shortest path
-            bpy.ops.object.mode_set(mode='EDIT')
-            err = bpy.ops.mesh.shortest_path_select()  
-            bpy.ops.object.mode_set(mode='OBJECT')
+            # Calculate the shortest path, through vertices and straight across faces
+            graph = get_surface_graph(obj)
+            path, dist = geodesic_path(graph, vert_inds[0], vert_inds[1])
 
-            if "CANCELLED" in err:
+            if len(path) == 0:
                 self.report({'INFO'},"Cannot calculate path: points are from disconnected parts of the mesh")
-                bpy.ops.object.mode_set(mode='EDIT')
-                bpy.ops.ed.undo()
-                bpy.ops.object.mode_set(mode='OBJECT')
                 obj.select=True
                 bpy.context.scene.objects.active = obj
                 bpy.ops.object.mode_set(mode='EDIT')
                 return{'FINISHED'}
 
-            # shortest_path_select() returns nothing if points are neighbors, so select them again
-            verts_out = [v for v in obj.data.vertices if v.select == True]
-            if len(verts_out) == 0:
-                for vind in vert_inds:
-                    obj.data.vertices[vind].select = True
-
             # Display length
-            dist = get_total_length_of_edges(obj)
+            bpy.context.scene.last_len = dist
 
-            # Create new object from selected points
+            # Create new object from the points on the path
             if bpy.context.scene.create_length_obj:
-                curve = new_obj_from_selected_verts(obj)
+                curve = new_obj_from_path(obj, graph, path)
                 curve.name = obj.name + "_dist_on_mesh"
                 curve.length = dist
-
-            # Undo the triangulate operation
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.ed.undo()
-
-            if bpy.context.scene.create_length_obj:
                 activate_new_curve(curve, obj)
 
             else:  # Reactivate initial two points
+                bpy.ops.object.mode_set(mode='EDIT')
                 bpy.ops.mesh.select_all(action='DESELECT')
                 bpy.ops.object.mode_set(mode='OBJECT')
                 for v in vert_inds:
@@ -484,6 +503,20 @@ class PathOnMesh(bpy.types.Operator):
         return{'FINISHED'}
 
 
+# new mesh object of the vertices of path (indices into the vertices of obj) connected in order
+def new_obj_from_path(obj, graph, path):
+    co = graph["co"][path].astype(np.float32)
+    mesh = bpy.data.meshes.new(obj.name + "_path")
+    mesh.vertices.add(len(path))
+    mesh.vertices.foreach_set("co", co.ravel())
+    mesh.edges.add(len(path) - 1)
+    mesh.edges.foreach_set("vertices", np.repeat(np.arange(len(path), dtype=np.int32), 2)[1:-1])
+    mesh.update()
+    new_obj = bpy.data.objects.new(obj.name + "_path", mesh)
+    bpy.context.scene.objects.link(new_obj)
+    return (new_obj)
+
+
 class GetEdgeLengths(bpy.types.Operator):
     """Total length of all selected edges (or points)"""
     bl_idname = "object.length_edges"
@@ -565,20 +598,272 @@ def activate_new_curve(curve, obj):
 
 ################### end length calculation functions ############################### 
 
+# number of times the data of each object has been updated, counted by mark_updated_objects();
+# cache entries below are [update stamp, mesh hash, values...], with the stamp of get_update_stamp(),
+# so an entry whose object has not been updated since it was made is used without reading the mesh at all
+update_counts = {}
+
+# number of objects in the file when the caches were last pruned of deleted objects
+nobjects_pruned = 0
+
+
+# scene update handler:  count data updates (eg. edit mode changes) of the objects in the scene,
+# and when objects have been added or removed, forget the counts and cached values of deleted objects,
+# so a new object of the same name starts afresh
+@persistent
+def mark_updated_objects(scene):
+    if bpy.data.objects.is_updated:
+        for obj in scene.objects:
+            if obj.is_updated_data:
+                update_counts[obj.name] = update_counts.get(obj.name, 0) + 1
+        if len(bpy.data.objects) != nobjects_pruned:
+            prune_metrics_caches()
+
+
+# forget the update counts and cached values of objects that no longer exist
+def prune_metrics_caches():
+    global nobjects_pruned
+    names = set(bpy.data.objects.keys())
+    for cache in [update_counts, metrics_cache, face_area_cache]:
+        for name in [name for name in cache if name not in names]:
+            del cache[name]
+    nobjects_pruned = len(names)
+
+
+# the update count of obj together with the address of its mesh data:  an object created under the
+# name of a deleted one (eg. by separate) has new mesh data, so its stamp differs before any update is counted
+def get_update_stamp(obj):
+    return ((obj.data.as_pointer(), update_counts.get(obj.name, 0)))
+
+
+# file load handler:  object names of the previous file mean nothing in the new one
+@persistent
+def clear_metrics_caches(dummy):
+    global nobjects_pruned
+    for cache in [update_counts, metrics_cache, face_area_cache, graph_cache]:
+        cache.clear()
+    nobjects_pruned = 0
+
+
+# return the entry of cache for obj (stored under key, obj.name by default) if it is still valid:
+# the object has not been updated since the entry was made, or the given mesh_hash is unchanged
+def get_cache_entry(cache, obj, mesh_hash=None, key=None):
+    if key is None:
+        key = obj.name
+    entry = cache.get(key)
+    if entry is None:
+        return (None)
+    stamp = get_update_stamp(obj)
+    if entry[0] == stamp:
+        return (entry)
+    if mesh_hash is not None and entry[1] == mesh_hash:
+        entry[0] = stamp
+        return (entry)
+    return (None)
+
+
+# cache of surface area and volume of each mesh object, so the Geometry Properties
+# panel does not recompute them on every redraw:  {object name: [update stamp, mesh hash, SA, vol]}
+metrics_cache = {}
+
+
+# read vertex coordinates and face loops of a mesh into numpy arrays
+def get_mesh_arrays(mesh):
+    nverts = len(mesh.vertices)
+    nloops = len(mesh.loops)
+    nfaces = len(mesh.polygons)
+    co = np.empty(nverts * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    loop_verts = np.empty(nloops, dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_verts)
+    loop_totals = np.empty(nfaces, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    return (co.reshape((nverts, 3)), loop_verts, loop_totals)
+
+
+# hash of the geometry of a mesh, changes whenever a vertex moves or the faces change
+def get_mesh_hash(co, loop_verts, loop_totals):
+    return hash((co.tobytes(), loop_verts.tobytes(), loop_totals.tobytes()))
+
+
+# fan triangulation of every face (triangles, quads and n-gons) from its loops:
+# returns (ntris,3) array of vertex indices, and the face index of each triangle
+def get_fan_tris(loop_verts, loop_starts):
+    nloops = len(loop_verts)
+    loop_ends = np.empty_like(loop_starts)
+    loop_ends[:-1] = loop_starts[1:]
+    loop_ends[-1:] = nloops
+    face_of_loop = np.repeat(np.arange(len(loop_starts)), loop_ends - loop_starts)
+
+    # triangle (first, k, k+1) for every loop k that is neither the first nor the last of its face
+    is_inner = np.ones(nloops, dtype=bool)
+    is_inner[loop_starts] = False
+    is_inner[loop_ends - 1] = False
+    k = np.nonzero(is_inner)[0]
+    tri_faces = face_of_loop[k]
+    tris = np.column_stack((loop_verts[loop_starts[tri_faces]], loop_verts[k], loop_verts[k + 1]))
+    return (tris, tri_faces)
+
+
+# area of each triangle of tris, indices into the vertex coordinates co
+def calc_tri_areas(co, tris):
+    p0 = co[tris[:,0]].astype(np.float64)
+    cross = np.cross(co[tris[:,1]] - p0, co[tris[:,2]] - p0)
+    return (np.sqrt(np.einsum('ij,ij->i', cross, cross)) / 2)
+
+
+# area of every face of a mesh, any number of vertices:  the signed cross products of the
+# fan triangles of each face are summed before taking the norm, which is exact for concave faces too
+def calc_face_areas(co, loop_verts, loop_starts):
+    if len(loop_starts) == 0:
+        return (np.zeros(0))
+    nloops = len(loop_verts)
+    loop_ends = np.append(loop_starts[1:], nloops)
+    face_of_loop = np.repeat(np.arange(len(loop_starts)), loop_ends - loop_starts)
+    nxt = np.arange(1, nloops + 1)
+    nxt[loop_ends - 1] = loop_starts  # wrap to first loop of face
+
+    p0 = co[loop_verts[loop_starts]][face_of_loop].astype(np.float64)
+    cross = np.cross(co[loop_verts] - p0, co[loop_verts[nxt]] - p0)
+    face_cross = np.add.reduceat(cross, loop_starts, axis=0)
+    return (np.sqrt(np.einsum('ij,ij->i', face_cross, face_cross)) / 2)
+
+
+# surface area, signed volume, centroid and bounding box of a mesh, all triangles at once;
+# centroid is the centroid of the enclosed volume, or of the surface if the mesh encloses no volume.
+# If the face index of each triangle is given (as from get_fan_tris()), the surface area is the sum
+# of the face areas, so concave faces are not overcounted by their fan triangles.
+def calc_mesh_metrics(co, tris, tri_faces=None):
+    if len(tris) == 0:
+        # no faces (edge-only or vertex-only mesh):  no surface area or volume
+        centroid = co.mean(axis=0) if len(co) > 0 else None
+        bbox = (co.min(axis=0), co.max(axis=0)) if len(co) > 0 else None
+        return ([0.0, 0.0, centroid, bbox])
+    p0 = co[tris[:,0]].astype(np.float64)
+    p1 = co[tris[:,1]].astype(np.float64)
+    p2 = co[tris[:,2]].astype(np.float64)
+    tri_areas = calc_tri_areas(co, tris)
+    tri_vols = np.einsum('ij,ij->i', p0, np.cross(p1, p2)) / 6  # signed tetrahedra with the origin
+    if tri_faces is None:
+        SA = tri_areas.sum()
+    else:
+        # signed cross products of the fan triangles of each face (consecutive in tris), summed per face
+        face_starts = np.flatnonzero(np.r_[True, tri_faces[1:] != tri_faces[:-1]])
+        face_cross = np.add.reduceat(np.cross(p1 - p0, p2 - p0), face_starts, axis=0)
+        SA = np.sqrt(np.einsum('ij,ij->i', face_cross, face_cross)).sum() / 2
+    vol = tri_vols.sum()
+
+    if vol != 0:
+        centroid = (tri_vols.dot(p0 + p1 + p2) / 4) / vol
+    elif SA > 0:
+        centroid = (tri_areas.dot(p0 + p1 + p2) / 3) / SA
+    else:
+        centroid = co.mean(axis=0) if len(co) > 0 else None
+    bbox = (co.min(axis=0), co.max(axis=0)) if len(co) > 0 else None
+    return ([float(SA), float(vol), centroid, bbox])
+
+
+# time the per-triangle Python volume and area calculation against calc_mesh_metrics()
+# on a random triangle mesh with ntris triangles, eg. benchmark_mesh_metrics(1000000)
+def benchmark_mesh_metrics(ntris=1000000):
+    import time
+    co = np.random.rand(ntris + 2, 3).astype(np.float32)
+    tris = np.column_stack((np.arange(ntris), np.arange(ntris) + 1, np.arange(ntris) + 2))
+
+    t0 = time.time()
+    vol = 0
+    SA = 0
+    for tri in tris:
+        p0, p1, p2 = [mathutils.Vector(co[v]) for v in tri]
+        vol += dot_product(p0, cross_product(p1, p2)) / 6
+        SA += mathutils.geometry.area_tri(p0, p1, p2)
+    t1 = time.time()
+    SA2, vol2, centroid, bbox = calc_mesh_metrics(co, tris)
+    t2 = time.time()
+
+    print("per triangle:  SA = " + str(SA) + ", vol = " + str(vol) + ", " + str(t1-t0) + " s")
+    print("vectorized:    SA = " + str(SA2) + ", vol = " + str(vol2) + ", " + str(t2-t1) + " s")
+    print("speedup: " + str((t1-t0) / max(t2-t1, 1e-9)))
+    return ([t1-t0, t2-t1])
+
+
+# return [SA, vol] for the mesh of obj, recomputed only if the mesh has changed
+def get_cached_metrics(obj):
+    entry = get_cache_entry(metrics_cache, obj)
+    if entry is None:
+        co, loop_verts, loop_totals = get_mesh_arrays(obj.data)
+        mesh_hash = get_mesh_hash(co, loop_verts, loop_totals)
+        entry = get_cache_entry(metrics_cache, obj, mesh_hash)
+    if entry is not None:
+        return entry[2:]
+
+    loop_starts = np.cumsum(loop_totals) - loop_totals
+    tris, tri_faces = get_fan_tris(loop_verts, loop_starts)
+    SA, vol, centroid, bbox = calc_mesh_metrics(co, tris, tri_faces)
+    metrics_cache[obj.name] = [get_update_stamp(obj), mesh_hash, SA, vol]
+    return [SA, vol]
+
+
+# cache of the area of every face of each mesh object, for the selection readout:
+# {object name: [update stamp, mesh hash, face_areas]}
+face_area_cache = {}
+
+
+# return the area of every face of the mesh of obj, recomputed only if the mesh has changed
+def get_cached_face_areas(obj, co, loop_verts, loop_totals):
+    mesh_hash = get_mesh_hash(co, loop_verts, loop_totals)
+    entry = get_cache_entry(face_area_cache, obj, mesh_hash)
+    if entry is not None:
+        return (entry[2])
+
+    loop_starts = np.cumsum(loop_totals) - loop_totals
+    face_areas = calc_face_areas(co, loop_verts, loop_starts)
+    face_area_cache[obj.name] = [get_update_stamp(obj), mesh_hash, face_areas]
+    return (face_areas)
+
+
+# area of the selected faces of the active object in edit mode, and optionally the volume
+# enclosed by them after closing any holes, without creating any new objects;
+# use the Surface Area or Volume buttons to create an object from the selection
+class MeasureSelection(bpy.types.Operator):
+    """Surface area (and volume) of the selected faces, without creating a new object"""
+    bl_idname = "mesh.measure_selection"
+    bl_label = "Measure selected faces"
+
+    @classmethod
+    def poll(cls, context):
+        return (context.object is not None and context.object.type == 'MESH')
+
+    def execute(self, context):
+        obj = context.object
+        if obj.mode == 'EDIT':
+            obj.update_from_editmode()  # copy edit-mode selection and coordinates to the mesh
+        mesh = obj.data
+        scn = context.scene
+
+        co, loop_verts, loop_totals = get_mesh_arrays(mesh)
+        face_sel = np.zeros(len(loop_totals), dtype=bool)
+        mesh.polygons.foreach_get("select", face_sel)
+        face_areas = get_cached_face_areas(obj, co, loop_verts, loop_totals)
+        scn.sel_nfaces = int(face_sel.sum())
+        scn.sel_area = float(face_areas[face_sel].sum())
+
+        scn.sel_vol = -1
+        if scn.sel_calc_vol and scn.sel_nfaces > 0:
+            edges, loop_edges = get_edge_arrays(mesh)
+            loop_sel = np.repeat(face_sel, loop_totals)
+            co2, loop_verts2, loop_totals2 = close_mesh_arrays(co, loop_verts[loop_sel], loop_totals[face_sel],
+                                                               loop_edges[loop_sel], edges)
+            tris, tri_faces = get_fan_tris(loop_verts2, np.cumsum(loop_totals2) - loop_totals2)
+            scn.sel_vol = calc_mesh_metrics(co2, tris)[1]
+        return {'FINISHED'}
+
+
 # calculate surface area of mesh
 def fget_SA(self):
     obj = self.data
     if hasattr(obj, 'polygons'):
-        n_faces = len(obj.polygons)
-        SA = 0
-        for f in range(0, n_faces):
-            n_vertices = len(obj.polygons[f].vertices[:])
-            if n_vertices != 3:  # faces must be triangles
-                return 'highlight a subregion'
-            tri = [0] * n_vertices
-            for v in range(0, n_vertices):
-                tri[v] = obj.vertices[obj.polygons[f].vertices[v]].co
-            SA += get_area_tri(tri)
+        SA, vol = get_cached_metrics(self)
         return SA
     else:
         return 'property not available'
@@ -600,20 +885,7 @@ def fget_vol(self):
             # with volume button in this tool
             return 'volume not calculated'
 
-        n_faces = len(obj.polygons)
-        vol = 0
-        for f in range(0, n_faces):
-            this_face = obj.polygons[f]
-            n_vertices = len(this_face.vertices[:])
-            if n_vertices != 3:
-                for v in range(0, n_vertices):
-                    # return 'highlight a subregion'
-                    return 'faces must be triangles'
-            tri = [0] * n_vertices
-            for v in range(0, n_vertices):
-                tri[v] = obj.vertices[obj.polygons[f].vertices[v]].co
-            vol += get_vol_tri(tri)
-
+        SA, vol = get_cached_metrics(self)
         return vol
     else:
         return 'property not available'
@@ -680,69 +952,54 @@ def fset_nverts(self, value):
 def fset_curvelength(self, value):
     self.curvelength = -1
 
-# return n lists of lists of connected boundary edges
-def get_connected_components(edges):  # bpy.context.active_object.data.edges
-    nedges = len(edges) 
-    c_edges = [[edges[0]]]                                    # connected edges:  [ [ea,eb], [ed], ...]
-    c_verts = [[edges[0].vertices[0], edges[0].vertices[1]]]  # connected vertices:  [ [va,vb,vc], [vd,ve], ...]
-    n_comps = 1
-    for e in range(1, nedges):
-        this_edge = edges[e]
-        v0 = this_edge.vertices[0]
-        v1 = this_edge.vertices[1]
-        v0_loc = -1
-        v1_loc = -1
-        for n in range(0,n_comps):
-            if v0 in c_verts[n]:
-                v0_loc = n
-            if v1 in c_verts[n]:
-                v1_loc = n
-        if v0_loc >= 0:
-            if v1_loc >= 0:  # append list v1_loc to list v0_loc
-                c_edges[v0_loc].append(this_edge)
-                if v0_loc != v1_loc:
-                    for elt in c_verts[v1_loc]:
-                        c_verts[v0_loc].append(elt)
-                    c_verts.remove(c_verts[v1_loc])
-                    for elt in c_edges[v1_loc]:
-                        c_edges[v0_loc].append(elt)
-                    c_edges.remove(c_edges[v1_loc])
-                    n_comps = n_comps - 1
-                
-            else:  # add to v0_loc
-                c_verts[v0_loc].append(v1)
-                c_edges[v0_loc].append(this_edge)
-                
-        elif v1_loc >= 0:  # add to v1_loc
-            c_verts[v1_loc].append(v0)
-            c_edges[v1_loc].append(this_edge)
-
-        else:  # make new list elt
-            c_verts.append([v0,v1])
-            c_edges.append([this_edge])
-            n_comps = n_comps + 1
-            
-    return c_edges
-
-
-# remove edges from bdry_edges list that are part of >1 face:
-# after region_to_loop(), if both verts of an edge are contained in the bdry,
-# then the edge is contained, even if the edge is actually interior
-def remove_false_bdry_edges(bdry_edges):
-    extra = []
-    for edge in bdry_edges:
-        v0 = edge.vertices[0]
-        v1 = edge.vertices[1]
-        face_count = 0
-        for face in bpy.context.active_object.data.polygons:
-            f_verts = face.vertices[:]
-            if v0 in f_verts and v1 in f_verts:
-                face_count += 1
-        if face_count > 1:
-            extra.append(edge)
-    for edge in extra:
-        bdry_edges.remove(edge)
-    return bdry_edges
+# return a label for each of n vertices, equal for vertices connected through the edges (a, b);
+# union-find by vectorized hooking of roots and pointer jumping, labels are 0..(ncomponents-1)
+def label_connected_components(n, a, b):
+    labels = np.arange(n)
+    while True:
+        la = labels[a]
+        lb = labels[b]
+        differ = la != lb
+        if not differ.any():
+            break
+        # hook the larger root onto the smaller one, then compress paths
+        np.minimum.at(labels, np.maximum(la, lb)[differ], np.minimum(la, lb)[differ])
+        while True:
+            nxt = labels[labels]
+            if np.array_equal(nxt, labels):
+                break
+            labels = nxt
+    return (np.unique(labels, return_inverse=True)[1])
+
+
+# read the edges and the edge of each face loop of a mesh into numpy arrays
+def get_edge_arrays(mesh):
+    nedges = len(mesh.edges)
+    edges = np.empty(nedges * 2, dtype=np.int32)
+    mesh.edges.foreach_get("vertices", edges)
+    loop_edges = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("edge_index", loop_edges)
+    return (edges.reshape((nedges, 2)), loop_edges)
+
+
+# indices of the boundary edges of a mesh, the edges that are part of exactly one face,
+# from the number of face loops using each edge
+def get_boundary_edge_inds(loop_edges, nedges):
+    face_count = np.bincount(loop_edges, minlength=nedges)
+    return (np.nonzero(face_count == 1)[0])
+
+
+# group the boundary edges of a mesh with nverts vertices into connected boundaries (one for each hole):
+# returns a list of edge index arrays, ordered by their lowest edge index
+def get_boundary_comps(edges, nverts, bdry_inds):
+    bdry_verts = edges[bdry_inds]
+    labels = label_connected_components(nverts, bdry_verts[:,0], bdry_verts[:,1])
+    edge_labels = labels[bdry_verts[:,0]]
+    order = np.argsort(edge_labels, kind='stable')
+    splits = np.nonzero(np.diff(edge_labels[order]))[0] + 1
+    comps = np.split(bdry_inds[order], splits)
+    comps.sort(key=lambda comp: comp[0])
+    return (comps)
 
 
 # called by Create_Submesh and Create_Closed_Submesh
@@ -750,20 +1007,26 @@ def create_submesh_code():
         bpy.ops.object.mode_set(mode='OBJECT')
         obj_ptr = bpy.context.active_object
         if obj_ptr.type=="MESH":
-          bpy.ops.object.mode_set(mode='EDIT')
-        
           obj_data = obj_ptr.data
-          verts = [list(v.co) for v in obj_data.vertices]
-          faces = [f.vertices[:] for f in obj_data.polygons]
-
-          # extracted selected vertices and their faces
-          sel_inds = [vert.index for vert in bpy.context.active_object.data.vertices if vert.select]
-          selected_verts = [verts[v] for v in sel_inds]
-          selected_faces = []  # require all vertices on a face to be in selected_verts
-          for f in faces:
-              if all(f[n] in sel_inds for n in range(len(f))):
-                  face_new_inds = [sel_inds.index(f[n]) for n in range(len(f))]
-                  selected_faces.append(face_new_inds)
+          co, loop_verts, loop_totals = get_mesh_arrays(obj_data)
+          nverts = len(co)
+          sel = np.zeros(nverts, dtype=bool)
+          obj_data.vertices.foreach_get("select", sel)
+
+          # extracted selected vertices and their faces, with an old->new vertex index lookup
+          sel_inds = np.nonzero(sel)[0]
+          new_inds = np.full(nverts, -1, dtype=np.int32)
+          new_inds[sel_inds] = np.arange(len(sel_inds))
+
+          # require all vertices on a face to be selected
+          loop_starts = np.cumsum(loop_totals) - loop_totals
+          if len(loop_totals) > 0:
+              face_sel = np.logical_and.reduceat(sel[loop_verts], loop_starts)
+          else:
+              face_sel = np.zeros(0, dtype=bool)
+          sub_loop_verts = new_inds[loop_verts[np.repeat(face_sel, loop_totals)]]
+          sub_loop_totals = loop_totals[face_sel]
+          sub_co = co[sel_inds]
 
           # create a new mesh object and link it to the scene               
           new_name = bpy.context.object.string_name
@@ -775,26 +1038,36 @@ def create_submesh_code():
         
           new_obj.rotation_euler = obj_ptr.rotation_euler
           bpy.context.scene.objects.link(new_obj)
-          mesh.from_pydata(selected_verts, [], selected_faces)
-          mesh.update(calc_edges=True)
+          mesh_from_arrays(mesh, sub_co, sub_loop_verts, sub_loop_totals)
 
-          # convert to triangles, if not already  (necessary for calculations)
           bpy.ops.object.mode_set(mode='OBJECT')
           bpy.context.scene.objects.active = new_obj
-          bpy.ops.object.mode_set(mode='EDIT')
-          bpy.ops.mesh.quads_convert_to_tris()
-          bpy.ops.object.mode_set(mode='OBJECT')
 
-          return (new_obj, new_name, obj_ptr, sel_inds, selected_verts, selected_faces)
+          return (new_obj, new_name, obj_ptr, sel_inds)
         else:
           return 0
 
+# fill the empty mesh with vertex coordinates co and faces given by their loops, in one go
+def mesh_from_arrays(mesh, co, loop_verts, loop_totals):
+    mesh.vertices.add(len(co))
+    mesh.vertices.foreach_set("co", np.ascontiguousarray(co, dtype=np.float32).ravel())
+    mesh.loops.add(len(loop_verts))
+    mesh.loops.foreach_set("vertex_index", np.ascontiguousarray(loop_verts, dtype=np.int32))
+    mesh.polygons.add(len(loop_totals))
+    mesh.polygons.foreach_set("loop_start", (np.cumsum(loop_totals) - loop_totals).astype(np.int32))
+    mesh.polygons.foreach_set("loop_total", np.ascontiguousarray(loop_totals, dtype=np.int32))
+    mesh.update(calc_edges=True)
+
+
 # called by Create_Submesh and Create_Open_Submesh
 def make_original_active(obj_ptr, sel_inds):
     bpy.ops.object.mode_set(mode='OBJECT')   # must be in object mode to update active vertices
     bpy.context.scene.objects.active = obj_ptr
-    for ind in sel_inds:
-        bpy.context.active_object.data.vertices[ind].select = True
+    vertices = bpy.context.active_object.data.vertices
+    sel = np.zeros(len(vertices), dtype=bool)
+    vertices.foreach_get("select", sel)
+    sel[np.asarray(sel_inds, dtype=np.int64)] = True
+    vertices.foreach_set("select", sel)
     bpy.ops.object.mode_set(mode='EDIT') 
     return
 
@@ -812,7 +1085,7 @@ class Create_Submesh(bpy.types.Operator):
         # construct open submesh
         #if create_submesh_code()!=0:
             
-        (new_obj, new_name, obj_ptr, sel_inds, selected_verts, selected_faces) = create_submesh_code()
+        (new_obj, new_name, obj_ptr, sel_inds) = create_submesh_code()
         if new_obj is not None:
         # make the new object a child of the original mesh
         # this changes the location of the object, so use the ChildOf relation (for bones, not parent)
@@ -839,7 +1112,7 @@ class Create_Submesh(bpy.types.Operator):
 
         # return with all vertices highlighted in edit mode
         # return input object as active
-          sel_inds2 = [ind for ind in range(len(new_obj.data.vertices[:]))]
+          sel_inds2 = np.arange(len(new_obj.data.vertices))
           make_original_active(new_obj, sel_inds2)
         
           make_original_active(obj_ptr, sel_inds)
@@ -865,18 +1138,72 @@ class Create_Closed_Submesh(bpy.types.Operator):
     def execute(self, context):
 
         # construct open submesh for use in calculations
-        (new_obj, new_name, obj_ptr, sel_inds, selected_verts, selected_faces) = create_submesh_code()
+        (new_obj, new_name, obj_ptr, sel_inds) = create_submesh_code()
         if new_obj is not None:
             # create a new closed mesh object and link it to the scene
-            close_and_add_mesh(new_obj, new_name, obj_ptr, sel_inds, selected_verts, selected_faces)
+            close_and_add_mesh(new_obj, new_name, obj_ptr, sel_inds)
 
         return{'FINISHED'}
 
 
+# fan-fill each hole of the open mesh from the mean of its boundary vertices;
+# each cap face runs along its boundary edge in the opposite direction to the face on the other side
+# of the edge (found with an edge->loop map), so the caps are wound consistently with the mesh
+def add_boundary_caps(co, loop_verts, loop_totals, loop_edges, edges, bdry_inds):
+    nloops = len(loop_verts)
+    edge_loop = np.full(len(edges), -1, dtype=np.int64)
+    edge_loop[loop_edges] = np.arange(nloops)  # unique for boundary edges
+
+    # next loop of each loop within its face
+    loop_starts = np.cumsum(loop_totals) - loop_totals
+    nxt = np.arange(1, nloops + 1)
+    nxt[loop_starts + loop_totals - 1] = loop_starts
+
+    # one new center vertex for each connected boundary
+    bdry_comps = get_boundary_comps(edges, len(co), bdry_inds)
+    comp_edges = np.concatenate(bdry_comps)
+    comp_of_edge = np.repeat(np.arange(len(bdry_comps)), [len(comp) for comp in bdry_comps])
+    k = edge_loop[comp_edges]
+    v0 = loop_verts[k]
+    v1 = loop_verts[nxt[k]]
+    centers = np.zeros((len(bdry_comps), 3))
+    np.add.at(centers, comp_of_edge, co[v0] + co[v1])
+    centers /= 2 * np.bincount(comp_of_edge)[:,None]  # each vertex counted twice
+    center_inds = len(co) + comp_of_edge
+
+    caps = np.column_stack((v1, v0, center_inds))
+    co = np.concatenate((co, centers.astype(co.dtype)))
+    loop_verts = np.concatenate((loop_verts, caps.ravel()))
+    loop_totals = np.concatenate((loop_totals, np.full(len(caps), 3, dtype=loop_totals.dtype)))
+    return (co, loop_verts, loop_totals)
+
+
+# close any holes of a mesh given as arrays, with outward normals, without using bpy:
+# all faces are consistently wound, so only the sign of the volume is needed to orient them
+def close_mesh_arrays(co, loop_verts, loop_totals, loop_edges, edges):
+    bdry_inds = get_boundary_edge_inds(loop_edges, len(edges))
+    if len(bdry_inds) > 0:
+        co, loop_verts, loop_totals = add_boundary_caps(co, loop_verts, loop_totals, loop_edges, edges, bdry_inds)
+
+    loop_starts = np.cumsum(loop_totals) - loop_totals
+    tris, tri_faces = get_fan_tris(loop_verts, loop_starts)
+    SA, vol, centroid, bbox = calc_mesh_metrics(co, tris)
+    if vol < 0:
+        loop_verts = reverse_faces(loop_verts, loop_totals)
+    return (co, loop_verts, loop_totals)
+
+
+# reverse the winding (and so the normal) of every face, keeping the first vertex of each face
+def reverse_faces(loop_verts, loop_totals):
+    loop_starts = np.cumsum(loop_totals) - loop_totals
+    face_of_loop = np.repeat(np.arange(len(loop_totals)), loop_totals)
+    pos = np.arange(len(loop_verts)) - loop_starts[face_of_loop]
+    new_pos = (loop_totals[face_of_loop] - pos) % loop_totals[face_of_loop]
+    return (loop_verts[loop_starts[face_of_loop] + new_pos])
+
+
 # this is a separate function so that it can also be called by Create_Whole_Surfaces()
-def close_and_add_mesh(new_obj, new_name, obj_ptr, sel_inds, selected_verts, selected_faces):
-      selected_verts2 = list(selected_verts)
-      selected_faces2 = list(selected_faces)
+def close_and_add_mesh(new_obj, new_name, obj_ptr, sel_inds):
       new_name2 = new_name + "_vol"
       mesh2 = bpy.data.meshes.new(new_name2)
       new_obj2 = bpy.data.objects.new(new_name2, mesh2)
@@ -884,107 +1211,17 @@ def close_and_add_mesh(new_obj, new_name, obj_ptr, sel_inds, selected_verts, sel
       new_obj2.scale = obj_ptr.scale
       new_obj2.rotation_euler = obj_ptr.rotation_euler
 
-    # volume calculation needs a closed mesh; edit object to close open end if it exists
+    # volume calculation needs a closed mesh; close each open end if it exists
     # by adding a point in the middle of an opening and adding faces connecting to that point
-      bpy.ops.object.mode_set(mode='EDIT')
-      bpy.ops.mesh.region_to_loop()
       bpy.ops.object.mode_set(mode='OBJECT')
-      bdry_edges = [edge for edge in bpy.context.active_object.data.edges if edge.select]
-      bdry_edges = remove_false_bdry_edges(bdry_edges)
-      n_bdry_edges = len(bdry_edges)
-      if n_bdry_edges > 0:
-        bdry_edge_comps = get_connected_components(bdry_edges)
-        ncomps = len(bdry_edge_comps)
-        for c in range(0,ncomps):    # fill in each connected bdry separately
-            es = bdry_edge_comps[c]  # list of edges
-            nes = len(es)
-            bdry_sum = [0,0,0]
-            for n in range(0,nes):
-                v0_ind = es[n].vertices[0]
-                v1_ind = es[n].vertices[1]
-                v0 = bpy.context.active_object.data.vertices[v0_ind].co
-                v1 = bpy.context.active_object.data.vertices[v1_ind].co
-                bdry_sum = [sum(pair) for pair in zip(bdry_sum, v0)]
-                bdry_sum = [sum(pair) for pair in zip(bdry_sum, v1)]
-            bdry_mean = [elt / (2*nes) for elt in bdry_sum]  # counted each vertex twice, so /2
-            selected_verts2.append(mathutils.Vector(bdry_mean))
-            last_ind = len(selected_verts2) - 1
-
-            for f in range(0,nes):
-                face_new_inds = [es[f].vertices[0], es[f].vertices[1], last_ind]   # will fix inconsistent normals below
-                selected_faces2.append(face_new_inds)
+      co, loop_verts, loop_totals = get_mesh_arrays(new_obj.data)
+      edges, loop_edges = get_edge_arrays(new_obj.data)
+      co, loop_verts, loop_totals = close_mesh_arrays(co, loop_verts, loop_totals, loop_edges, edges)
 
       bpy.context.scene.objects.link(new_obj2)
-      mesh2.from_pydata(selected_verts2, [], selected_faces2)
-      mesh2.update(calc_edges=True)
+      mesh_from_arrays(mesh2, co, loop_verts, loop_totals)
     #new_obj2.location = obj_ptr.location
 
-    # make new solid object the active object, and convert to triangles
-      bpy.ops.object.mode_set(mode='OBJECT')
-      bpy.context.scene.objects.active = new_obj2
-      bpy.ops.object.mode_set(mode='EDIT')
-      bpy.ops.mesh.quads_convert_to_tris()
-      bpy.ops.object.mode_set(mode='OBJECT')
-      bpy.ops.object.mode_set(mode='EDIT')
-
-    # flip any normals that were assigned incorrectly:
-    # search through all faces that contain vertex last_ind
-    # if a normal is not consistent with the normal of the other face
-    # containing the edge that was previously a boundary, flip it
-      if n_bdry_edges > 0:
-        n_orig = len(selected_faces)
-        ind = n_orig
-        bpy.ops.mesh.select_all(action='DESELECT')  # unselect everything in the scene
-        sf2 = selected_faces2
-
-        for c in range(ncomps):
-            len_here = len(bdry_edge_comps[c])
-            v_center = selected_verts2[c-ncomps]
-
-            for f_ind in range(ind, ind+len_here):  # loop over new faces
-                f = new_obj2.data.polygons[f_ind]
-                v0_ind = bdry_edge_comps[c][f_ind-ind].vertices[0]
-                v1_ind = bdry_edge_comps[c][f_ind-ind].vertices[1]
-                v0 = new_obj2.data.vertices[v0_ind].co
-                v1 = new_obj2.data.vertices[v1_ind].co
-
-                # find neighboring face in original mesh
-                f1_ind = [i for i in range(0,n_orig) if v0_ind in sf2[i] and v1_ind in sf2[i]]
-                f1 = new_obj2.data.polygons[f1_ind[0]]
-                verts_f1 = sf2[f1_ind[0]]
-                v_out_ind = set(verts_f1) - set([v0_ind, v1_ind])
-                v_out = new_obj2.data.vertices[list(v_out_ind)[0]].co
-
-                # calculate the relative directions of the face normals
-                edg = [coord[0]-coord[1] for coord in zip(v1, v0)]            # the shared edge
-                seg0 = [coord[0]-coord[1] for coord in zip(v_center, v0)]     # shared pt to v_center
-                seg1 = [coord[0]-coord[1] for coord in zip(v_out, v0)]        # shared pt to v_out
-                n0 = f.normal
-                n1 = f1.normal
-                c0 = cross_product(seg0, edg)
-                c1 = cross_product(edg, seg1)
-
-                d0 = dot_product(n0, c0)
-                d1 = dot_product(n1, c1)
-                d = d0*d1
-
-                if d < 0:  # this condition is correct
-                    bpy.ops.object.mode_set(mode='OBJECT') # must be in object mode to update active vertices
-                    f = new_obj2.data.polygons[f_ind]
-                    for vert in f.vertices:
-                        new_obj2.data.vertices[vert].select = True
-                    bpy.ops.object.mode_set(mode='EDIT')
-                    f = new_obj2.data.polygons[f_ind]
-                    bpy.ops.mesh.flip_normals()
-                    bpy.ops.object.mode_set(mode='OBJECT')  # necessary for the flip to take affect
-                    bpy.ops.object.mode_set(mode='EDIT')
-                    bpy.ops.mesh.select_all(action='DESELECT')
-
-            ind = ind+len_here  # update for next bdry_edge_comp
-            bpy.ops.object.mode_set(mode='OBJECT')
-            bpy.ops.object.mode_set(mode='EDIT')
-
-
     # make the new object a child of the original mesh
       bpy.ops.object.mode_set(mode='OBJECT')
       new_obj2.parent = obj_ptr
@@ -999,12 +1236,9 @@ def close_and_add_mesh(new_obj, new_name, obj_ptr, sel_inds, selected_verts, sel
       new_obj2.is_open = 0
       new_obj2.has_vol = 1
 
-    # enforce consistent normals
-      sel_inds2 = [ind for ind in range(len(new_obj2.data.vertices[:]))]
+    # select all vertices of the new object
+      sel_inds2 = np.arange(len(new_obj2.data.vertices))
       make_original_active(new_obj2, sel_inds2)
-      bpy.ops.object.mode_set(mode='EDIT')
-      bpy.ops.mesh.select_all(action='SELECT')
-      bpy.ops.mesh.normals_make_consistent(inside=False)   
       bpy.ops.object.mode_set(mode='OBJECT')
 
     # return input object as active
@@ -1034,41 +1268,121 @@ class Create_Whole_Surfaces(bpy.types.Operator):
     bl_idname = "mesh.create_whole_surfaces"
     bl_label = "create whole surfaces of selected objs (measure volumes and areas)"
     bl_options = {"REGISTER", "UNDO"}
-    
-    def execute(self, context):
-        if bpy.context.object.mode == 'EDIT':  # if in edit mode, do nothing
-           self.report({'INFO'},"Select multiple objects")
-        else:
 
-            if len(bpy.context.selected_objects)!=0:
+    _timer = None
+    _pool = None
+    _jobs = []
+    _futures = []
+
+    # mesh arrays of the selected top-level objects that have no "_vol" child yet, read on the main thread;
+    # objects are identified by as_pointer(), which survives renaming during the modal run
+    def get_jobs(self, context):
+        jobs = []
+        objlist = [item for item in context.selected_objects if item.parent==None and item.type=="MESH"]
+        for obj in objlist:
+            new_name = obj.string_name
+            if any(child.name == obj.name+"_vol" for child in obj.children):
+                continue  # skip this object, operation already performed (won't catch _vol.001, etc)
+            co, loop_verts, loop_totals = get_mesh_arrays(obj.data)
+            edges, loop_edges = get_edge_arrays(obj.data)
+            jobs.append([obj.as_pointer(), new_name, [co, loop_verts, loop_totals, loop_edges, edges]])
+        return (jobs)
 
-              objlist = [item for item in bpy.context.selected_objects if item.parent==None and item.type=="MESH"]
-              for obj in objlist:
-
-                if bpy.ops.object.mode_set.poll():
-                   bpy.ops.object.mode_set(mode='OBJECT')
+    def execute(self, context):
+        if context.object is not None and context.object.mode == 'EDIT':  # if in edit mode, do nothing
+            self.report({'INFO'},"Select multiple objects")
+            return{'CANCELLED'}
+        jobs = self.get_jobs(context)
+        results = [close_mesh_arrays(*arrays) for ob_ptr, new_name, arrays in jobs]
+        add_vol_objects(jobs, results)
+        return{'FINISHED'}
 
-                bpy.context.scene.objects.active = obj
-                mt = bpy.context.active_object
-                children=mt.children
-                flag=0
-                for child in children:
-                   if child.name == mt.name+"_vol":
-                     flag=1  # skip this object, operation already performed (won't catch _vol.001, etc)
+    # closing the meshes runs in a pool of worker threads, while the modal timer reports progress;
+    # the new objects are only created once all are done, Esc cancels without changing the scene
+    def invoke(self, context, event):
+        if context.object is not None and context.object.mode == 'EDIT':
+            self.report({'INFO'},"Select multiple objects")
+            return{'CANCELLED'}
+        self._jobs = self.get_jobs(context)
+        if len(self._jobs) == 0:
+            return{'FINISHED'}
+
+        self._pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+        self._futures = [self._pool.submit(close_mesh_arrays, *arrays) for ob_ptr, new_name, arrays in self._jobs]
+        wm = context.window_manager
+        wm.progress_begin(0, len(self._jobs))
+        self._timer = wm.event_timer_add(0.1, context.window)
+        wm.modal_handler_add(self)
+        return{'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            for future in self._futures:
+                future.cancel()
+            self.finish(context)
+            self.report({'INFO'}, "Measurement cancelled")
+            return{'CANCELLED'}
+
+        if event.type == 'TIMER':
+            ndone = sum([future.done() for future in self._futures])
+            context.window_manager.progress_update(ndone)
+            if context.area is not None:
+                context.area.header_text_set("Measuring objects: " + str(ndone) + " / " + \
+                                             str(len(self._futures)) + "  (Esc to cancel)")
+            if ndone == len(self._futures):
+                self.finish(context)
+                results = []
+                errors = []
+                for [ob_ptr, new_name, arrays], future in zip(self._jobs, self._futures):
+                    try:
+                        results.append(future.result())
+                    except Exception as err:
+                        results.append(None)
+                        errors.append(new_name + ": " + str(err))
+                nadded = add_vol_objects(self._jobs, results)
+                if len(errors) > 0:
+                    self.report({'WARNING'}, "Could not measure " + str(len(errors)) + " objects: " + "; ".join(errors))
+                self.report({'INFO'}, "Measured " + str(nadded) + " objects")
+                return{'FINISHED'}
 
-                if flag==0:
-                  if bpy.ops.object.mode_set.poll():
-                     bpy.ops.object.mode_set(mode='EDIT')
+        return{'PASS_THROUGH'}
 
-                  bpy.ops.mesh.select_all(action='SELECT')
+    def finish(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        context.window_manager.progress_end()
+        if context.area is not None:
+            context.area.header_text_set()
+        self._pool.shutdown(wait=False)
 
-                  (new_obj, new_name, obj_ptr, sel_inds, selected_verts, selected_faces) = create_submesh_code()
-                  close_and_add_mesh(new_obj, new_name, obj_ptr, sel_inds, selected_verts, selected_faces)
 
-                  bpy.ops.object.mode_set(mode='OBJECT')
-                  bpy.ops.object.select_all(action='DESELECT')
-          
-        return{'FINISHED'}
+# create the closed "_vol" child of each measured object in one pass, and return how many were created;
+# jobs as from Create_Whole_Surfaces.get_jobs(), results as from close_mesh_arrays(), or None if that failed.
+# Objects deleted since get_jobs() are skipped.
+def add_vol_objects(jobs, results):
+    if bpy.ops.object.mode_set.poll():
+        bpy.ops.object.mode_set(mode='OBJECT')
+    objs_by_ptr = {obj.as_pointer(): obj for obj in bpy.data.objects}
+    nadded = 0
+    for [ob_ptr, new_name, arrays], result in zip(jobs, results):
+        obj_ptr = objs_by_ptr.get(ob_ptr)
+        if obj_ptr is None or result is None:
+            continue
+        co, loop_verts, loop_totals = result
+        new_name2 = new_name + "_vol"
+        mesh2 = bpy.data.meshes.new(new_name2)
+        mesh_from_arrays(mesh2, co, loop_verts, loop_totals)
+        new_obj2 = bpy.data.objects.new(new_name2, mesh2)
+        new_obj2.location = obj_ptr.location
+        new_obj2.scale = obj_ptr.scale
+        new_obj2.rotation_euler = obj_ptr.rotation_euler
+        bpy.context.scene.objects.link(new_obj2)
+        new_obj2.parent = obj_ptr
+        new_obj2.is_open = 0
+        new_obj2.has_vol = 1
+        new_obj2.hide = True
+        nadded += 1
+    bpy.ops.object.select_all(action='DESELECT')
+    return (nadded)
 
 
 # adjust the scale of every object in the scene
@@ -1081,67 +1395,46 @@ class Adjust_scene_scale(bpy.types.Operator):
     def execute(self, context):
         if bpy.ops.object.mode_set.poll():
             bpy.ops.object.mode_set(mode='OBJECT')
-        active_in = bpy.context.scene.objects.active
-        bpy.ops.object.select_all(action='DESELECT')
         scl = bpy.context.scene.float_scale
-        scale_vec = [scl, scl, scl]
 
-        # temporarily undo parenting and make all objects visible,
-        # necessary for some commands to function consistently
-        parent_list = []
-        visibility_list = []
-        for this_obj in bpy.data.objects:
-            visibility_list.append(this_obj.hide)
-            if this_obj.hide:
-                this_obj.hide = False
-            
-            parent_list.append(this_obj.parent)
-            if this_obj.parent is not None:
-                bpy.context.scene.objects.active = this_obj
-                this_obj.select = True
-                this_obj.parent = None
-                bpy.ops.object.constraints_clear()
-                bpy.ops.object.select_all(action='DESELECT')
-            
-        # loop through all objects in scene, rescale each
+        # loop through all objects in scene, rescale the coordinates of each in its own reference frame;
+        # parenting and visibility are left untouched
+        # (this rescales in reference to the object's origin, not its geometric center)
+        scaled_data = set()
         for this_obj in bpy.data.objects:
             if hasattr(this_obj.data, 'vertices') or hasattr(this_obj.data, 'splines'):
-                bpy.context.scene.objects.active = this_obj
-                this_obj.select = True
-
-                # the following rescales in reference to object's own geometric center,
-                # so is inconsistent with parenting structure:
-                # don't use if geometry should be kept alligned
-                #bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY')
+                # first scale according to the values currently in the object Transform, as transform_apply;
+                # might not want this, in which case use np.array([scl, scl, scl])
+                scale_vec = np.array(this_obj.scale) * scl
+                if this_obj.data.name not in scaled_data:  # data shared by several objects is scaled once
+                    scale_obj_coords(this_obj.data, scale_vec)
+                    scaled_data.add(this_obj.data.name)
+                this_obj.scale = [1, 1, 1]
 
-                # first scale according to the values currently in the object Transform; 
-                # might not want this, in which case just comment out the following line
-                bpy.ops.object.transform_apply(scale=True, location=False)
-
-                # scale according to the input scale value
-                this_obj.scale = scale_vec
-                bpy.ops.object.transform_apply(scale=True, location=False)
+        return{'FINISHED'}
 
-                bpy.ops.object.select_all(action='DESELECT')
 
-        # add back parenting structure and original visibility
-        ind = 0
-        for this_obj in bpy.data.objects:
-            this_parent = parent_list[ind]
-            if this_parent is not None:
-                bpy.context.scene.objects.active = this_obj
-                this_obj.select = True
-                this_obj.parent = this_parent
-                bpy.ops.object.mode_set(mode='EDIT')
-                bpy.ops.object.mode_set(mode='OBJECT')
-                bpy.ops.object.select_all(action='DESELECT')
+# multiply all vertex or spline point coordinates of mesh or curve data by scale_vec = [sx, sy, sz]
+def scale_obj_coords(data, scale_vec):
+    if hasattr(data, 'vertices'):
+        scale_coord_array(data.vertices, "co", 3, scale_vec)
+        data.update()
+    else:
+        for spline in data.splines:
+            if spline.type == 'BEZIER':
+                for attr in ["co", "handle_left", "handle_right"]:
+                    scale_coord_array(spline.bezier_points, attr, 3, scale_vec)
+            else:
+                scale_coord_array(spline.points, "co", 4, scale_vec)  # [x, y, z, w]
 
-            this_obj.hide = visibility_list[ind]
-            ind += 1            
 
-        bpy.context.scene.objects.active = active_in
-        active_in.select = True
-        return{'FINISHED'}
+# scale the first 3 components of the coordinate attribute attr of all elements of a collection
+def scale_coord_array(collection, attr, ncomps, scale_vec):
+    co = np.empty(len(collection) * ncomps, dtype=np.float32)
+    collection.foreach_get(attr, co)
+    co = co.reshape((-1, ncomps))
+    co[:,0:3] *= scale_vec
+    collection.foreach_set(attr, co.ravel())
 
 
 
@@ -1171,7 +1464,8 @@ class Remesh_Object(bpy.types.Operator):
 
 
 # output data for each object in the scene (for each object that has a mesh or splines)
-# entries are separated by commas, can be imported into Microsoft Excel
+# entries are separated by commas, can be imported into Microsoft Excel,
+# or stored as numpy arrays in a .npz file if the export format is set to NPZ
 
 class WriteData(bpy.types.Operator):
     """Write external file containing all measurements in the scene"""
@@ -1182,17 +1476,8 @@ class WriteData(bpy.types.Operator):
     filename = bpy.props.StringProperty(subtype="FILE_NAME")
 
     def execute(self, context):
-        directory = self.directory
-        filename = self.filename
-        fname = filename + '.csv'
-        the_name=os.path.join(directory,fname)
-        f = open(the_name, 'w')
-        f.write('Object Name,Parent,Surface Area,Volume,Number of Vertices,Length\n\n')
-
-        for obj in bpy.data.objects:
-            write_obj_info(obj, f)
-        f.close()
-
+        the_name = get_export_filename(self.directory, self.filename)
+        write_measurements(bpy.data.objects, the_name)
         return {'FINISHED'}
 
     def invoke(self, context, event):
@@ -1216,17 +1501,10 @@ class Write_Selected_Data(bpy.types.Operator):
         for obj in bpy.data.objects:
             if obj.select:
                 add_obj_and_children_to_set(obj, to_write)
+        to_write = [obj for obj in bpy.data.objects if obj in to_write]  # keep scene order
 
-        directory = self.directory
-        filename = self.filename
-        fname = filename + '.csv'
-        the_name=os.path.join(directory,fname)
-        f = open(the_name, 'w')
-        f.write('Object Name,Parent,Surface Area,Volume,Number of Vertices,Length\n\n')
-
-        for obj in to_write:
-            write_obj_info(obj, f)
-        f.close()
+        the_name = get_export_filename(self.directory, self.filename)
+        write_measurements(to_write, the_name)
         return{'FINISHED'}
 
     def invoke(self, context, event):
@@ -1242,28 +1520,62 @@ def add_obj_and_children_to_set(obj, to_write):  # recursive
             add_obj_and_children_to_set(child, to_write)
 
 
+# full path of the export file, with the extension of the chosen export format
+def get_export_filename(directory, filename):
+    if bpy.context.scene.export_format == 'NPZ':
+        fname = filename + '.npz'
+    else:
+        fname = filename + '.csv'
+    return (os.path.join(directory, fname))
+
+
+# bring metrics_cache up to date for all mesh objects in obs:
+# only the meshes whose cached values are out of date are read and measured, with the same
+# double precision kernel as the panel
+def update_metrics_cache(obs):
+    prune_metrics_caches()
+    for obj in obs:
+        get_cached_metrics(obj)
+
+
+# return the measurement table of the mesh objects in obs as columns:
+# names, parents, SA, vol, nverts, length, with nan where a value is not available
+def get_measurement_columns(obs):
+    obs = [obj for obj in obs if hasattr(obj.data, 'vertices')]  # mesh objects
+    update_metrics_cache(obs)
+
+    names = [obj.name for obj in obs]
+    parents = ['none ' if obj.parent is None else obj.parent.name for obj in obs]
+    SAs = np.array([metrics_cache[obj.name][2] for obj in obs], dtype=np.float64)
+    has_vol = np.array([obj.has_vol and not obj.is_open for obj in obs], dtype=bool)
+    vols = np.array([metrics_cache[obj.name][3] for obj in obs], dtype=np.float64)
+    vols[~has_vol] = np.nan  # see fget_vol
+    nverts = np.array([len(obj.data.vertices) for obj in obs], dtype=np.int64)
+    lengths = np.array([obj.length for obj in obs], dtype=np.float64)
+    lengths[lengths < 0] = np.nan  # see fget_curvelength
+    return ([names, parents, SAs, vols, nverts, lengths])
+
+
 # called by Write_Data and Write_Selected_Data
-def write_obj_info(obj, f):
-    if hasattr(obj.data, 'vertices'):  # mesh objects
-        f.write(obj.name + ',')
-        if obj.parent is None:
-            f.write('none ,')
-        else:
-            f.write(str(obj.parent.name) + ',')
-        if isinstance(obj.SA, str):
-            f.write(' ,')
-        else:
-            f.write(str(obj.SA) + ',')
-        if isinstance(obj.vol, str):
-            f.write(' ,')
-        else:
-            f.write(str(obj.vol) + ',')
-        f.write(str(obj.nverts) + ',')
-        if obj.curvelength != "property not available":
-        	f.write(str(obj.curvelength) + ' \n')
-        else:
-        	f.write(' \n')
-    return
+def write_measurements(obs, the_name):
+    names, parents, SAs, vols, nverts, lengths = get_measurement_columns(obs)
+
+    if the_name.endswith('.npz'):
+        np.savez(the_name, name=np.array(names, dtype=str), parent=np.array([p.strip() for p in parents], dtype=str),
+                 surface_area=SAs, volume=vols, nverts=nverts, length=lengths)
+        return
+
+    def fmt(vals, blank=' '):
+        return [blank if np.isnan(val) else str(float(val)) for val in vals]
+
+    f = open(the_name, 'w', buffering=2**20)
+    f.write('Object Name,Parent,Surface Area,Volume,Number of Vertices,Length\n\n')
+    chunk = 10000  # write in chunks of rows, to keep memory use low for large scenes
+    for ii in range(0, len(names), chunk):
+        rows = zip(names[ii:ii+chunk], parents[ii:ii+chunk], fmt(SAs[ii:ii+chunk]), fmt(vols[ii:ii+chunk]),
+                   [str(n) for n in nverts[ii:ii+chunk]], fmt(lengths[ii:ii+chunk], ''))
+        f.writelines([','.join(row) + ' \n' for row in rows])
+    f.close()
 
 
 
@@ -1292,6 +1604,17 @@ class MeasurementToolsPanel(bpy.types.Panel):
             col1.operator("mesh.create_both_meshes", text = "Both")
             col2.operator("mesh.create_whole_surfaces", text='Multi Object')
 
+            layout.label("-----Selection-----")
+            split = layout.row().split(percentage=0.5)
+            col1 = split.column()
+            col2 = split.column()
+            col1.operator("mesh.measure_selection", text = "Measure Selection")
+            col2.prop(scn, "sel_calc_vol")
+            layout.label("Selected faces:   " + str(scn.sel_nfaces))
+            layout.label("Selected area:   " + str(round(scn.sel_area, 6)))
+            if scn.sel_vol >= 0:
+                layout.label("Closed volume:   " + str(round(scn.sel_vol, 6)))
+
             layout.label("-----Lengths-----")
             layout.prop(context.scene , "create_length_obj")
             len_str = "Last calculated length:   " + str(round(bpy.context.scene.last_len, 6))
@@ -1325,15 +1648,22 @@ class MeasurementToolsPanel(bpy.types.Panel):
         layout.operator("file.write_data", text='Export Measurements', icon='FILESEL')
         # row = layout.row()
         layout.operator("mesh.write_selected_data", text = "Export Selected", icon='FILESEL')
+        layout.prop(scn, "export_format", expand=True)
 
 
 
 def register():
     bpy.utils.register_module(__name__)
+    bpy.app.handlers.scene_update_post.append(mark_updated_objects)
+    bpy.app.handlers.load_post.append(clear_metrics_caches)
 
     # define new properties
     bpy.types.Scene.float_scale = FloatProperty(name = "scale", default = 1.0, min = 10**-20)
     bpy.types.Scene.remesh_octree_depth = IntProperty(name = "import octree depth", default = 7)
+    bpy.types.Scene.export_format = EnumProperty(name = "Export format",
+        items = [('CSV', "CSV", "Comma separated text file"),
+                 ('NPZ', "NPZ", "NumPy archive with one array per column")],
+        default = 'CSV', description = "File format of exported measurements")
     bpy.types.Object.string_name = StringProperty(name = "obj name", default="submesh")
     # bpy.types.Object.string_name = StringProperty(name = "obj name", default="submesh", get=get_name, set=set_name)
     bpy.types.Object.SA = property(fget_SA, fset_SA)
@@ -1358,11 +1688,26 @@ def register():
     bpy.types.Scene.create_length_obj = bpy.props.BoolProperty(name = "Create Length Object", default = True, \
                         description = "Create new mesh curve object from points used in length calculation")
 
+    # Selection readout
+    bpy.types.Scene.sel_calc_vol = bpy.props.BoolProperty(name = "Closed Volume", default = False, \
+                        description = "Also calculate the volume of the selected faces, with any holes closed")
+    bpy.types.Scene.sel_nfaces = bpy.props.IntProperty(name = "Selected faces", default = 0)
+    bpy.types.Scene.sel_area = bpy.props.FloatProperty(name = "Selected area", default = 0.0, \
+                        description = "Surface area of the selected faces")
+    bpy.types.Scene.sel_vol = bpy.props.FloatProperty(name = "Closed volume", default = -1.0, \
+                        description = "Volume of the selected faces with any holes closed, -1 if not calculated")
+
 
 
 def unregister():
     bpy.utils.unregister_module(__name__)
+    bpy.app.handlers.scene_update_post.remove(mark_updated_objects)
+    bpy.app.handlers.load_post.remove(clear_metrics_caches)
 
+    del bpy.types.Scene.sel_vol
+    del bpy.types.Scene.sel_area
+    del bpy.types.Scene.sel_nfaces
+    del bpy.types.Scene.sel_calc_vol
     del bpy.types.Scene.create_length_obj
     del bpy.types.Scene.last_len
     # del bpy.types.Object.vertex_collection
@@ -1375,6 +1720,7 @@ def unregister():
     del bpy.types.Object.vol
     del bpy.types.Object.SA
     del bpy.types.Object.string_name
+    del bpy.types.Scene.export_format
     del bpy.types.Scene.remesh_octree_depth
     del bpy.types.Scene.float_scale
     
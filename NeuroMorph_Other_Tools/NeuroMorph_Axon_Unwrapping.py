@@ -36,6 +36,8 @@ import re
 from os import listdir
 import copy
 import numpy as np  # must have Blender > 2.7
+import heapq
+from collections import OrderedDict
 import csv
 import xml.etree.ElementTree as ET
 import datetime
@@ -111,21 +113,21 @@ class PathOnMesh_unwrap(bpy.types.Operator):
         vert_inds = [vind for vind, vert in enumerate(obj.data.vertices) if vert.select == True]
         if len(vert_inds)==2:
 
-            # Temporarily add edges to connect vertices across each face
-            add_face_edges_unwrap(obj, vert_inds)
-
-            # Select the shortest path on the mesh (does above)
-            select_shortest_path_unwrap(obj, vert_inds, self)
-
-            # Create new object from selected points
-            curve = new_obj_from_selected_verts_unwrap(obj)
+            # Calculate the shortest path, through vertices and straight across faces
+            graph = get_surface_graph_unwrap(obj)
+            path, dist = geodesic_path_unwrap(graph, vert_inds[0], vert_inds[1])
+            if len(path) == 0:
+                self.report({'INFO'},"Cannot calculate path: points are from disconnected parts of the mesh")
+                obj.select=True
+                bpy.context.scene.objects.active = obj
+                bpy.ops.object.mode_set(mode='EDIT')
+                return{'FINISHED'}
+
+            # Create new object from the points on the path
+            curve = new_obj_from_path_unwrap(obj, graph, path)
             curve.name = "yaxis"
             bpy.context.scene.yaxis_name = "yaxis"  # set y-axis to this object
 
-            # Undo the triangulate operation
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.ed.undo()
-
             activate_new_curve_unwrap(curve, obj)
 
             # Reorder vertices along curve to run from 0 to nverts
@@ -140,152 +142,161 @@ class PathOnMesh_unwrap(bpy.types.Operator):
         return{'FINISHED'}
 
 
-def select_shortest_path_unwrap(obj, vinds, self):
-    # Select shortest path on obj between the (2) vertices with indices in vinds
-    select_obj_unwrap(obj)
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='DESELECT')
-    bpy.ops.object.mode_set(mode='OBJECT')
-    for vind in vinds:
-        obj.data.vertices[vind].select = True
-    bpy.ops.object.mode_set(mode='EDIT')
-    err = bpy.ops.mesh.shortest_path_select()  
-    bpy.ops.object.mode_set(mode='OBJECT')
-
-    if "CANCELLED" in err:
-        self.report({'INFO'},"Cannot calculate path: points are from disconnected parts of the mesh")
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.ed.undo()
-        bpy.ops.object.mode_set(mode='OBJECT')
-        obj.select=True
-        bpy.context.scene.objects.active = obj
-        bpy.ops.object.mode_set(mode='EDIT')
-        return{'FINISHED'}
-
-    # shortest_path_select() returns nothing if points are neighbors, so select them again
-    verts_out = [v for v in obj.data.vertices if v.select == True]
-    if len(verts_out) == 0:
-        for vind in vinds:
-            obj.data.vertices[vind].select = True
-
-
-
-def add_face_edges_unwrap(obj, vert_inds):
-# add edges to connect vertices on each face across the face:
-# for each quadrilateral face, add the two diagonals,
-# for each n>4-sided face, add the centroid and edges connecting
-# it to each original vertex,
-# leave triangular faces as they are
-
-    bpy.ops.object.mode_set(mode='EDIT')
-    obj = bpy.context.object
-    data = obj.data
-    bm = bmesh.new()   # create an empty BMesh
-    bm.from_mesh(data)   # fill it in from a Mesh
-
-    # find shortest path using centroids of all faces;
-    # only add diagonal edges to quad faces that include
-    # vertices from this shortest path
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.mesh.poke()  # adds the centroid to each face and radial edges connecting it each vertex
-    bpy.ops.mesh.select_all(action='DESELECT')
-    bpy.ops.object.mode_set(mode='OBJECT')
-    for vind in vert_inds:
-        data.vertices[vind].select=True
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.shortest_path_select()
-    bpy.ops.object.mode_set(mode='OBJECT')
-
-    # store the indices of these vertices, then undo, then proceed
-    poke_path_inds = []
-    for v in data.vertices:
-        if v.select:
-            poke_path_inds.append(v.index)
-    # undo poke
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.ed.undo()
-    bpy.ops.object.mode_set(mode='OBJECT')
-
-    # handle quad faces
-    bm.verts.ensure_lookup_table()
-    for face in data.polygons:
-        if len(face.vertices) == 4:
-            on_path_flag = 0
-            for vert in face.vertices:
-                if vert in poke_path_inds:
-                    on_path_flag = 1
-                    break
-            if on_path_flag:
-                v0bm = bm.verts[face.vertices[0]]
-                v1bm = bm.verts[face.vertices[1]]
-                v2bm = bm.verts[face.vertices[2]]
-                v3bm = bm.verts[face.vertices[3]]
-                e1 = [v0bm, v2bm]
-                e2 = [v1bm, v3bm]
-                bm.edges.new(e1)
-                bm.edges.new(e2)
-    bm.edges.index_update()
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bm.to_mesh(data)
-    bpy.ops.object.mode_set(mode='EDIT')
-
-    # handle non-quad faces  (leave triangular faces as they are)
-    # if many faces with >4 sides might be slow
-    for face in bm.faces:  # use the bmesh data structure: pointers don't go away after context change
-        if len(face.verts) > 4:
-            bpy.ops.mesh.select_all(action='DESELECT')
-            face.select = True
-            bpy.ops.object.mode_set(mode='OBJECT')
-            bm.to_mesh(data)
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.poke()
-
-    bm.edges.index_update()
-    bmesh.update_edit_mesh(data, destructive=True)  # to update mesh in scene
-    bm.free()
-
-def get_total_length_of_edges_unwrap(ob):
-    # Get length of all elected edges on an object
-    # Assign total length to scene variable
-
-    # # Convert to global coordinates, just in case this hasn't already been done
-    # bpy.ops.object.mode_set(mode='OBJECT')
-    # bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
-
-    # Get length of all edges
-    bpy.ops.object.mode_set(mode='EDIT')
-    select_as_vert = tuple(bpy.context.scene.tool_settings.mesh_select_mode)[1]
-    bpy.ops.mesh.select_mode(type="EDGE")
-    bpy.ops.object.mode_set(mode='OBJECT')
-    edges = [ed for ed in ob.data.edges if ed.select == True]
-
-    total_len = 0
-    for ed in edges:
-        v1 = ob.data.vertices[ed.vertices[0]].co
-        v2 = ob.data.vertices[ed.vertices[1]].co
-        total_len += (v1-v2).length
-
-    if not select_as_vert:
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_mode(type="VERT")
-        bpy.ops.object.mode_set(mode='OBJECT')
-
-    return(total_len)
-
-def new_obj_from_selected_verts_unwrap(obj):
-    obs0 = [ob.name for ob in bpy.context.scene.objects]
-
-    obj.select = True
-    bpy.context.scene.objects.active = obj
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.duplicate_move()
-    bpy.ops.mesh.separate(type='SELECTED')
-
-    # select the newly created object
-    obs1 = [ob.name for ob in bpy.context.scene.objects]
-    new_ob_name = [o1 for o1 in obs1 if o1 not in obs0][0]  # the newly created object
-    new_obj = bpy.context.scene.objects[new_ob_name]
+# cache of the surface graph of each mesh object used by the geodesic functions below,
+# rebuilt only when the mesh changes:  {object name: [mesh hash, graph]};
+# only the graph_cache_size_unwrap most recently used graphs of existing objects are kept
+graph_cache_unwrap = OrderedDict()
+graph_cache_size_unwrap = 2
+
+
+# add a graph to graph_cache_unwrap, dropping the graphs of deleted objects and the least recently used ones
+def store_surface_graph_unwrap(key, entry):
+    graph_cache_unwrap[key] = entry
+    graph_cache_unwrap.move_to_end(key)
+    for old_key in [old_key for old_key in graph_cache_unwrap if old_key not in bpy.data.objects]:
+        del graph_cache_unwrap[old_key]
+    while len(graph_cache_unwrap) > graph_cache_size_unwrap:
+        graph_cache_unwrap.popitem(last=False)
+
+
+# weighted vertex adjacency graph of a mesh in CSR form, with edge lengths as weights:
+# the neighbors of vertex v are indices[indptr[v]:indptr[v+1]];
+# if face_diagonals, vertices are also connected straight across quads and n-gons
+def build_surface_graph_unwrap(co, edges, loop_verts, loop_totals, face_diagonals=True):
+    a = [edges[:,0]]
+    b = [edges[:,1]]
+    if face_diagonals:
+        loop_starts = np.cumsum(loop_totals) - loop_totals
+        for nsides in np.unique(loop_totals[loop_totals >= 4]):
+            face_starts = loop_starts[loop_totals == nsides]
+            face_verts = loop_verts[face_starts[:,None] + np.arange(nsides)]
+            for ii in range(nsides):
+                for jj in range(ii + 2, nsides - (ii == 0)):  # all pairs of non-neighboring corners
+                    a.append(face_verts[:,ii])
+                    b.append(face_verts[:,jj])
+    a = np.concatenate(a)
+    b = np.concatenate(b)
+    src = np.concatenate((a, b))
+    dst = np.concatenate((b, a))
+    order = np.argsort(src, kind='stable')
+    src = src[order]
+    dst = dst[order]
+    weights = np.linalg.norm(co[src].astype(np.float64) - co[dst], axis=1)
+    indptr = np.zeros(len(co) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(src, minlength=len(co)))
+
+    # kept as numpy arrays, far smaller than python lists; the searches below read the
+    # neighbors of each vertex they visit as python lists, which keeps the queue loops fast
+    return ({"indptr": indptr, "indices": dst, "weights": weights, "co": co})
+
+
+# return the surface graph of the mesh of obj, from graph_cache_unwrap if the mesh has not changed
+def get_surface_graph_unwrap(obj, face_diagonals=True):
+    mesh = obj.data
+    co, loop_verts, loop_totals = get_mesh_arrays_unwrap(mesh)
+    edges = np.empty(len(mesh.edges) * 2, dtype=np.int32)
+    mesh.edges.foreach_get("vertices", edges)
+    edges = edges.reshape((-1, 2))
+    mesh_hash = hash((get_mesh_hash_unwrap(co, loop_verts, loop_totals), edges.tobytes(), face_diagonals))
+    if obj.name in graph_cache_unwrap and graph_cache_unwrap[obj.name][0] == mesh_hash:
+        graph_cache_unwrap.move_to_end(obj.name)
+        return (graph_cache_unwrap[obj.name][1])
+
+    graph = build_surface_graph_unwrap(co, edges, loop_verts, loop_totals, face_diagonals)
+    store_surface_graph_unwrap(obj.name, [mesh_hash, graph])
+    return (graph)
+
+
+# shortest path on the surface graph between vertices src and dst, by A* search
+# with the straight-line distance to dst as heuristic:
+# returns (list of vertex indices from src to dst, length), or ([], inf) if they are not connected
+def geodesic_path_unwrap(graph, src, dst):
+    indptr = graph["indptr"]
+    indices = graph["indices"]
+    weights = graph["weights"]
+    co = graph["co"]
+    co_dst = co[dst].astype(np.float64)
+
+    dists = {src: 0.0}
+    prev = {src: -1}
+    done = set()
+    queue = [(float(np.linalg.norm(co[src] - co_dst)), src)]
+    while queue:
+        f, v = heapq.heappop(queue)
+        if v in done:
+            continue
+        if v == dst:
+            path = [v]
+            while prev[path[-1]] >= 0:
+                path.append(prev[path[-1]])
+            return (path[::-1], dists[dst])
+        done.add(v)
+        dv = dists[v]
+        start, stop = indptr[v], indptr[v+1]
+        nbrs = indices[start:stop]
+        ests = np.linalg.norm(co[nbrs] - co_dst, axis=1)
+        for u, w, h in zip(nbrs.tolist(), weights[start:stop].tolist(), ests.tolist()):
+            du = dv + w
+            if u not in done and du < dists.get(u, math.inf):
+                dists[u] = du
+                prev[u] = v
+                heapq.heappush(queue, (du + h, u))
+    return ([], math.inf)
+
+
+# distance on the surface graph from the nearest of the vertices in sources to every vertex,
+# by Dijkstra's algorithm; vertices further than max_dist (or not connected) get inf
+def geodesic_distances_unwrap(graph, sources, max_dist=math.inf):
+    indptr = graph["indptr"]
+    indices = graph["indices"]
+    weights = graph["weights"]
+    dists = [math.inf] * (len(indptr) - 1)
+    queue = []
+    for s in sources:
+        dists[s] = 0.0
+        queue.append((0.0, s))
+    heapq.heapify(queue)
+    while queue:
+        dv, v = heapq.heappop(queue)
+        if dv > dists[v]:
+            continue
+        start, stop = indptr[v], indptr[v+1]
+        for u, w in zip(indices[start:stop].tolist(), weights[start:stop].tolist()):
+            du = dv + w
+            if du < dists[u] and du <= max_dist:
+                dists[u] = du
+                heapq.heappush(queue, (du, u))
+    return (np.array(dists))
+
+
+# read vertex coordinates and face loops of a mesh into numpy arrays
+def get_mesh_arrays_unwrap(mesh):
+    nverts = len(mesh.vertices)
+    co = np.empty(nverts * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    loop_verts = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_verts)
+    loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    return (co.reshape((nverts, 3)), loop_verts, loop_totals)
+
+
+# hash of the geometry of a mesh, changes whenever a vertex moves or the faces change
+def get_mesh_hash_unwrap(co, loop_verts, loop_totals):
+    return hash((co.tobytes(), loop_verts.tobytes(), loop_totals.tobytes()))
+
+
+# new mesh object of the vertices of path (indices into the vertices of obj) connected in order
+def new_obj_from_path_unwrap(obj, graph, path):
+    co = graph["co"][path].astype(np.float32)
+    mesh = bpy.data.meshes.new(obj.name + "_path")
+    mesh.vertices.add(len(path))
+    mesh.vertices.foreach_set("co", co.ravel())
+    mesh.edges.add(len(path) - 1)
+    mesh.edges.foreach_set("vertices", np.repeat(np.arange(len(path), dtype=np.int32), 2)[1:-1])
+    mesh.update()
+    new_obj = bpy.data.objects.new(obj.name + "_path", mesh)
+    bpy.context.scene.objects.link(new_obj)
     return (new_obj)
 
 def activate_new_curve_unwrap(curve, obj):
@@ -1074,6 +1085,10 @@ def unwrap_crosssection_boundaries_unwrap(centerline, self):
 
     norm_vec = get_norm_centerline_unwrap(centerline)
 
+    # Distance along the y-axis from yaxis0_ind to each of its vertices
+    yaxis_graph = get_surface_graph_unwrap(yaxis_ob, face_diagonals=False)
+    yaxis_dists = geodesic_distances_unwrap(yaxis_graph, [yaxis0_ind])
+
     # Loop over cross sections
     xy_coords = []
     nverts_centerline = len(centerline.data.vertices)
@@ -1088,8 +1103,7 @@ def unwrap_crosssection_boundaries_unwrap(centerline, self):
         this_yaxis_ind = centerline["yaxis_inds"][yind]
 
         # Define y-value as distance from yaxis_pt[y0_ind] along y-axis to here
-        select_shortest_path_unwrap(yaxis_ob, [this_yaxis_ind, yaxis0_ind], self)
-        this_y = get_total_length_of_edges_unwrap(yaxis_ob)
+        this_y = yaxis_dists[this_yaxis_ind]
 
         # Find closest 2 verts to yaxis_pt
         # Use distance from yaxis_pt to these pts, ignore polygon edge between them
@@ -1114,17 +1128,12 @@ def unwrap_crosssection_boundaries_unwrap(centerline, self):
         # Assign vertices to closest starting point, thereby defining cutting point on opposite side of polygon
         vlist1 = []  # Vertices closest to pt1
         vlist2 = []  # Vertices closest to pt2
+        xsection_graph = get_surface_graph_unwrap(xsection, face_diagonals=False)
+        dists1 = geodesic_distances_unwrap(xsection_graph, [vind1])
+        dists2 = geodesic_distances_unwrap(xsection_graph, [vind2])
         for vind in face.vertices:
-            if vind == vind1:
-                this_dist1 = 0
-            else:
-                select_shortest_path_unwrap(xsection, [vind1, vind], self)
-                this_dist1 = get_total_length_of_edges_unwrap(xsection)
-            if vind == vind2:
-                this_dist2 = 0
-            else:
-                select_shortest_path_unwrap(xsection, [vind2, vind], self)
-                this_dist2 = get_total_length_of_edges_unwrap(xsection)
+            this_dist1 = dists1[vind]
+            this_dist2 = dists2[vind]
             if this_dist1 < this_dist2:
                 vlist1.append([vind, this_dist1])
             else:
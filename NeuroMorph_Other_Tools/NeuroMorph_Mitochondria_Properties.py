@@ -25,7 +25,9 @@ bl_info = {
     "category": "Tool"}  
   
 import bpy
+import bmesh
 from bpy.props import *
+from bpy.app.handlers import persistent
 from mathutils import Vector, Matrix
 import mathutils
 import math
@@ -52,6 +54,17 @@ class MitoPanel(bpy.types.Panel):
         row.prop(context.scene, "filename")
         row.operator("file.set_filename", text='', icon='FILESEL')
 
+        row = self.layout.row()
+        row.prop(context.scene, "geometry_mode", text='')
+        if context.scene.geometry_mode == 'LABELS':
+            row = self.layout.row()
+            row.prop(context.scene, "create_bboxes")
+
+        row = self.layout.row()
+        row.prop(context.scene, "use_hull")
+        row = self.layout.row()
+        row.prop(context.scene, "use_descriptors")
+
         row = self.layout.row()
         row.operator("object.get_geometry", text='Get Bounding Boxes', icon='MESH_CUBE')
 
@@ -63,10 +76,13 @@ class MitoPanel(bpy.types.Panel):
 # Tool to measure lengths/tubularities of many mitochondria objects in a scene
 # 
 # Separate input into distinct objects if input is single joined object
+# (or, in "Labels in Memory" mode, label its connected regions without creating objects)
 # Then calculate for each object:
 # - length of major axis of bounding box
 # - ratio of major axis length to mean of other 2 axis lengths
 # - volume
+# and optionally the convex hull volume, solidity and minimum-volume box,
+# and the shape descriptors of get_shape_descriptors()
 class GetGeometry(bpy.types.Operator):
     """Get geometry of each distinct object of input object or its children"""
     bl_idname = "object.get_geometry"
@@ -77,11 +93,18 @@ class GetGeometry(bpy.types.Operator):
         # ob_list = [ob for ob in bpy.data.objects if ob.select == True]
         # if len(ob_list) == 1:
 
+        prune_geom_cache()
+
         ob_orig = bpy.context.object
         name_orig = ob_orig.name
         if name_orig[-7:] == "_parent":
             name_orig = name_orig[0:-7]
 
+        # Measure the connected regions of a single joined object in memory
+        if context.scene.geometry_mode == 'LABELS' and len(ob_orig.children) == 0:
+            self.get_geometry_labels(context, ob_orig, name_orig)
+            return {'FINISHED'}
+
         # Separate into distinct child objects if input has no children
         if len(ob_orig.children) == 0:
             t0 = datetime.datetime.now()
@@ -109,43 +132,132 @@ class GetGeometry(bpy.types.Operator):
             for ob in ob_list:
                 ob.parent = ob_parent
 
-            # Create bounding box object
-            fullname_bbox = "BBox_" + name_orig + "_parent"
-            bbox_parent = bpy.data.objects.new(fullname_bbox, None)
-            bpy.context.scene.objects.link(bbox_parent)
-
             t1 = datetime.datetime.now()
             print("time to separate: ", t1-t0)
 
         else:
             ob_parent = ob_orig
             ob_list = ob_parent.children
-            fullname_bbox = "BBox_" + name_orig + "_parent"
-            bbox_parent_list = [ob_i for ob_i in bpy.data.objects if ob_i.name == fullname_bbox]
-            if bbox_parent_list == []:
-                bbox_parent = bpy.data.objects.new(fullname_bbox, None)
-                bpy.context.scene.objects.link(bbox_parent)
-            else:
-                bbox_parent = bbox_parent_list[0]
 
 
         t2 = datetime.datetime.now()
 
         # Loop through each object, extracting geometric info
         geom_props = []
+        corners = []
+        svd_axes = []
         for ob in ob_list:
             # ob = bpy.data.objects[ob_name]
-            this_data = get_geom_properties(ob, bbox_parent)
+            this_data, these_corners, V = get_geom_properties(ob)
             geom_props.append(this_data)  # [max_length, length_ratio, volume]
-
-        ob_names = [ob.name for ob in ob_list]
-        write_data(self, geom_props, ob_names)
+            corners.append(these_corners)
+            svd_axes.append(V)
 
         t3 = datetime.datetime.now()
         print("time to process: ", t3-t2)
 
+        ob_names = [ob.name for ob in ob_list]
+        col_names = geom_col_names
+        if context.scene.use_hull:
+            # Transforms have been applied, so local coordinates are world coordinates
+            vert_coords = [get_mesh_arrays(ob.data)[0] for ob in ob_list]
+            volumes = [props[2] for props in geom_props]
+            hull_props = self.get_hull_properties(vert_coords, svd_axes, volumes, "MinBox_" + name_orig, ob_names)
+            geom_props = np.column_stack((geom_props, hull_props)).tolist()
+            col_names = col_names + hull_col_names
+        if context.scene.use_descriptors:
+            t4 = datetime.datetime.now()
+            co, loop_verts, loop_starts, edges, loop_edges, labels = get_joined_arrays(ob_list)
+            descriptors = get_shape_descriptors(co, loop_verts, loop_starts, edges, loop_edges, labels, len(ob_list))
+            geom_props = np.column_stack((geom_props, descriptors)).tolist()
+            col_names = col_names + desc_col_names
+            t5 = datetime.datetime.now()
+            print("time to calculate shape descriptors: ", t5-t4)
+        write_data(self, geom_props, ob_names, col_names)
+
+        # All bounding boxes as a single object
+        add_box_mesh("BBox_" + name_orig, np.array(corners), ob_names)
+
         return {'FINISHED'}
 
+    # Convex hull and minimum-volume box of each set of vertex coordinates, batched across objects:
+    # returns [min-volume box max length, length ratio, hull volume, solidity] per object,
+    # and adds the minimum-volume boxes as a single object box_name, unless box_name is None
+    def get_hull_properties(self, vert_coords, svd_axes, volumes, box_name, ob_names):
+        t0 = datetime.datetime.now()
+        hulls = [get_convex_hull(co) for co in vert_coords]
+        candidates = [get_box_candidates(co_h, tris_h, V) for (co_h, tris_h), V in zip(hulls, svd_axes)]
+        t1 = datetime.datetime.now()
+        box_axes, box_min, box_max = get_min_volume_boxes([co_h for co_h, tris_h in hulls], candidates)
+        t2 = datetime.datetime.now()
+
+        nobs = max(len(vert_coords), 1)
+        print("convex hull time per 1k objects: ", (t1-t0) * 1000 / nobs)
+        print("minimum-volume box time per 1k objects: ", (t2-t1) * 1000 / nobs)
+
+        sides = -np.sort(box_min - box_max, axis=1)
+        mean_other = (sides[:,1] + sides[:,2]) / 2
+        length_ratios = np.zeros(len(sides))
+        np.divide(sides[:,0], mean_other, out=length_ratios, where=mean_other > 0)
+
+        hull_vols = np.array([get_hull_volume(co_h, tris_h) for co_h, tris_h in hulls])
+        solidity = np.zeros(len(hull_vols))
+        np.divide(np.abs(volumes), hull_vols, out=solidity, where=hull_vols > 0)
+
+        if box_name is not None:
+            corners = get_label_box_corners(np.zeros((len(sides), 3)), box_axes, box_min, box_max)
+            add_box_mesh(box_name, corners, ob_names)
+
+        return (np.column_stack((sides[:,0], length_ratios, hull_vols, solidity)))
+
+    def get_geometry_labels(self, context, ob_orig, name_orig):
+        t0 = datetime.datetime.now()
+
+        # World coordinates, so the object transform does not need to be applied
+        co, loop_verts, loop_starts = get_mesh_arrays(ob_orig.data)
+        co = get_world_coords(ob_orig, co)
+        edges, loop_edges = get_edge_arrays(ob_orig.data)
+        labels = label_connected_components(len(co), edges[:,0], edges[:,1])
+        nlabels = labels.max() + 1 if len(labels) > 0 else 0
+        if nlabels == 0:
+            self.report({'INFO'}, "Active object has no vertices, nothing to measure.")
+            return
+
+        centroids, axes, box_min, box_max, max_lengths, length_ratios, volumes = \
+            get_label_geom_properties(co, loop_verts, loop_starts, loop_edges, len(edges), labels, nlabels)
+
+        # Regions are named as bpy.ops.mesh.separate(type='LOOSE') in 2.7x names the separated objects
+        # (if no other objects use those names):  it moves the region of the first vertex to .001,
+        # the next to .002, etc, and leaves the last region in the original object
+        ob_names = [name_orig + "." + str(ind + 1).zfill(3) for ind in range(nlabels - 1)] + [name_orig]
+        geom_props = np.column_stack((max_lengths, length_ratios, volumes))
+        col_names = geom_col_names
+
+        t1 = datetime.datetime.now()
+        print("time to process", nlabels, "regions: ", t1-t0)
+
+        if context.scene.use_hull:
+            order = np.argsort(labels, kind='mergesort')
+            vert_coords = np.split(co[order], np.cumsum(np.bincount(labels, minlength=nlabels))[:-1])
+            box_name = "MinBox_" + name_orig if context.scene.create_bboxes else None
+            hull_props = self.get_hull_properties(vert_coords, axes, volumes, box_name, ob_names)
+            geom_props = np.column_stack((geom_props, hull_props))
+            col_names = col_names + hull_col_names
+            t1 = datetime.datetime.now()
+        if context.scene.use_descriptors:
+            descriptors = get_shape_descriptors(co, loop_verts, loop_starts, edges, loop_edges, labels, nlabels)
+            geom_props = np.column_stack((geom_props, descriptors))
+            col_names = col_names + desc_col_names
+            t1 = datetime.datetime.now()
+        write_data(self, geom_props.tolist(), ob_names, col_names)
+
+        if context.scene.create_bboxes:
+            corners = get_label_box_corners(centroids, axes, box_min, box_max)
+            add_box_mesh("BBox_" + name_orig, corners, ob_names)
+
+            t2 = datetime.datetime.now()
+            print("time to create bounding boxes: ", t2-t1)
+
 
 
 # class GetGeometrySingle(bpy.types.Operator):
@@ -170,49 +282,54 @@ class GetGeometry(bpy.types.Operator):
 
 
 
-def get_geom_properties(ob, bbox_parent):
-    bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
-
-    mat = bpy.data.materials.new("transparent")
-    mat.use_transparency = True
-    mat.alpha = 0.5
-
-    # Process on convex hull?, fewer vertices
-    # todo: is it better if keep the weighting of all the original vertices?
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.scene.objects.active = ob
-    ob.select = True
+# Returns [max_length, length_ratio, volume] of ob, the 8 corners of its bounding box, and its primary axes
+def get_geom_properties(ob):
+    # Primary axes, bounding box and volume are reused from geom_cache, without running any operators,
+    # if the object has not been updated or moved since it was measured
+    entry = get_cache_entry(ob)
+    if entry is None:
+        bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
+
+        # Process on convex hull?, fewer vertices
+        # todo: is it better if keep the weighting of all the original vertices?
+        bpy.ops.object.mode_set(mode='OBJECT')
+        bpy.ops.object.select_all(action='DESELECT')
+        bpy.context.scene.objects.active = ob
+        ob.select = True
+
+        # Otherwise reused if the mesh has not changed:  the hash is always compared here,
+        # as separate() re-creates objects under the names of deleted ones
+        co, loop_verts, loop_starts = get_mesh_arrays(ob.data)
+        mesh_hash = get_mesh_hash(co, loop_verts, loop_starts)
+        entry = geom_cache.get(ob.name)
+        if entry is not None and entry[1] != mesh_hash:
+            entry = None
+        if entry is not None:
+            entry[0] = get_update_stamp(ob)
+
+    if entry is not None:
+        V, bbox_minmax, volume = entry[2:]
+        rot_mat = get_rot_mat(V)
+    else:
+        # Find primary axis via SVD decomposition
+        # First center coords to origin
+        vert_coords_orig = [v.co for v in ob.data.vertices]
+        centroid = Vector(np.mean(vert_coords_orig, axis = 0))
+        vert_coords_centered = [v-centroid for v in vert_coords_orig]
+        U, s, V = np.linalg.svd(vert_coords_centered)  # V[i] = eigenvector(i), normalized
 
-    # Find primary axis via SVD decomposition
-    # First center coords to origin
-    vert_coords_orig = [v.co for v in ob.data.vertices]
-    centroid = Vector(np.mean(vert_coords_orig, axis = 0))
-    vert_coords_centered = [v-centroid for v in vert_coords_orig]
-    U, s, V = np.linalg.svd(vert_coords_centered)  # V[i] = eigenvector(i), normalized
+        # Get rotation matrix (rotates data to be axis-aligned)
+        rot_mat = get_rot_mat(V)
 
-    # Get rotation matrix (rotates data to be axis-aligned)
-    rot_mat = Matrix.Identity(4)
-    rot_mat[0][0:3] = V[0]
-    rot_mat[1][0:3] = V[1]
-    rot_mat[2][0:3] = V[2]
+        # Get axis-aligned bounding box
+        bbox_minmax = get_bounding_box(vert_coords_orig, rot_mat)  # rotates pts, finds bbox
 
-    # Get axis-aligned bounding box
-    bbox_minmax = get_bounding_box(vert_coords_orig, rot_mat)  # rotates pts, finds bbox
-    bbox = add_box(bbox_minmax)
-    bbox.parent = bbox_parent
-
-    # Give the bounding box the correctly indexed name
-    name_split = ob.name.split(".")
-    if len(name_split) == 2:
-        bbox.name = "BBox." + name_split[1]
-    else:
-        bbox.name = "BBox"
+        volume = get_vol(ob)
+        geom_cache[ob.name] = [get_update_stamp(ob), mesh_hash, V, bbox_minmax, volume]
 
     # Rotate bbox back to object location
-    rot_inv = Matrix(np.linalg.inv(rot_mat))
-    for vv in bbox.data.vertices:
-        vv.co = rot_inv * vv.co
+    rot_inv = np.linalg.inv(np.array(rot_mat))[0:3,0:3]
+    corners = np.array(box_cords(bbox_minmax)).dot(rot_inv.T)
 
     # Get ordered box side lengths
     xrng = bbox_minmax[1] - bbox_minmax[0]
@@ -225,14 +342,21 @@ def get_geom_properties(ob, bbox_parent):
     # Calculate length properties
     max_length = len_max
     length_ratio = len_max / ((len_mid + len_min)/2)
-    volume = get_vol(ob)
-    bpy.ops.object.mode_set(mode='OBJECT')
 
-    return([max_length, length_ratio, volume])
+    return([max_length, length_ratio, volume], corners, V)
 
 
 
 
+# Rotation matrix with rows V[0], V[1], V[2] (rotates data to be axis-aligned)
+def get_rot_mat(V):
+    rot_mat = Matrix.Identity(4)
+    rot_mat[0][0:3] = V[0]
+    rot_mat[1][0:3] = V[1]
+    rot_mat[2][0:3] = V[2]
+    return(rot_mat)
+
+
 def get_bounding_box(vert_coords, rot_mat):
     verts_rotated = [rot_mat*v for v in vert_coords]  # if rot_mat is V, bb is axis-aligned
     xs = [v[0] for v in verts_rotated]
@@ -242,27 +366,209 @@ def get_bounding_box(vert_coords, rot_mat):
 
 
 
-def add_box(box_minmax):
-    # box_minmax is either [xmin, xmax, ymin, ymax, zmin, zmax]
-    #            or a vector containing all 8 vertex coordinates
-    activate_an_object()
-    bpy.ops.object.mode_set(mode='OBJECT')
-
-    if len(box_minmax) == 6:
-        box_verts = box_cords(box_minmax)
-    elif len(box_minmax) == 8:
-        box_verts = box_minmax
+# Convex hull of the vertex coordinates co, with bmesh (quickhull):  returns the hull vertex coordinates
+# and (ntris,3) triangles, or no triangles if the points are too few or all in one plane
+def get_convex_hull(co):
+    co = np.array(co, dtype=np.float64).reshape((-1, 3))
+    if len(co) < 4:
+        return (co, np.zeros((0, 3), dtype=int))
+
+    # The points go in, and the hull comes out, through a temporary mesh with foreach_set/get
+    mesh = bpy.data.meshes.new("hull_tmp")
+    mesh.vertices.add(len(co))
+    mesh.vertices.foreach_set("co", co.astype(np.float32).ravel())
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    bmesh.ops.convex_hull(bm, input=bm.verts)
+    bm.to_mesh(mesh)
+    bm.free()
+    co_m, loop_verts, loop_starts = get_mesh_arrays(mesh)
+    bpy.data.meshes.remove(mesh)
+
+    # convex_hull() creates triangles, larger faces are fanned just in case;
+    # interior points are left in the mesh unused, and are dropped here
+    tris, tri_faces = get_fan_tris(loop_verts, loop_starts)
+    if len(tris) == 0:
+        return (co, np.zeros((0, 3), dtype=int))
+    hull_verts, tris_h = np.unique(tris, return_inverse=True)
+    return (co_m[hull_verts].astype(np.float64), tris_h.reshape((-1, 3)))
+
+
+# Volume of a convex hull:  tetrahedra of each triangle with an interior point
+def get_hull_volume(co_h, tris_h):
+    if len(tris_h) == 0:
+        return (0.)
+    center = co_h.mean(axis=0)
+    p0 = co_h[tris_h[:,0]] - center
+    p1 = co_h[tris_h[:,1]] - center
+    p2 = co_h[tris_h[:,2]] - center
+    return (float(np.abs(np.einsum('ij,ij->i', p0, np.cross(p1, p2))).sum() / 6))
+
+
+# Candidate orientations (ncandidates,3,3) for the minimum-volume box of a convex hull:
+# each hull face normal, paired with the in-plane direction of every hull edge on the silhouette
+# of the hull seen along that normal (the edges of the projected hull, as in rotating calipers),
+# plus the primary axes V. Frames whose directions agree to within angle_tol are merged
+def get_box_candidates(co_h, tris_h, V, angle_tol=5e-3, max_elts=4000000):
+    if len(tris_h) == 0:
+        return (np.array(V, dtype=np.float64)[None,:,:])
+
+    # Unit face normals
+    p0 = co_h[tris_h[:,0]]
+    normals = np.cross(co_h[tris_h[:,1]] - p0, co_h[tris_h[:,2]] - p0)
+    lens = np.sqrt(np.einsum('ij,ij->i', normals, normals))
+    normals = normals / np.maximum(lens, 1e-30)[:,None]
+
+    # Hull edges, and the two faces of each edge that has exactly two
+    # (a degenerate, near-planar hull can have edges with one face, or more than two)
+    half_edges = np.sort(np.vstack((tris_h[:,[0,1]], tris_h[:,[1,2]], tris_h[:,[2,0]])), axis=1)
+    half_faces = np.tile(np.arange(len(tris_h)), 3)
+    edges, edge_inds = np.unique(half_edges, axis=0, return_inverse=True)
+    edge_inds = edge_inds.ravel()
+    edge_dirs = co_h[edges[:,1]] - co_h[edges[:,0]]
+    order = np.argsort(edge_inds, kind='mergesort')
+    is_pair = np.bincount(edge_inds)[edge_inds[order]] == 2
+    pair_edges = edge_inds[order][is_pair][::2]
+    edge_faces = half_faces[order][is_pair].reshape((-1, 2))
+
+    # The face's own edges, and the silhouette edges of the hull seen along each face normal,
+    # for blocks of faces so that no (faces, edges) array exceeds max_elts elements
+    normals0 = normals[edge_faces[:,0]]
+    normals1 = normals[edge_faces[:,1]]
+    block = max(1, max_elts // max(len(pair_edges), 1))
+    fi_blocks = [half_faces]
+    ei_blocks = [edge_inds]
+    for f0 in range(0, len(tris_h) if len(pair_edges) > 0 else 0, block):
+        nb = normals[f0:f0 + block]
+        is_cand = np.sign(nb.dot(normals0.T)) != np.sign(nb.dot(normals1.T))
+        fi_b, ei_b = np.nonzero(is_cand)
+        fi_blocks.append(fi_b + f0)
+        ei_blocks.append(pair_edges[ei_b])
+    fi = np.concatenate(fi_blocks)
+    ei = np.concatenate(ei_blocks)
+
+    nn = normals[fi]
+    uu = edge_dirs[ei] - np.einsum('ij,ij->i', edge_dirs[ei], nn)[:,None] * nn
+    ulens = np.sqrt(np.einsum('ij,ij->i', uu, uu))
+    keep = (ulens > 1e-12) & (lens[fi] > 1e-30)
+    nn = nn[keep]
+    uu = uu[keep] / ulens[keep][:,None]
+
+    # A box does not depend on the signs of its axes: point n and u along their largest component,
+    # then keep one frame per cell of side angle_tol in (n, u)
+    rows = np.arange(len(nn))
+    nn = nn * np.sign(nn[rows, np.argmax(np.abs(nn), axis=1)])[:,None]
+    uu = uu * np.sign(uu[rows, np.argmax(np.abs(uu), axis=1)])[:,None]
+    keys = np.round(np.hstack((nn, uu)) / angle_tol).astype(np.int64)
+    keys, first = np.unique(keys, axis=0, return_index=True)
+    nn = nn[first]
+    uu = uu[first]
+    axes = np.stack((nn, uu, np.cross(nn, uu)), axis=1)
+    return (np.vstack((axes, np.array(V, dtype=np.float64)[None,:,:])))
+
+
+# Minimum-volume box of each point set over its candidate orientations, batched across objects:
+# objects are processed in chunks, padded to the largest point set and candidate set of the chunk,
+# and the candidates of a chunk in blocks, keeping the running best box, so that no array exceeds
+# max_elts elements. Returns the box axes (nobs,3,3) and box_min, box_max (nobs,3) of the points in those axes
+def get_min_volume_boxes(point_sets, candidates, max_elts=4000000):
+    nobs = len(point_sets)
+    box_axes = np.zeros((nobs, 3, 3))
+    box_min = np.zeros((nobs, 3))
+    box_max = np.zeros((nobs, 3))
+
+    start = 0
+    while start < nobs:
+        # Largest chunk whose padded points, for a single candidate, stay under max_elts elements
+        stop = start + 1
+        npts = len(point_sets[start])
+        while stop < nobs:
+            npts_next = max(npts, len(point_sets[stop]))
+            if (stop + 1 - start) * npts_next * 3 > max_elts:
+                break
+            npts = npts_next
+            stop += 1
+        ncands = max(len(cs) for cs in candidates[start:stop])
+
+        # Pad by repeating the first point / candidate, which does not change the results
+        pts = np.array([np.vstack((ps, np.repeat(ps[:1], npts - len(ps), axis=0))) for ps in point_sets[start:stop]])
+        cands = np.array([np.vstack((cs, np.repeat(cs[:1], ncands - len(cs), axis=0))) for cs in candidates[start:stop]])
+
+        pts_t = pts.transpose((0, 2, 1))
+        chunk = np.arange(stop - start)
+        best_vol = np.full(stop - start, np.inf)
+        block = max(1, max_elts // ((stop - start) * npts * 3))
+        for k0 in range(0, ncands, block):
+            cands_b = cands[:, k0:k0 + block]
+            nb = cands_b.shape[1]
+            rotated = np.matmul(cands_b.reshape((len(chunk), nb * 3, 3)), pts_t).reshape((len(chunk), nb, 3, npts))
+            rmin = rotated.min(axis=3)
+            rmax = rotated.max(axis=3)
+            vols = np.prod(rmax - rmin, axis=2)
+            best = np.argmin(vols, axis=1)
+            better = vols[chunk, best] < best_vol
+            inds = chunk[better]
+            best = best[better]
+            best_vol[inds] = vols[inds, best]
+            box_axes[start + inds] = cands_b[inds, best]
+            box_min[start + inds] = rmin[inds, best]
+            box_max[start + inds] = rmax[inds, best]
+        start = stop
+
+    return (box_axes, box_min, box_max)
+
+
+# Faces of a box with vertices in the configuration of box_cords(), outward for a right-handed box
+box_faces = np.array([[0,1,3,2], [4,6,7,5], [0,4,5,1], [2,3,7,6], [0,2,6,4], [1,5,7,3]])
+
+
+# Add all boxes as a single mesh object called name, or replace the mesh of an existing object:
+# corners is (nboxes,8,3), the integer face layer "box_index" gives the box of each face,
+# and the object property "box_names" lists the box names, separated by ";"
+def add_box_mesh(name, corners, box_names):
+    nboxes = len(corners)
+
+    # Reverse the faces of boxes with left-handed axes so all normals point outward
+    frames = corners[:,[4,2,1],:] - corners[:,[0],:]
+    flip = np.linalg.det(frames) < 0
+    faces = np.where(flip[:,None,None], box_faces[None,:,::-1], box_faces[None,:,:])
+    faces = faces + 8 * np.arange(nboxes)[:,None,None]
+
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(nboxes * 8)
+    mesh.vertices.foreach_set("co", corners.astype(np.float32).ravel())
+    mesh.loops.add(nboxes * 24)
+    mesh.loops.foreach_set("vertex_index", faces.astype(np.int32).ravel())
+    mesh.polygons.add(nboxes * 6)
+    mesh.polygons.foreach_set("loop_start", np.arange(0, nboxes * 24, 4, dtype=np.int32))
+    mesh.polygons.foreach_set("loop_total", np.full(nboxes * 6, 4, dtype=np.int32))
+    box_index = mesh.polygon_layers_int.new("box_index")
+    box_index.data.foreach_set("value", np.repeat(np.arange(nboxes, dtype=np.int32), 6))
+    mesh.update(calc_edges=True)
+    mesh.materials.append(get_transparent_material())
+
+    bbox = bpy.data.objects.get(name)
+    if bbox is not None and bbox.type == 'MESH':
+        old_mesh = bbox.data
+        bbox.data = mesh
+        if old_mesh.users == 0:
+            bpy.data.meshes.remove(old_mesh)
     else:
-        print("unrecognized input!")
-        return()
-    bpy.ops.mesh.primitive_cube_add(location=[0,0,0])
-    new_cube = bpy.context.object
-    for ii, vv in enumerate(box_verts):
-        new_cube.data.vertices[ii].co = vv
-    # Make transparent
-    new_cube.active_material = bpy.data.materials["transparent"]
-    new_cube.show_transparent = True
-    return(new_cube)
+        bbox = bpy.data.objects.new(name, mesh)
+        bpy.context.scene.objects.link(bbox)
+    bbox.show_transparent = True  # Make transparent
+    bbox["box_names"] = ";".join(box_names)
+    return(bbox)
+
+
+# One shared material for all bounding boxes
+def get_transparent_material():
+    mat = bpy.data.materials.get("transparent")
+    if mat is None:
+        mat = bpy.data.materials.new("transparent")
+        mat.use_transparency = True
+        mat.alpha = 0.5
+    return(mat)
 
 
 
@@ -280,57 +586,371 @@ def box_cords(box_minmax):
 
 
 
+# Volume of ob, with any open holes closed by virtual caps (the mesh itself is not changed)
 def get_vol(ob):
-    activate_an_object()
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.scene.objects.active = ob
-
-    # Detect any open holes and add faces
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.mesh.region_to_loop()
-    bpy.ops.mesh.edge_face_add()
-
-    # Convert all faces to triangles (necessary for volume calculation)
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.mesh.quads_convert_to_tris()
-    bpy.ops.object.mode_set(mode='OBJECT')
-
-    # Loop through each face
-    n_faces = len(ob.data.polygons)
-    vol = 0
-    for ff in range(0, n_faces):
-        this_face = ob.data.polygons[ff]
-        n_vertices = len(this_face.vertices[:])
-        if n_vertices != 3:
-            print("faces must be triangles!  " + str(ff))
-        tri = [0] * n_vertices
-        for vv in range(0, n_vertices):
-            tri[vv] = ob.data.vertices[ob.data.polygons[ff].vertices[vv]].co
-        vol += get_vol_tri(tri)
+    # Faces of any size are triangulated in memory by get_fan_tris()
+    co, loop_verts, loop_starts = get_mesh_arrays(ob.data)
+    edges, loop_edges = get_edge_arrays(ob.data)
+    tris, tri_faces = get_fan_tris(loop_verts, loop_starts)
+    cap_centers, cap_tris, cap_loops = get_cap_tris(co, loop_verts, loop_starts, loop_edges, len(edges))
+    SA, vol, centroid, bbox = calc_mesh_metrics(np.vstack((co, cap_centers)), np.vstack((tris, cap_tris)))
     return(vol)
 
-def get_vol_tri(tri):  
-    # tri = [p0, p1, p2],  pn = [x, y, z]
-    p0 = tri[0]
-    p1 = tri[1]
-    p2 = tri[2]
-    vcross = cross_product(p1,p2)
-    vdot = dot_product(p0, vcross)
-    vol = vdot/6
-    return vol
-
-def cross_product(v0, v1):  # faster than numpy
-    x =   v0[1]*v1[2] - v0[2]*v1[1]
-    y = -(v0[0]*v1[2] - v0[2]*v1[0])
-    z =   v0[0]*v1[1] - v0[1]*v1[0]
-    return [x,y,z]
 
+# geom_cache entries are [update stamp, mesh hash, V, bbox_minmax, volume], so objects whose mesh has not
+# changed since they were measured are not measured again:  {object name: entry}
+geom_cache = {}
 
-def dot_product(v0,v1):
-    vec = [v0[n]*v1[n] for n in range(len(v0))]
-    return sum(vec)
+# Number of times the data of each object has been updated, counted by mark_updated_objects()
+update_counts = {}
+
+
+# Scene update handler:  count data updates (eg. edit mode changes) of the objects in the scene
+@persistent
+def mark_updated_objects(scene):
+    if bpy.data.objects.is_updated:
+        for ob in scene.objects:
+            if ob.is_updated_data:
+                update_counts[ob.name] = update_counts.get(ob.name, 0) + 1
+
+
+# The update count of ob together with the address of its mesh data:  an object created under the
+# name of a deleted one (eg. by separate) has new mesh data, so its stamp differs before any update is counted
+def get_update_stamp(ob):
+    return ((ob.data.as_pointer(), update_counts.get(ob.name, 0)))
+
+
+# The geom_cache entry of ob if ob has not been updated since the entry was made,
+# and its transform has been applied (measurements are made after transform_apply)
+def get_cache_entry(ob):
+    entry = geom_cache.get(ob.name)
+    if entry is None or entry[0] != get_update_stamp(ob):
+        return (None)
+    if ob.matrix_basis != Matrix.Identity(4):
+        return (None)
+    return (entry)
+
+
+# File load handler:  object names of the previous file mean nothing in the new one
+@persistent
+def clear_geom_cache(dummy):
+    geom_cache.clear()
+    update_counts.clear()
+
+
+# Drop the geom_cache entries and update counts of objects that no longer exist
+def prune_geom_cache():
+    names = set(bpy.data.objects.keys())
+    for cache in [geom_cache, update_counts]:
+        for name in [name for name in cache if name not in names]:
+            del cache[name]
+
+
+# Hash of the geometry of a mesh, changes whenever a vertex moves or the faces change
+def get_mesh_hash(co, loop_verts, loop_starts):
+    return hash((co.tobytes(), loop_verts.tobytes(), loop_starts.tobytes()))
+
+
+# Read the edges, and the edge of each face loop, of a mesh into numpy arrays
+def get_edge_arrays(mesh):
+    nedges = len(mesh.edges)
+    edges = np.empty(nedges * 2, dtype=np.int32)
+    mesh.edges.foreach_get("vertices", edges)
+    loop_edges = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("edge_index", loop_edges)
+    return (edges.reshape((nedges, 2)), loop_edges)
+
+
+# Virtual caps for the open holes of a mesh, without changing the mesh:
+# boundary edges (used by exactly one face) are grouped into boundary loops, and each loop is
+# closed by a fan of triangles around the centroid of its vertices, oriented opposite to the
+# adjoining faces.  Returns the cap centers (nloops,3), the cap triangles (indices >= len(co)
+# refer to cap_centers), and a vertex of the boundary loop closed by each cap
+def get_cap_tris(co, loop_verts, loop_starts, loop_edges, nedges):
+    nverts = len(co)
+    nloops = len(loop_verts)
+    face_count = np.bincount(loop_edges, minlength=nedges)
+    bdry_loops = np.nonzero(face_count[loop_edges] == 1)[0]
+    if len(bdry_loops) == 0:
+        return (np.empty((0, 3)), np.empty((0, 3), dtype=int), np.empty(0, dtype=int))
+
+    # Half edge a -> b of each boundary face loop
+    loop_next = np.arange(1, nloops + 1)
+    loop_next[np.append(loop_starts[1:], nloops) - 1] = loop_starts
+    a = loop_verts[bdry_loops]
+    b = loop_verts[loop_next[bdry_loops]]
+
+    labels = label_connected_components(nverts, a, b)
+    cap_labels, cap_first, cap_inds = np.unique(labels[a], return_index=True, return_inverse=True)
+    bdry_verts = np.unique(np.concatenate((a, b)))
+    vert_caps = np.searchsorted(cap_labels, labels[bdry_verts])
+    counts = np.bincount(vert_caps)
+    cap_centers = np.column_stack([np.bincount(vert_caps, co[bdry_verts,k]) for k in range(3)]) / counts[:,None]
+
+    cap_tris = np.column_stack((b, a, nverts + cap_inds))
+    return (cap_centers, cap_tris, a[cap_first])
+
+
+# Transform the local vertex coordinates co of ob to world coordinates
+def get_world_coords(ob, co):
+    mat = np.array(ob.matrix_world)
+    return (co.astype(np.float64).dot(mat[0:3,0:3].T) + mat[0:3,3])
+
+
+# Return a label for each of n vertices, equal for vertices connected through the edges (a, b);
+# union-find by vectorized hooking of roots and pointer jumping, labels are 0..(ncomponents-1)
+# ordered by the lowest vertex index of each component
+def label_connected_components(n, a, b):
+    labels = np.arange(n)
+    while True:
+        la = labels[a]
+        lb = labels[b]
+        differ = la != lb
+        if not differ.any():
+            break
+        # hook the larger root onto the smaller one, then compress paths
+        np.minimum.at(labels, np.maximum(la, lb)[differ], np.minimum(la, lb)[differ])
+        while True:
+            nxt = labels[labels]
+            if np.array_equal(nxt, labels):
+                break
+            labels = nxt
+    return (np.unique(labels, return_inverse=True)[1])
+
+
+# Geometry of every labelled region of a mesh at once, by group-by reductions over the labels:
+# centroids (nlabels,3), primary axes (nlabels,3,3) with axes[l,i] the i-th axis of region l
+# (largest variance first, as the rows of V from the SVD in get_geom_properties()),
+# box_min and box_max (nlabels,3) of the vertices in those axes relative to the centroid,
+# and the max length, length ratio and volume of each region
+def get_label_geom_properties(co, loop_verts, loop_starts, loop_edges, nedges, labels, nlabels):
+    counts = np.bincount(labels, minlength=nlabels)
+    centroids = np.column_stack([np.bincount(labels, co[:,k], nlabels) for k in range(3)]) / counts[:,None]
+    centered = co - centroids[labels]
+
+    # Covariance matrix of each region, eigenvectors are its primary axes
+    cov = np.empty((nlabels, 3, 3))
+    for ii in range(3):
+        for jj in range(ii, 3):
+            cov[:,ii,jj] = np.bincount(labels, centered[:,ii] * centered[:,jj], nlabels)
+            cov[:,jj,ii] = cov[:,ii,jj]
+    evals, evecs = np.linalg.eigh(cov)  # ascending eigenvalues, eigenvectors in columns
+    axes = evecs[:,:,::-1].transpose(0, 2, 1)
+
+    # Oriented bounding box:  min and max of the rotated vertices of each region
+    rotated = np.einsum('nij,nj->ni', axes[labels], centered)
+    order = np.argsort(labels, kind='mergesort')
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    box_min = np.minimum.reduceat(rotated[order], starts, axis=0)
+    box_max = np.maximum.reduceat(rotated[order], starts, axis=0)
+
+    # Ordered box side lengths
+    sides = -np.sort(box_min - box_max, axis=1)
+    max_lengths = sides[:,0]
+    mean_other = (sides[:,1] + sides[:,2]) / 2
+    length_ratios = np.zeros(nlabels)
+    np.divide(max_lengths, mean_other, out=length_ratios, where=mean_other > 0)
+
+    # Volume:  signed tetrahedra of each triangle with the centroid of its region,
+    # with any open holes closed by virtual caps as in get_vol()
+    tris, tri_faces = get_fan_tris(loop_verts, loop_starts)
+    cap_centers, cap_tris, cap_verts = get_cap_tris(co, loop_verts, loop_starts, loop_edges, nedges)
+    cap_labels = labels[cap_verts]
+    centered = np.vstack((centered, cap_centers - centroids[cap_labels]))
+    tri_labels = np.concatenate((labels[tris[:,0]], cap_labels[cap_tris[:,2] - len(co)]))
+    tris = np.vstack((tris, cap_tris))
+    p0 = centered[tris[:,0]]
+    p1 = centered[tris[:,1]]
+    p2 = centered[tris[:,2]]
+    tri_vols = np.einsum('ij,ij->i', p0, np.cross(p1, p2)) / 6
+    volumes = np.bincount(tri_labels, tri_vols, nlabels)
+
+    return ([centroids, axes, box_min, box_max, max_lengths, length_ratios, volumes])
+
+
+# Shape descriptors of every labelled object of a mesh at once, by group-by reductions over the labels
+# of the vertices (labels are 0..(nlabels-1)); open holes are closed by virtual caps for the volume.
+# Returns (nlabels,7):  surface area, sphericity, surface to volume ratio,
+# the 3 principal moments of inertia of the enclosed solid (unit density, largest first),
+# and the number of connected pieces of each object
+def get_shape_descriptors(co, loop_verts, loop_starts, edges, loop_edges, labels, nlabels):
+    counts = np.bincount(labels, minlength=nlabels)
+    centroids = np.column_stack([np.bincount(labels, co[:,k], nlabels) for k in range(3)]) / \
+                np.maximum(counts, 1)[:,None]
+    centered = co - centroids[labels]
+
+    # Surface area of the faces, none for edge-only or vertex-only objects;
+    # the caps are added below, to match the capped volume
+    SA = np.zeros(nlabels)
+    if len(loop_starts) > 0:
+        face_labels = labels[loop_verts[loop_starts]]
+        SA += np.bincount(face_labels, calc_face_areas(centered, loop_verts, loop_starts), nlabels)
+    tris, tri_faces = get_fan_tris(loop_verts, loop_starts)
+    tri_labels = labels[tris[:,0]]
+
+    # Signed tetrahedra of all triangles, including the caps, with the vertex centroid of their object
+    cap_centers, cap_tris, cap_verts = get_cap_tris(co, loop_verts, loop_starts, loop_edges, len(edges))
+    cap_labels = labels[cap_verts]
+    pts = np.vstack((centered, cap_centers - centroids[cap_labels]))
+    cap_tri_labels = cap_labels[cap_tris[:,2] - len(co)]
+    SA += np.bincount(cap_tri_labels, calc_tri_areas(pts, cap_tris), nlabels)
+    tri_labels = np.concatenate((tri_labels, cap_tri_labels))
+    tris = np.vstack((tris, cap_tris))
+    p0 = pts[tris[:,0]]
+    p1 = pts[tris[:,1]]
+    p2 = pts[tris[:,2]]
+    tet_vols = np.einsum('ij,ij->i', p0, np.cross(p1, p2)) / 6
+    volumes = np.bincount(tri_labels, tet_vols, nlabels)
+
+    # First and second moments of the solid:  for a tetrahedron with vertices 0, p0, p1, p2,
+    # integral of x x^T = vol/20 * (s s^T + p0 p0^T + p1 p1^T + p2 p2^T), with s = p0 + p1 + p2
+    psum = p0 + p1 + p2
+    first = np.column_stack([np.bincount(tri_labels, tet_vols * psum[:,k] / 4, nlabels) for k in range(3)])
+    second = np.empty((nlabels, 3, 3))
+    for ii in range(3):
+        for jj in range(ii, 3):
+            outer = psum[:,ii]*psum[:,jj] + p0[:,ii]*p0[:,jj] + p1[:,ii]*p1[:,jj] + p2[:,ii]*p2[:,jj]
+            second[:,ii,jj] = np.bincount(tri_labels, tet_vols * outer / 20, nlabels)
+            second[:,jj,ii] = second[:,ii,jj]
+
+    # Second moments about the centroid of the solid, inertia tensor, principal moments;
+    # objects with inward normals have negative volume, so all moments are sign-corrected
+    vol_centroids = np.zeros((nlabels, 3))
+    np.divide(first, volumes[:,None], out=vol_centroids, where=volumes[:,None] != 0)
+    second = second - volumes[:,None,None] * np.einsum('li,lj->lij', vol_centroids, vol_centroids)
+    inertia = np.trace(second, axis1=1, axis2=2)[:,None,None] * np.eye(3) - second
+    moments = np.linalg.eigvalsh(inertia * np.sign(volumes)[:,None,None])[:,::-1]
+    volumes = np.abs(volumes)
+
+    sphericity = np.zeros(nlabels)
+    np.divide(np.pi**(1/3) * (6 * volumes)**(2/3), SA, out=sphericity, where=SA > 0)
+    SA_to_vol = np.zeros(nlabels)
+    np.divide(SA, volumes, out=SA_to_vol, where=volumes > 0)
+
+    # Connected pieces:  the lowest vertex of each connected component, counted per object
+    comps = label_connected_components(len(co), edges[:,0], edges[:,1])
+    first_verts = np.unique(comps, return_index=True)[1]
+    npieces = np.bincount(labels[first_verts], minlength=nlabels)
+
+    return (np.column_stack((SA, sphericity, SA_to_vol, moments, npieces)))
+
+
+# World coordinates of the 8 corners of each oriented bounding box, (nlabels,8,3),
+# in the same configuration as the Blender cube (see box_cords())
+def get_label_box_corners(centroids, axes, box_min, box_max):
+    corner_bits = np.array([[(ii >> 2) & 1, (ii >> 1) & 1, ii & 1] for ii in range(8)], dtype=bool)
+    local = np.where(corner_bits[None,:,:], box_max[:,None,:], box_min[:,None,:])
+    return (centroids[:,None,:] + np.einsum('lck,lkj->lcj', local, axes))
+
+
+# Mesh arrays of all objects of ob_list joined together, with indices offset to the joined arrays:
+# returns co, loop_verts, loop_starts, edges, loop_edges, and the index in ob_list of each vertex
+def get_joined_arrays(ob_list):
+    all_co, all_loop_verts, all_loop_starts, all_edges, all_loop_edges, all_labels = [], [], [], [], [], []
+    nverts, nloops, nedges = 0, 0, 0
+    for ind, ob in enumerate(ob_list):
+        co, loop_verts, loop_starts = get_mesh_arrays(ob.data)
+        edges, loop_edges = get_edge_arrays(ob.data)
+        all_co.append(get_world_coords(ob, co))
+        all_loop_verts.append(loop_verts + nverts)
+        all_loop_starts.append(loop_starts + nloops)
+        all_edges.append(edges + nverts)
+        all_loop_edges.append(loop_edges + nedges)
+        all_labels.append(np.full(len(co), ind))
+        nverts += len(co)
+        nloops += len(loop_verts)
+        nedges += len(edges)
+    return (np.vstack(all_co), np.concatenate(all_loop_verts), np.concatenate(all_loop_starts),
+            np.vstack(all_edges), np.concatenate(all_loop_edges), np.concatenate(all_labels))
+
+
+# Read vertex coordinates and face loops of a mesh into numpy arrays
+def get_mesh_arrays(mesh):
+    nverts = len(mesh.vertices)
+    co = np.empty(nverts * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    loop_verts = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_verts)
+    loop_starts = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_start", loop_starts)
+    return (co.reshape((nverts, 3)), loop_verts, loop_starts)
+
+
+# Fan triangulation of every face (triangles, quads and n-gons) from its loops:
+# returns (ntris,3) array of vertex indices, and the face index of each triangle
+def get_fan_tris(loop_verts, loop_starts):
+    nloops = len(loop_verts)
+    loop_ends = np.empty_like(loop_starts)
+    loop_ends[:-1] = loop_starts[1:]
+    loop_ends[-1:] = nloops
+    face_of_loop = np.repeat(np.arange(len(loop_starts)), loop_ends - loop_starts)
+
+    # triangle (first, k, k+1) for every loop k that is neither the first nor the last of its face
+    is_inner = np.ones(nloops, dtype=bool)
+    is_inner[loop_starts] = False
+    is_inner[loop_ends - 1] = False
+    k = np.nonzero(is_inner)[0]
+    tri_faces = face_of_loop[k]
+    tris = np.column_stack((loop_verts[loop_starts[tri_faces]], loop_verts[k], loop_verts[k + 1]))
+    return (tris, tri_faces)
+
+
+# Area of each triangle of tris, indices into the vertex coordinates co
+def calc_tri_areas(co, tris):
+    p0 = co[tris[:,0]].astype(np.float64)
+    cross = np.cross(co[tris[:,1]] - p0, co[tris[:,2]] - p0)
+    return (np.sqrt(np.einsum('ij,ij->i', cross, cross)) / 2)
+
+
+# Area of every face of a mesh, any number of vertices:  the signed cross products of the
+# fan triangles of each face are summed before taking the norm, which is exact for concave faces too
+def calc_face_areas(co, loop_verts, loop_starts):
+    if len(loop_starts) == 0:
+        return (np.zeros(0))
+    nloops = len(loop_verts)
+    loop_ends = np.append(loop_starts[1:], nloops)
+    face_of_loop = np.repeat(np.arange(len(loop_starts)), loop_ends - loop_starts)
+    nxt = np.arange(1, nloops + 1)
+    nxt[loop_ends - 1] = loop_starts  # wrap to first loop of face
+
+    p0 = co[loop_verts[loop_starts]][face_of_loop].astype(np.float64)
+    cross = np.cross(co[loop_verts] - p0, co[loop_verts[nxt]] - p0)
+    face_cross = np.add.reduceat(cross, loop_starts, axis=0)
+    return (np.sqrt(np.einsum('ij,ij->i', face_cross, face_cross)) / 2)
+
+
+# Surface area, signed volume, centroid and bounding box of a mesh, all triangles at once;
+# centroid is the centroid of the enclosed volume, or of the surface if the mesh encloses no volume.
+# If the face index of each triangle is given (as from get_fan_tris()), the surface area is the sum
+# of the face areas, so concave faces are not overcounted by their fan triangles.
+def calc_mesh_metrics(co, tris, tri_faces=None):
+    if len(tris) == 0:
+        # no faces (edge-only or vertex-only mesh):  no surface area or volume
+        centroid = co.mean(axis=0) if len(co) > 0 else None
+        bbox = (co.min(axis=0), co.max(axis=0)) if len(co) > 0 else None
+        return ([0.0, 0.0, centroid, bbox])
+    p0 = co[tris[:,0]].astype(np.float64)
+    p1 = co[tris[:,1]].astype(np.float64)
+    p2 = co[tris[:,2]].astype(np.float64)
+    tri_areas = calc_tri_areas(co, tris)
+    tri_vols = np.einsum('ij,ij->i', p0, np.cross(p1, p2)) / 6  # signed tetrahedra with the origin
+    if tri_faces is None:
+        SA = tri_areas.sum()
+    else:
+        # signed cross products of the fan triangles of each face (consecutive in tris), summed per face
+        face_starts = np.flatnonzero(np.r_[True, tri_faces[1:] != tri_faces[:-1]])
+        face_cross = np.add.reduceat(np.cross(p1 - p0, p2 - p0), face_starts, axis=0)
+        SA = np.sqrt(np.einsum('ij,ij->i', face_cross, face_cross)).sum() / 2
+    vol = tri_vols.sum()
+
+    if vol != 0:
+        centroid = (tri_vols.dot(p0 + p1 + p2) / 4) / vol
+    elif SA > 0:
+        centroid = (tri_areas.dot(p0 + p1 + p2) / 3) / SA
+    else:
+        centroid = co.mean(axis=0) if len(co) > 0 else None
+    bbox = (co.min(axis=0), co.max(axis=0)) if len(co) > 0 else None
+    return ([float(SA), float(vol), centroid, bbox])
 
 
 
@@ -357,25 +977,29 @@ class DefineFile(bpy.types.Operator):
         return {"RUNNING_MODAL"}
 
 
+# Column names of the values returned by get_geom_properties(), GetGeometry.get_hull_properties()
+# and get_shape_descriptors()
+geom_col_names = ["Max Length of Bounding Box", "Max-Min Length Ratio", "Volume"]
+hull_col_names = ["Max Length of Min-Volume Box", "Min-Volume Box Length Ratio", "Convex Hull Volume", "Solidity"]
+desc_col_names = ["Surface Area", "Sphericity", "Surface to Volume Ratio", "Principal Moment of Inertia 1",
+                  "Principal Moment of Inertia 2", "Principal Moment of Inertia 3", "Connected Pieces"]
+
+
 # Write data to file, assumes geom_props and ob_names are same length
-def write_data(self, geom_props, ob_names):
+def write_data(self, geom_props, ob_names, col_names=geom_col_names):
     directory = bpy.props.StringProperty(subtype="FILE_PATH")
     filename = bpy.props.StringProperty(subtype="FILE_NAME")
     full_filename = bpy.context.scene.filename
 
     f = open(full_filename, 'w')
-    f.write("Object Name;Max Length of Bounding Box;Max-Min Length Ratio;Volume\n")
-
-    max_lens = [v[0] for v in geom_props]
-    len_rats = [v[1] for v in geom_props]
-    vols = [v[2] for v in geom_props]
+    f.write("Object Name;" + ";".join(col_names) + "\n")
 
     for ii, elt in enumerate(geom_props):
-        [max_len, len_rat, vol] = elt
-        f.write(ob_names[ii] + ";" + str(max_len) + ";" + str(len_rat) + ";" + str(vol) +"\n")
+        f.write(ob_names[ii] + ";" + ";".join([str(val) for val in elt]) + "\n")
 
-    f.write("\nMean;" + str(np.mean(max_lens)) + ";" + str(np.mean(len_rats)) + ";" + str(np.mean(vols)) + "\n")
-    f.write("Median;" + str(np.median(max_lens)) + ";" + str(np.median(len_rats)) + ";" + str(np.median(vols)) + "\n")
+    cols = np.array(geom_props, dtype=np.float64).reshape((-1, len(col_names)))
+    f.write("\nMean;" + ";".join([str(np.mean(col)) for col in cols.T]) + "\n")
+    f.write("Median;" + ";".join([str(np.median(col)) for col in cols.T]) + "\n")
     f.close()
     self.report({'INFO'}, "Finished exporting file.")
 
@@ -399,6 +1023,8 @@ def activate_an_object(ob_0=[]):
 
 def register():
     bpy.utils.register_module(__name__)
+    bpy.app.handlers.load_post.append(clear_geom_cache)
+    bpy.app.handlers.scene_update_post.append(mark_updated_objects)
 
     # Define scene variables
     bpy.types.Scene.filename = bpy.props.StringProperty \
@@ -407,11 +1033,42 @@ def register():
         description = "Set file name and path for output data", 
         default = "/"
     )
+    bpy.types.Scene.geometry_mode = bpy.props.EnumProperty \
+    (
+        name = "Mode",
+        items = [('SEPARATE', 'Separate Objects', 'Separate the input into one object per connected region'),
+                 ('LABELS', 'Labels in Memory', 'Measure the connected regions of the input in memory, without creating objects')],
+        default = 'SEPARATE'
+    )
+    bpy.types.Scene.create_bboxes = bpy.props.BoolProperty \
+    (
+        name = "Create Bounding Boxes",
+        description = "Also add the bounding box of each region to the scene",
+        default = False
+    )
+    bpy.types.Scene.use_hull = bpy.props.BoolProperty \
+    (
+        name = "Convex Hull Descriptors",
+        description = "Also calculate the convex hull volume, solidity and minimum-volume box of each object (slower)",
+        default = False
+    )
+    bpy.types.Scene.use_descriptors = bpy.props.BoolProperty \
+    (
+        name = "Shape Descriptors",
+        description = "Also calculate surface area, sphericity, surface to volume ratio, principal moments of inertia and number of connected pieces of each object",
+        default = False
+    )
 
 def unregister():
     bpy.utils.unregister_module(__name__)
+    bpy.app.handlers.load_post.remove(clear_geom_cache)
+    bpy.app.handlers.scene_update_post.remove(mark_updated_objects)
 
     del bpy.types.Scene.filename
+    del bpy.types.Scene.geometry_mode
+    del bpy.types.Scene.create_bboxes
+    del bpy.types.Scene.use_hull
+    del bpy.types.Scene.use_descriptors
 
 if __name__ == "__main__":
     register()
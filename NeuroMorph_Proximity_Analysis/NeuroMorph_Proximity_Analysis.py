@@ -61,6 +61,8 @@ class ProximityAnalysisPanel(bpy.types.Panel):
 
         row = self.layout.row()
         row.prop(context.scene , "dist_thresh")
+        row = self.layout.row()
+        row.prop(context.scene , "surface_dist")
 
         row = self.layout.row(align=True)
         row.prop(context.scene, "filename")
@@ -69,17 +71,38 @@ class ProximityAnalysisPanel(bpy.types.Panel):
         row = self.layout.row()
         row.operator("object.get_distances", text='Compute Interactions', icon='ARROW_LEFTRIGHT')  # 'ARROW_LEFTRIGHT', 'MESH_DATA'
 
+        row = self.layout.row()
+        row.prop(context.scene, "dist_thresh_sweep")
+        row = self.layout.row()
+        row.operator("object.get_distances_sweep", text='Compute Threshold Sweep')
+
+
+
+        self.layout.label("----- All Pairwise Interactions -----")
+
+        row = self.layout.row()
+        row.prop(context.scene, "prefix1")
+        row = self.layout.row()
+        row.prop(context.scene, "prefix2")
+
+        row = self.layout.row()
+        row.operator("object.get_distances_all", text='Compute All Pairwise Interactions')
 
 
         self.layout.label("----- Sphere to Surface Distances -----")
 
         row = self.layout.row()
         row.operator("object.reduce_spheres", text='Reduce Spheres to Points')
+        row = self.layout.row()
+        row.prop(context.scene, "single_point_cloud")
 
         row = self.layout.row(align=True)
         row.prop(context.scene, "filename2")
         row.operator("file.set_filename2", text='', icon='FILESEL')
 
+        row = self.layout.row()
+        row.prop(context.scene , "surface_dist")
+
         row = self.layout.row()
         row.operator("object.get_distances2", text='Calculate Distances to Active Object')
 
@@ -182,13 +205,11 @@ class CalculateDistances(bpy.types.Operator):
         # Assumes all relevant objects are joined into a single object of each type
 
         t1 = datetime.datetime.now()
-        bad_count = 0
 
-        objs_start = [ob for ob in bpy.context.scene.objects if ob.type == 'MESH']
-        
         ob1 = bpy.data.objects[bpy.context.scene.name1]
         ob2 = bpy.data.objects[bpy.context.scene.name2]
         thresh = bpy.context.scene.dist_thresh
+        surface_dist = bpy.context.scene.surface_dist
 
         if ob1 == ob2 or ob1.type != 'MESH' or ob2.type != 'MESH':
             self.report({'INFO'}, "Please select two distinct objects for processing.")
@@ -207,120 +228,200 @@ class CalculateDistances(bpy.types.Operator):
             # bpy.ops.object.mode_set(mode='OBJECT')
 
         # Get vertices on each obj that are within dist thresh from the other obj
-        verts1, verts2 = get_close_verts(ob1, ob2, thresh)
+        # (world arrays equal the local ones here, and share the distance field cache with the sweep)
+        mesh1 = get_world_mesh_arrays(ob1)
+        mesh2 = get_world_mesh_arrays(ob2)
+        field = get_distance_field(mesh1, mesh2, thresh, surface_dist)
+        verts1, verts2 = get_close_verts_from_field(field, thresh)
         if len(verts1) == 0:
             self.report({'INFO'}, "No vertices less than Max Distance found between the selected objects.")
             return {'FINISHED'}
 
-        # Extract contiguous regions from each object
-        discontiguous_pairs = []
-        make_child = True
-        ob1_regions = separate_distinct_regions(ob1, verts1, make_child)
-        print("# initial regions of ob1:", len(ob1_regions))
-
-        for ob1_reg in ob1_regions:
-            # get proximate verts on ob2
-            print("Processing ", ob1_reg.name)
-            handled1 = handle_subregion(ob1_reg, verts2, thresh, ob2, make_child, ob1, ob2, discontiguous_pairs, False)
-            if not handled1[0]:
-                # ob1_reg must be split into sub-regions for each corresponding ob2_regs_here
-                ob2_regs_here = handled1[1]
-                for ob2_reg in ob2_regs_here:
-                    # print("case 2:  for each ob2_reg, proximate verts on ob1 should be strict subregion of ob1_reg")
-                    ob1_reg_vert_inds = range(len(ob1_reg.data.vertices))
-                    handled2 = handle_subregion(ob2_reg, ob1_reg_vert_inds, thresh, ob1_reg, make_child, ob2, ob1, discontiguous_pairs, True)
-                    if not handled2[0]:
-                        # ob2_reg must be split into sub-regions for each corresponding ob1_reg_sub_here
-                        ob1_reg_sub_here = handled2[1]
-                        for ob1_reg_sub in ob1_reg_sub_here:
-                            # print("case 2b:  splitting ob1_reg into sub regions")
-                            ob2_reg_vert_inds = range(len(ob2_reg.data.vertices))
-                            handled3 = handle_subregion(ob1_reg_sub, ob2_reg_vert_inds, thresh, ob2_reg, make_child, ob1, ob2, discontiguous_pairs, False)
-                            if not handled3[0]:
-                                ob2_reg_sub_here = handled3[1]
-                                print("expected single region, returned multiple, --LAYER 2-- eek!  <------------------------------------------------- BAD")
-                                print("if run into this case, must call handle_subregion() for more layers")
-                                self.report({'INFO'}, "Error: some regions not processed, please notify developer")
-                                print(ob2_reg_sub_here)
-                                print(ob1_reg_sub)
-                                bad_count += 1
-
-                        # After loop, delete object ob2_reg, as it has been split into multiple components
-                        bpy.ops.object.select_all(action='DESELECT')
-                        ob2_reg.select = True
-                        bpy.ops.object.delete()
-
-                # After loop, delete object ob1_reg, as it has been split into multiple components
-                bpy.ops.object.select_all(action='DESELECT')
-                ob1_reg.select = True
-                bpy.ops.object.delete()
-
+        # Extract contiguous regions from each object and pair them up, all in memory
+        discontiguous_pairs = get_contact_pairs(mesh1, mesh2, verts1, thresh, surface_dist, field)
 
-        # For each discontiguous vertex region pairs, calculate surface areas and centroids
+        # For each discontiguous vertex region pairs, calculate surface areas and centroids,
+        # only now creating objects for the regions that are kept
         SAs = []
-        for sub_ob1, sub_ob2 in discontiguous_pairs:
-            SA1, SA2, ctrd = get_SAs_and_centroid(sub_ob1, sub_ob2)
-            name_here1 = sub_ob1.name if hasattr(sub_ob1, 'name') else ""
-            name_here2 = sub_ob2.name if hasattr(sub_ob2, 'name') else ""
-            if SA1 == 0:
-                name_here1 = ""
-            if SA2 == 0:
-                name_here2 = ""
-            if SA1 != 0 or SA2 != 0:
-                SAs.append([name_here1, name_here2, SA1, SA2, ctrd])
-
-        # Remove all mesh objects without any faces
-        objs_del = [ob for ob in bpy.context.scene.objects if ob.type == 'MESH' and len(ob.data.polygons) == 0]
-        for ob_i in objs_del:
-            delete_object(ob_i)
-
-        # Make all sub objects invisible, and clean extraneous edges from meshes
-        objs_end = [ob for ob in bpy.context.scene.objects if ob.type == 'MESH']
-        for ob_i in objs_start:
-            objs_end.remove(ob_i)
-        for ob_i in objs_end:
-            # print(ob_i.name)
-            delete_extraneous_verts(ob_i)
-            ob_i.hide = True
+        region_faces1 = []
+        region_faces2 = []
+        make_child = True
+        for reg1, reg2 in discontiguous_pairs:
+            SA1, SA2, ctrd = get_SAs_and_centroid(mesh1, reg1, mesh2, reg2)
+            if SA1 == 0 and SA2 == 0:
+                continue
+            name_here1 = ""
+            name_here2 = ""
+            if SA1 != 0:
+                name_here1 = create_region_object(ob1, mesh1, reg1, make_child).name
+                region_faces1.append(get_region_faces(mesh1, reg1))
+            if SA2 != 0:
+                name_here2 = create_region_object(ob2, mesh2, reg2, make_child).name
+                region_faces2.append(get_region_faces(mesh2, reg2))
+            SAs.append([name_here1, name_here2, SA1, SA2, ctrd])
+
         bpy.ops.object.select_all(action='DESELECT')  # better for user
 
+        # Total areas count each face of the original objects once, even if in several regions
+        total_SAs = [get_total_SA(mesh1, region_faces1), get_total_SA(mesh2, region_faces2)]
+
         # Export results to csv
-        write_data(SAs, self)
+        write_data(SAs, total_SAs, self)
+
+        t2 = datetime.datetime.now()
+        print("Total processing time: ", t2-t1)
+
+        return {'FINISHED'}
+
+
+# Contact regions for a list of thresholds, from a single distance computation
+class CalculateDistancesSweep(bpy.types.Operator):
+    """Find all regions less than each of the sweep threshold distances between the two defined objects (no objects are created)"""
+    bl_idname = "object.get_distances_sweep"
+    bl_label = "Find all regions less than each of the sweep threshold distances between the two defined objects"
+
+    def execute(self, context):
+        t1 = datetime.datetime.now()
+
+        ob1 = bpy.data.objects[bpy.context.scene.name1]
+        ob2 = bpy.data.objects[bpy.context.scene.name2]
+        surface_dist = bpy.context.scene.surface_dist
+
+        if ob1 == ob2 or ob1.type != 'MESH' or ob2.type != 'MESH':
+            self.report({'INFO'}, "Please select two distinct objects for processing.")
+            return {'FINISHED'}
+
+        try:
+            threshs = sorted(set([float(t) for t in re.split("[,; ]+", bpy.context.scene.dist_thresh_sweep.strip())]))
+        except ValueError:
+            self.report({'ERROR'}, "Sweep thresholds must be a list of numbers, e.g. 0.02, 0.03, 0.05")
+            return {'FINISHED'}
+
+        # Distances of every vertex are computed (or retrieved from the cache) once, for the largest threshold
+        mesh1 = get_world_mesh_arrays(ob1)
+        mesh2 = get_world_mesh_arrays(ob2)
+        sweep_rows = get_sweep_rows(mesh1, mesh2, threshs, surface_dist)
+
+        write_sweep_data(sweep_rows, self)
 
-        print("bad count (better be 0!) = ", bad_count)
         t2 = datetime.datetime.now()
         print("Total processing time: ", t2-t1)
 
         return {'FINISHED'}
 
 
-# Process repeated in layers, potentially indefinitely when return false (will eventually stop at mesh resolution)
-def handle_subregion(ob1_reg, verts2, thresh, ob2_reg, make_child, ob1, ob2, discontiguous_pairs, reverse_obs):
-    ob2_regs_here = get_close_regions_to_single_region(ob1_reg, verts2, thresh, ob2_reg, make_child)
-    if len(ob2_regs_here) == 0:
+# Return list of [thresh, region number, SA1, SA2, centroid] for every contact region at every
+# threshold, followed by a total row per threshold; distances are computed once for all thresholds
+def get_sweep_rows(mesh1, mesh2, threshs, surface_dist=False):
+    field = get_distance_field(mesh1, mesh2, max(threshs), surface_dist)
+
+    sweep_rows = []
+    for thresh in threshs:
+        verts1, verts2 = get_close_verts_from_field(field, thresh)
+        discontiguous_pairs = get_contact_pairs(mesh1, mesh2, verts1, thresh, surface_dist, field)
+
+        region_faces1 = []
+        region_faces2 = []
+        for reg1, reg2 in discontiguous_pairs:
+            SA1, SA2, ctrd = get_SAs_and_centroid(mesh1, reg1, mesh2, reg2)
+            if SA1 == 0 and SA2 == 0:
+                continue
+            region_faces1.append(get_region_faces(mesh1, reg1))
+            region_faces2.append(get_region_faces(mesh2, reg2))
+            sweep_rows.append([thresh, len(region_faces1), SA1, SA2, ctrd])
+        total_SAs = [get_total_SA(mesh1, region_faces1), get_total_SA(mesh2, region_faces2)]
+        sweep_rows.append([thresh, "Total (non-overlapping)", total_SAs[0], total_SAs[1], None])
+
+    return (sweep_rows)
+
+
+# Pair up the contiguous regions of close vertices on the two meshes.
+# Returns a list of [reg1, reg2] vertex index arrays on mesh1 and mesh2, where one may be None.
+# If the distance field of get_distance_field() is given, only the vertices with a partner
+# within thresh in the field are searched again for every region.
+def get_contact_pairs(mesh1, mesh2, verts1, thresh, surface_dist=False, field=None):
+    all_verts2 = np.arange(len(mesh2["co"]))
+    ob1_regions = get_distinct_regions(mesh1, verts1)
+    print("# initial regions of ob1:", len(ob1_regions))
+
+    discontiguous_pairs = []
+    for ob1_reg in ob1_regions:
+        handle_subregion(ob1_reg, mesh1, all_verts2, mesh2, thresh, surface_dist, discontiguous_pairs, False, field)
+    return (discontiguous_pairs)
+
+
+# Process repeated in layers until every region has a single partner region (or none):
+# if reg_a is close to several regions of the other mesh, each of those is split in turn by
+# its close vertices on reg_a.  Regions shrink at every layer, so this stops at mesh resolution.
+# field is oriented from mesh_a to mesh_b, and is swapped along with the meshes.
+def handle_subregion(reg_a, mesh_a, cand_b, mesh_b, thresh, surface_dist, discontiguous_pairs, reverse_obs, field=None):
+    regs_b = get_close_regions_to_single_region(reg_a, mesh_a, cand_b, mesh_b, thresh, surface_dist, field)
+    if len(regs_b) == 0:
         if (reverse_obs):
-            discontiguous_pairs.append([[], ob1_reg])
+            discontiguous_pairs.append([None, reg_a])
         else:
-            discontiguous_pairs.append([ob1_reg, []])
-        return ([True])
-    elif len(ob2_regs_here) == 1:
-        if make_child:
-            ob2_regs_here[0].parent = ob2
-            ob1_reg.parent = ob1  # may already be the case
+            discontiguous_pairs.append([reg_a, None])
+    elif len(regs_b) == 1:
         if (reverse_obs):
-            discontiguous_pairs.append([ob2_regs_here[0], ob1_reg])
+            discontiguous_pairs.append([regs_b[0], reg_a])
         else:
-            discontiguous_pairs.append([ob1_reg, ob2_regs_here[0]])
-        return ([True])
+            discontiguous_pairs.append([reg_a, regs_b[0]])
     else:
-        return ([False, ob2_regs_here])
+        # reg_a must be split into sub-regions for each of regs_b
+        field_ba = None if field is None else [field[2], field[3], field[0], field[1]]
+        for reg_b in regs_b:
+            handle_subregion(reg_b, mesh_b, reg_a, mesh_a, thresh, surface_dist, discontiguous_pairs, not reverse_obs, field_ba)
 
 
 # Return lists of vertices on each obj that are within thresh of some vertex on other obj
-def get_close_verts(ob1, ob2, thresh):
-    # mat1 = ob1.matrix_world  # assuming everything in global coords, from transform_apply() above
-    # mat2 = ob2.matrix_world
+# (or of the other obj's surface, if surface_dist), together with their nearest such vertex
+def get_close_verts(mesh1, mesh2, thresh, surface_dist=False):
+    # assuming everything in global coords, from transform_apply() above
+
+    # Find closest vertices, in both directions, in bulk
+    inds12, dists12 = find_nearest_partner(mesh1["co"], mesh2, thresh, surface_dist)
+    inds21, dists21 = find_nearest_partner(mesh2["co"], mesh1, thresh, surface_dist)
+    return (get_close_verts_from_field([inds12, dists12, inds21, dists21], thresh))
+
 
+# Return close vertex lists as get_close_verts(), for any thresh up to the field's max distance
+def get_close_verts_from_field(field, thresh):
+    inds12, dists12, inds21, dists21 = field
+    found12 = dists12 < thresh
+    found21 = dists21 < thresh
+
+    close_verts1 = set(np.flatnonzero(found12).tolist()) | set(inds21[found21].tolist())
+    close_verts2 = set(np.flatnonzero(found21).tolist()) | set(inds12[found12].tolist())
+
+    return ([close_verts1, close_verts2])
+
+
+# Cache of per-vertex distance fields between two meshes,
+# {(name1, name2, surface_dist): [mesh hash 1, mesh hash 2, max distance, field]}
+dist_field_cache = {}
+
+# Return [inds12, dists12, inds21, dists21]:  for every vertex of each mesh, its distance to the
+# other mesh and nearest partner vertex there, computed for all distances below max_dist.
+# Reused for any smaller distance as long as neither mesh has changed.
+def get_distance_field(mesh1, mesh2, max_dist, surface_dist=False):
+    key = (mesh1["name"], mesh2["name"], surface_dist)
+    hash1 = get_mesh_hash(mesh1)
+    hash2 = get_mesh_hash(mesh2)
+    if key in dist_field_cache:
+        cached_hash1, cached_hash2, cached_max_dist, field = dist_field_cache[key]
+        if cached_hash1 == hash1 and cached_hash2 == hash2 and cached_max_dist >= max_dist:
+            print("using cached distance field")
+            return (field)
+
+    inds12, dists12 = find_nearest_partner(mesh1["co"], mesh2, max_dist, surface_dist)
+    inds21, dists21 = find_nearest_partner(mesh2["co"], mesh1, max_dist, surface_dist)
+    field = [inds12, dists12, inds21, dists21]
+    dist_field_cache[key] = [hash1, hash2, max_dist, field]
+    return (field)
+
+
+# Original per-vertex implementation of get_close_verts(), kept for benchmarking
+def get_close_verts_kdtree(ob1, ob2, thresh):
     # Build KDTrees
     size1 = len(ob1.data.vertices)
     kd1 = mathutils.kdtree.KDTree(size1)
@@ -352,130 +453,302 @@ def get_close_verts(ob1, ob2, thresh):
     return ([close_verts1, close_verts2])
 
 
-def get_close_regions_to_single_region(ob1_reg, verts2, thresh, ob2, make_child=True):  # todo: test this (seems fine)
-    # Build KDTrees
-    size1 = len(ob1_reg.data.vertices)
-    kd1 = mathutils.kdtree.KDTree(size1)
-    for i1, v1 in enumerate(ob1_reg.data.vertices):
-        kd1.insert(v1.co, i1)
-    kd1.balance()
-
-    size2 = len(ob2.data.vertices)
-    kd2 = mathutils.kdtree.KDTree(size2)
-    for i2, v2 in enumerate(ob2.data.vertices):
-        kd2.insert(v2.co, i2)
-    kd2.balance()
+# Compare the bulk and per-vertex close vertex searches, call from the Python console:
+#   import NeuroMorph_Proximity_Analysis as pa
+#   pa.benchmark_get_close_verts(bpy.data.objects["axon"], bpy.data.objects["dendrite"], 0.03)
+def benchmark_get_close_verts(ob1, ob2, thresh):
+    t1 = datetime.datetime.now()
+    verts1_loop, verts2_loop = get_close_verts_kdtree(ob1, ob2, thresh)
+    t2 = datetime.datetime.now()
+    verts1_bulk, verts2_bulk = get_close_verts(get_mesh_arrays(ob1), get_mesh_arrays(ob2), thresh)
+    t3 = datetime.datetime.now()
+
+    print("vertices:", len(ob1.data.vertices), len(ob2.data.vertices))
+    print("per-vertex KDTree:  ", t2-t1, " close verts:", len(verts1_loop), len(verts2_loop))
+    print("bulk grid search:   ", t3-t2, " close verts:", len(verts1_bulk), len(verts2_bulk))
+    # Sets can only differ when a vertex has two equidistant nearest neighbours
+    print("identical results:  ", verts1_loop == verts1_bulk and verts2_loop == verts2_bulk)
+    return ([t2-t1, t3-t2])
+
+
+# Return (n,3) array of the vertex coordinates of ob (local coordinates), read in a single call
+def get_vert_coords(ob):
+    nverts = len(ob.data.vertices)
+    coords = np.empty(nverts * 3, dtype=np.float32)
+    ob.data.vertices.foreach_get("co", coords)
+    return coords.reshape((nverts, 3)).astype(np.float64)
+
+
+# For each point in co_from, find the nearest point in co_to that is strictly closer than thresh.
+# Returns (inds, dists), with inds = -1 and dists = inf where no such point exists.
+# Points of co_to are hashed into a uniform grid of cell size thresh, so every candidate
+# lies in one of the 27 cells around the query point; each neighbour cell offset is
+# answered for a block of queries at once, expanding at most max_pairs (query, candidate) pairs.
+def find_nearest_within(co_from, co_to, thresh, block_size=65536, max_pairs=4000000):
+    n_from = len(co_from)
+    best_d2 = np.full(n_from, np.inf)
+    best_inds = np.full(n_from, -1, dtype=np.int64)
+    if n_from == 0 or len(co_to) == 0 or thresh <= 0:
+        return ([best_inds, np.sqrt(best_d2)])
+
+    # Integer grid cells, shifted so that every neighbour offset is non-negative
+    origin = np.minimum(co_from.min(axis=0), co_to.min(axis=0))
+    cells_from = np.floor((co_from - origin) / thresh).astype(np.int64) + 1
+    cells_to = np.floor((co_to - origin) / thresh).astype(np.int64) + 1
+    dims = np.maximum(cells_from.max(axis=0), cells_to.max(axis=0)) + 2
+
+    keys_to = (cells_to[:,0] * dims[1] + cells_to[:,1]) * dims[2] + cells_to[:,2]
+    order = np.argsort(keys_to, kind='mergesort')
+    keys_sorted = keys_to[order]
+
+    thresh_sq = thresh * thresh
+    offsets = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)]
+
+    for b0 in range(0, n_from, block_size):
+        b1 = min(b0 + block_size, n_from)
+        co_blk = co_from[b0:b1]
+        cells_blk = cells_from[b0:b1]
+        for off in offsets:
+            c = cells_blk + off
+            keys = (c[:,0] * dims[1] + c[:,1]) * dims[2] + c[:,2]
+            starts_blk = np.searchsorted(keys_sorted, keys, side='left')
+            counts_blk = np.searchsorted(keys_sorted, keys, side='right') - starts_blk
+            cum_counts = np.cumsum(counts_blk)
+            if cum_counts[-1] == 0:
+                continue
+
+            # Runs of queries [s0, s1) with at most max_pairs candidates in total (or a single query)
+            s0 = 0
+            while s0 < len(counts_blk):
+                done = cum_counts[s0 - 1] if s0 > 0 else 0
+                s1 = max(np.searchsorted(cum_counts, done + max_pairs, side='right'), s0 + 1)
+                counts = counts_blk[s0:s1]
+                starts = starts_blk[s0:s1]
+                total = cum_counts[s1 - 1] - done
+                if total == 0:
+                    s0 = s1
+                    continue
+
+                # Expand to one (query, candidate) pair per point in the neighbour cell
+                qs = np.repeat(np.arange(s1 - s0), counts)
+                seg_starts = np.cumsum(counts) - counts
+                pos = np.arange(total) - np.repeat(seg_starts, counts) + np.repeat(starts, counts)
+                cands = order[pos]
+                diff = co_blk[s0:s1][qs] - co_to[cands]
+                d2 = np.einsum('ij,ij->i', diff, diff)
+
+                # Nearest candidate in this cell for each query (qs is sorted)
+                nonempty = counts > 0
+                seg_min = np.minimum.reduceat(d2, seg_starts[nonempty])
+                is_min = np.flatnonzero(d2 == np.repeat(seg_min, counts[nonempty]))
+                q_min, first = np.unique(qs[is_min], return_index=True)
+                cand_min = cands[is_min[first]]
+
+                q_glob = q_min + b0 + s0
+                better = (seg_min < best_d2[q_glob]) & (seg_min < thresh_sq)
+                best_d2[q_glob[better]] = seg_min[better]
+                best_inds[q_glob[better]] = cand_min[better]
+                s0 = s1
+
+    return ([best_inds, np.sqrt(best_d2)])
+
+
+# Return the contiguous regions of the vertices cand_b on mesh_b that are within thresh of region reg_a on mesh_a;
+# with a distance field [inds_ab, dists_ab, inds_ba, dists_ba], only the vertices with a partner within thresh
+# anywhere on the other mesh are searched.  Partners are always searched within the other region, as the
+# nearest vertex on the whole mesh may belong to another region while one in this region is also within thresh.
+def get_close_regions_to_single_region(reg_a, mesh_a, cand_b, mesh_b, thresh, surface_dist=False, field=None):
+    from_a = reg_a
+    from_b = cand_b
+    if field is not None:
+        inds_ab, dists_ab, inds_ba, dists_ba = field
+        from_a = reg_a[dists_ab[reg_a] < thresh]
+        from_b = cand_b[dists_ba[cand_b] < thresh]
 
     # Find closest vertices
-    ob2_close_vert_inds = set()
-    for i1, v1 in enumerate(ob1_reg.data.vertices):
-        v2co, i2, dist12 = kd2.find(v1.co)
-        if dist12 < thresh:
-            ob2_close_vert_inds.add(i2)
-    for i2, v2 in enumerate(ob2.data.vertices):
-        v1co, i1, dist21 = kd1.find(v2.co)
-        if dist21 < thresh:
-            ob2_close_vert_inds.add(i2)
-
-    # if ob1_reg.name == 'mitochondria.001':
-
-    ob2_close_regs = separate_distinct_regions(ob2, ob2_close_vert_inds, make_child)
-    return (ob2_close_regs)
-
-
-
-# Returns list of new mesh objects for each distinct subregion from vert_list on ob
-def separate_distinct_regions(ob1, vert_list1, make_child=True):
-    # Select relevant vertices on object
-    activate_an_object()
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.scene.objects.active = ob1
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='DESELECT')  # edit mode
-    bpy.ops.object.mode_set(mode='OBJECT')
-    for v in vert_list1:
-        ob1.data.vertices[v].select=True
-
-    # Duplicate selected verts (still part of original object)
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.duplicate_move(MESH_OT_duplicate={"mode":1}, TRANSFORM_OT_translate={"value":(0, 0, 0), "constraint_axis":(False, False, False), "constraint_orientation":'GLOBAL', "mirror":False, "proportional":'DISABLED', "proportional_edit_falloff":'SMOOTH', "proportional_size":1, "snap":False, "snap_target":'CLOSEST', "snap_point":(0, 0, 0), "snap_align":False, "snap_normal":(0, 0, 0), "gpencil_strokes":False, "texture_space":False, "remove_on_cancel":False, "release_confirm":False})
-    # todo:  the above produces the "convertViewVec: called in an invalid context" warning
-
-
-    # Create separate objects for each discontiguous region
-    ob_list_before = [ob_i for ob_i in bpy.data.objects if ob_i.type == 'MESH']
-    bpy.ops.mesh.separate(type='SELECTED')  # new object contains only selected vertices
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.ops.mesh.separate(type='LOOSE')     # each discontiguous region is a separate object
-
-    # Remove all pre-existing objects
-    ob_list_after = [ob_i for ob_i in bpy.data.objects if ob_i.type == 'MESH']
-    for ob_i in ob_list_before:
-        ob_list_after.remove(ob_i)
-    # now ob_list_after is now only new objects (all submeshes of ob)
-
-    # print("\n--1:  potential new objects")
-    # for ob in ob_list_after:
-    #     if ob.type == 'MESH':
-    #         print(ob.name, len(ob.data.polygons))
-    
-
-    # Remove meshes with zero vertices, todo: still need this?
-    if False:
-        ob_list_meshes = [ob_i for ob_i in bpy.data.objects if ob_i.type == 'MESH']
-        for ob_i in ob_list_meshes:
-            if len(ob_i.data.vertices) == 0:
-                delete_object(ob_i)
-
-
-    # Remove all pre-existing objects, again
-    ob_list_after = [ob_i for ob_i in bpy.data.objects if ob_i.type == 'MESH']
-    for ob_i in ob_list_before:
-        if ob_i in ob_list_after:
-            ob_list_after.remove(ob_i)
-        else:
-            print(ob_i.name, " not in list, cannot remove")
-    # now ob_list_after is only new objects (all submeshes of ob)
-    
-
-    # Give the new submeshes meaningful names
+    inds_ab, dists_ab = find_nearest_partner(mesh_a["co"][from_a], mesh_b, thresh, surface_dist, cand_b)
+    inds_ba, dists_ba = find_nearest_partner(mesh_b["co"][from_b], mesh_a, thresh, surface_dist, reg_a)
+    close_b = np.union1d(inds_ab[inds_ab >= 0], from_b[inds_ba >= 0])
+
+    return (get_distinct_regions(mesh_b, close_b))
+
+
+# For each point in co_from, find the partner vertex on mesh_to (restricted to the vertices cand_to,
+# if given) and the distance, when closer than thresh.  Distances are to the nearest vertex, or to the
+# nearest point on the surface if surface_dist, in which case the partner is the vertex of the
+# nearest face closest to that point.  Returns (inds, dists) as find_nearest_within().
+def find_nearest_partner(co_from, mesh_to, thresh, surface_dist=False, cand_to=None):
+    if not surface_dist:
+        if cand_to is None:
+            return (find_nearest_within(co_from, mesh_to["co"], thresh))
+        inds, dists = find_nearest_within(co_from, mesh_to["co"][cand_to], thresh)
+        inds[inds >= 0] = cand_to[inds[inds >= 0]]
+        return ([inds, dists])
+
+    inds = np.full(len(co_from), -1, dtype=np.int64)
+    dists = np.full(len(co_from), np.inf)
+
+    # The whole-mesh tree is cached, trees over sub-regions are built when needed
+    if cand_to is None:
+        bvh, face_inds, reach, face_verts = get_surface_bvh(mesh_to, None)
+    else:
+        bvh, face_inds, reach, face_verts = get_surface_bvh(mesh_to, get_region_faces(mesh_to, cand_to))
+    if len(face_inds) == 0:
+        return ([inds, dists])
+
+    # Reject in bulk all points with no face vertex within thresh + (largest face radius),
+    # these cannot be within thresh of any face
+    loop_ends = np.append(mesh_to["loop_starts"][1:], len(mesh_to["loop_verts"]))
+    near_inds, near_dists = find_nearest_within(co_from, mesh_to["co"][face_verts], thresh + reach)
+
+    for ii in np.flatnonzero(near_inds >= 0):
+        loc, normal, bvh_ind, dist = bvh.find_nearest(Vector(co_from[ii]), thresh)
+        if loc is None or dist >= thresh:
+            continue
+        fi = face_inds[bvh_ind]
+        fverts = mesh_to["loop_verts"][mesh_to["loop_starts"][fi]:loop_ends[fi]]
+        diff = mesh_to["co"][fverts] - np.array(loc)
+        inds[ii] = fverts[np.argmin(np.einsum('ij,ij->i', diff, diff))]
+        dists[ii] = dist
+
+    return ([inds, dists])
+
+
+# Cache of surface trees of whole meshes, {object name: [mesh hash, (bvh, face_inds, reach, face_verts)]}
+bvh_cache = {}
+
+# Hash of the vertex coordinates and faces of a mesh, to check whether cached data is still valid
+def get_mesh_hash(mesh):
+    return (hash((mesh["co"].tobytes(), mesh["loop_verts"].tobytes(), mesh["loop_starts"].tobytes())))
+
+
+# Return a BVHTree over the faces face_inds of mesh (all faces if None), the array mapping tree
+# indices to face indices, the largest distance from any face point to the face's first vertex,
+# and the vertices of those faces.  The tree only contains the vertices of those faces.
+def get_surface_bvh(mesh, face_inds=None):
+    if face_inds is None:
+        mesh_hash = get_mesh_hash(mesh)
+        if mesh["name"] in bvh_cache and bvh_cache[mesh["name"]][0] == mesh_hash:
+            return (bvh_cache[mesh["name"]][1])
+        face_inds = np.arange(len(mesh["loop_starts"]))
+    else:
+        mesh_hash = None
+    if len(face_inds) == 0:
+        return ((None, face_inds, 0, np.empty(0, dtype=np.int64)))
+
+    # Loops of the faces face_inds only
+    loop_ends = np.append(mesh["loop_starts"][1:], len(mesh["loop_verts"]))
+    loop_totals = (loop_ends - mesh["loop_starts"])[face_inds]
+    local_starts = np.cumsum(loop_totals) - loop_totals
+    loops = np.arange(loop_totals.sum()) - np.repeat(local_starts, loop_totals) + \
+            np.repeat(mesh["loop_starts"][face_inds], loop_totals)
+    verts = mesh["loop_verts"][loops]
+    face_verts, local_verts = np.unique(verts, return_inverse=True)
+
+    faces = [face.tolist() for face in np.split(local_verts, local_starts[1:])]
+    bvh = mathutils.bvhtree.BVHTree.FromPolygons(mesh["co"][face_verts].tolist(), faces)
+
+    first_verts = np.repeat(verts[local_starts], loop_totals)
+    loop_reach = np.linalg.norm(mesh["co"][verts] - mesh["co"][first_verts], axis=1)
+    reach = loop_reach.max()
+
+    bvh_data = (bvh, face_inds, reach, face_verts)
+    if mesh_hash is not None:
+        bvh_cache[mesh["name"]] = [mesh_hash, bvh_data]
+    return (bvh_data)
+
+
+# Read the geometry needed for the in-memory region computations into NumPy arrays
+def get_mesh_arrays(ob):
+    me = ob.data
+    nedges = len(me.edges)
+    nloops = len(me.loops)
+    nfaces = len(me.polygons)
+
+    edges = np.empty(nedges * 2, dtype=np.int32)
+    me.edges.foreach_get("vertices", edges)
+    loop_verts = np.empty(nloops, dtype=np.int32)
+    me.loops.foreach_get("vertex_index", loop_verts)
+    loop_starts = np.empty(nfaces, dtype=np.int32)
+    me.polygons.foreach_get("loop_start", loop_starts)
+
+    mesh = {"name": ob.name,
+            "co": get_vert_coords(ob),
+            "edges": edges.reshape((nedges, 2)).astype(np.int64),
+            "loop_verts": loop_verts.astype(np.int64),
+            "loop_starts": loop_starts.astype(np.int64)}
+    mesh["face_areas"] = get_face_areas(mesh["co"], mesh["loop_verts"], mesh["loop_starts"])
+    return (mesh)
+
+
+# Return a label for each of n vertices, equal for vertices connected through the edges (a, b).
+# Union-find by vectorized hooking of roots and pointer jumping, labels are 0..(ncomponents-1).
+def label_connected_components(n, a, b):
+    labels = np.arange(n)
+    while True:
+        la = labels[a]
+        lb = labels[b]
+        differ = la != lb
+        if not differ.any():
+            break
+        # Hook the larger root onto the smaller one, then compress paths
+        np.minimum.at(labels, np.maximum(la, lb)[differ], np.minimum(la, lb)[differ])
+        while True:
+            nxt = labels[labels]
+            if np.array_equal(nxt, labels):
+                break
+            labels = nxt
+    return (np.unique(labels, return_inverse=True)[1])
+
+
+# Returns list of vertex index arrays, one for each distinct contiguous region of vert_list on mesh
+# (same regions as bpy.ops.mesh.separate(type='LOOSE') on the selected vertices)
+def get_distinct_regions(mesh, vert_list):
+    vert_inds = np.unique(np.fromiter(vert_list, dtype=np.int64))
+    if len(vert_inds) == 0:
+        return ([])
+
+    # Local indices of the selected vertices, and the edges with both ends selected
+    local_inds = np.full(len(mesh["co"]), -1, dtype=np.int64)
+    local_inds[vert_inds] = np.arange(len(vert_inds))
+    edges = local_inds[mesh["edges"]]
+    edges = edges[(edges[:,0] >= 0) & (edges[:,1] >= 0)]
+
+    labels = label_connected_components(len(vert_inds), edges[:,0], edges[:,1])
+    order = np.argsort(labels, kind='mergesort')
+    splits = np.flatnonzero(np.diff(labels[order])) + 1
+    return (np.split(vert_inds[order], splits))
+
+
+# Return indices of the faces of mesh whose vertices all belong to the region
+def get_region_faces(mesh, reg):
+    if reg is None or len(mesh["loop_starts"]) == 0:
+        return (np.empty(0, dtype=np.int64))
+    in_reg = np.zeros(len(mesh["co"]), dtype=np.int8)
+    in_reg[reg] = 1
+    face_in_reg = np.minimum.reduceat(in_reg[mesh["loop_verts"]], mesh["loop_starts"])
+    return (np.flatnonzero(face_in_reg))
+
+
+# Create a new mesh object from the faces of ob within region reg (vertices not part of any face are dropped)
+def create_region_object(ob, mesh, reg, make_child=True):
+    face_inds = get_region_faces(mesh, reg)
+    loop_ends = np.append(mesh["loop_starts"][1:], len(mesh["loop_verts"]))
+    faces = [mesh["loop_verts"][mesh["loop_starts"][fi]:loop_ends[fi]] for fi in face_inds]
+
+    used_verts = np.unique(np.concatenate(faces)) if len(faces) > 0 else np.empty(0, dtype=np.int64)
+    new_inds = np.full(len(mesh["co"]), -1, dtype=np.int64)
+    new_inds[used_verts] = np.arange(len(used_verts))
+
+    me = bpy.data.meshes.new(ob.name)
+    me.from_pydata(mesh["co"][used_verts].tolist(), [], [new_inds[f].tolist() for f in faces])
+    me.update()
+    reg_ob = bpy.data.objects.new(ob.name, me)
+    bpy.context.scene.objects.link(reg_ob)
     if make_child:
-        for ob_i in ob_list_after:
-            # ob_i.name = "sub-" + str(ob1.name)
-            ob_i.parent = ob1
-
-    return (ob_list_after)
-
-
-def delete_extraneous_verts(ob, separate_at_end=False):
-# Remove all vertices and edges from a mesh object that are not part of any faces
-# Note:  may result in mesh with two discontiguous regions that had been connected
-#        with a chain of edges, must discuss this in documentation  (todo)
-
-    if bpy.ops.object.mode_set.poll():
-        bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.scene.objects.active = ob
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='DESELECT')
-    bpy.ops.mesh.select_face_by_sides(number=3, type='GREATER')
-    bpy.ops.mesh.select_face_by_sides(number=3, type='EQUAL')
-    # this includes edges that are part of no faces if both of its vertices are parts of faces
-
-    bpy.ops.mesh.select_all(action='INVERT')
-    bpy.ops.mesh.delete(type='VERT')
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.object.mode_set(mode='OBJECT')
-    for v in ob.data.vertices:
-        v.select=True
-
-    # separate objects again, if being added to a list for further processing, otherwise don't
-    if separate_at_end:
-        nobjs_before = len(bpy.data.objects)
-        bpy.ops.object.mode_set(mode='EDIT')    # todo: why does separate(loose) need edit mode here, but obj mode above?
-        bpy.ops.mesh.separate(type='LOOSE')     # each discontiguous region is now a separate object
-        bpy.ops.object.mode_set(mode='OBJECT')
+        reg_ob.parent = ob
+    reg_ob.hide = True
+    return (reg_ob)
 
 
 def delete_object(ob_to_delete):
@@ -499,116 +772,36 @@ def activate_an_object():
     ob_0.select = True
 
 
-def get_SAs_and_centroid(sub_ob1, sub_ob2):
-    # Calculate surface areas of sub_objects; one object might be empty list
-    SA1 = 0
-    if hasattr(sub_ob1, 'data'):
-        # area uses local coordinates, okay as long as transform_apply()'d first
-        SA1 = sum([f.area for f in sub_ob1.data.polygons])
-
-    SA2 = 0
-    if hasattr(sub_ob2, 'data'):
-        SA2 = sum([f.area for f in sub_ob2.data.polygons])
+def get_SAs_and_centroid(mesh1, reg1, mesh2, reg2):
+    # Calculate surface areas of regions; one region might be None
+    # area uses local coordinates, okay as long as transform_apply()'d first
+    SA1 = mesh1["face_areas"][get_region_faces(mesh1, reg1)].sum()
+    SA2 = mesh2["face_areas"][get_region_faces(mesh2, reg2)].sum()
 
     # Calculate centroid of all vertices involved in this interaction, both surfaces
-    cntrd = Vector([0,0,0])
-    len1 = 0
-    len2 = 0
-    if hasattr(sub_ob1, 'data'):
-        len1 = len(sub_ob1.data.vertices)
-        for v1 in sub_ob1.data.vertices:
-            cntrd += v1.co
-    if hasattr(sub_ob2, 'data'):
-        len2 = len(sub_ob2.data.vertices)
-        for v2 in sub_ob2.data.vertices:
-            cntrd += v2.co
-    cntrd /= (len1 + len2)
-    
-    return ([SA1, SA2, cntrd])
-
-
+    cos = [mesh["co"][reg] for mesh, reg in [[mesh1, reg1], [mesh2, reg2]] if reg is not None]
+    cntrd = Vector(np.concatenate(cos).mean(axis=0))
 
-def get_total_SA(SAs):
+    return ([float(SA1), float(SA2), cntrd])
 
-    # Join separate surface area objects into single object
-    total_SA_ob1 = []
-    total_SA_ob2 = []
-    for SA in SAs:
-        ob1_name = SA[0]
-        ob2_name = SA[1]
-        if ob1_name != "":
-            ob1 = [ob for ob in bpy.data.objects if ob.name == ob1_name][0]
-            total_SA_ob1 = join_obs(total_SA_ob1, ob1)
 
-        if ob2_name != "":
-            ob2 = [ob for ob in bpy.data.objects if ob.name == ob2_name][0]
-            total_SA_ob2 = join_obs(total_SA_ob2, ob2)
 
-    # Remove duplicate faces
-    SA1 = get_nonoverlapping_area(total_SA_ob1)
-    SA2 = get_nonoverlapping_area(total_SA_ob2)
-
-    # Delete total_SA objects
-    bpy.ops.object.select_all(action='DESELECT')
-    total_SA_ob1.select = True
-    bpy.ops.object.delete()
-    bpy.ops.object.select_all(action='DESELECT')
-    total_SA_ob2.select = True
-    bpy.ops.object.delete()
-
-    return([SA1, SA2])
-
-
-
-def join_obs(total_SA, ob):
-    activate_an_object()
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.ops.object.select_all(action='DESELECT')
-    ob.select = True
-
-    # Duplicate region (bpy.ops.object.duplicate() does not return new object when run in add-on)
-    ob_copy = ob.copy()
-    ob_copy.data = ob.data.copy()
-    bpy.context.scene.objects.link(ob_copy)
-    ob_copy.hide = False
-
-    if total_SA == []:
-        return(ob_copy)
-    bpy.ops.object.select_all(action='DESELECT')
-    total_SA.select = True
-    ob_copy.select = True
-    bpy.context.scene.objects.active = total_SA
-    bpy.ops.object.join()
-    total_SA_ob = bpy.context.object
-
-    return(total_SA_ob)
-
-def get_nonoverlapping_area(total_SA):
-    # Remove overlapping faces
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.ops.object.select_all(action='DESELECT')
-    total_SA.select = True
-    bpy.context.scene.objects.active = total_SA
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.mesh.remove_doubles()
-    bpy.ops.object.mode_set(mode='OBJECT')
-
-    # Get SA
-    SA = 0
-    for f in total_SA.data.polygons:
-        SA += f.area
-    return(SA)
+# Return the area of the union of the regions, given as arrays of face indices of mesh
+def get_total_SA(mesh, region_faces):
+    if len(region_faces) == 0:
+        return (0)
+    all_faces = np.unique(np.concatenate(region_faces))
+    return (float(mesh["face_areas"][all_faces].sum()))
 
 
 
 # Write distances data to file 
-def write_data(SAs, self):
+def write_data(SAs, total_SAs, self):
     directory = bpy.props.StringProperty(subtype="FILE_PATH")
     filename = bpy.props.StringProperty(subtype="FILE_NAME")
     full_filename = bpy.context.scene.filename
 
-    [total_SA1, total_SA2] = get_total_SA(SAs)
+    [total_SA1, total_SA2] = total_SAs
 
     name1 = bpy.context.scene.name1
     name2 = bpy.context.scene.name2
@@ -628,6 +821,27 @@ def write_data(SAs, self):
 
 
 
+# Write threshold sweep data to file, one line per region per threshold
+def write_sweep_data(sweep_rows, self):
+    full_filename = bpy.context.scene.filename
+
+    name1 = bpy.context.scene.name1
+    name2 = bpy.context.scene.name2
+
+    f = open(full_filename, 'w')
+    f.write("Threshold;Region;Surface Area " + name1 + ";Surface Area " + name2 + ";Centroid of Interaction\n\n")
+
+    for thresh, region, SA1, SA2, cntrd in sweep_rows:
+        coord_str = ""
+        if cntrd is not None:
+            coord_str = "[" + str(cntrd[0]) + "," + str(cntrd[1]) + "," + str(cntrd[2]) + "]"  # use commas
+        f.write(str(thresh) + ";" + str(region) + ";" + str(SA1) + ";" + str(SA2) + ";" + coord_str + "\n")
+
+    f.close()
+    self.report({'INFO'}, "Finished exporting file.")
+
+
+
 def get_dist_sq(coord1, coord2):  # distance is monotonic, take square root at end for efficiency
     d = (coord1[0] - coord2[0])**2 + (coord1[1] - coord2[1])**2 + (coord1[2] - coord2[2])**2
     return d
@@ -642,6 +856,182 @@ def get_dist(coord1, coord2):
 
 
 
+#######################################################################################################
+################################ All Pairwise Interactions ############################################
+#######################################################################################################
+
+
+# Contacts between every object of one population and every object of another
+class CalculateAllDistances(bpy.types.Operator):
+    """Find the contact regions between every pair of objects from the two name prefixes, less than the threshold distance apart"""
+    bl_idname = "object.get_distances_all"
+    bl_label = "Find the contact regions between every pair of objects from the two name prefixes"
+
+    def execute(self, context):
+        t1 = datetime.datetime.now()
+
+        prefix1 = bpy.context.scene.prefix1
+        prefix2 = bpy.context.scene.prefix2
+        thresh = bpy.context.scene.dist_thresh
+
+        obs1 = [ob for ob in bpy.context.scene.objects if ob.type == 'MESH' and ob.name.startswith(prefix1)]
+        obs2 = [ob for ob in bpy.context.scene.objects if ob.type == 'MESH' and ob.name.startswith(prefix2)]
+        if prefix1 == "" or prefix2 == "" or len(obs1) == 0 or len(obs2) == 0:
+            self.report({'INFO'}, "Please define two name prefixes that each match at least one mesh object.")
+            return {'FINISHED'}
+
+        # Broad phase:  only pairs whose bounding boxes are within thresh of each other
+        cand_pairs = get_candidate_pairs(obs1, obs2, thresh)
+        print("candidate pairs:", len(cand_pairs), "of", len(obs1) * len(obs2))
+
+        # Narrow phase:  vertex distances and contact faces for each candidate pair
+        contacts = get_all_contacts(obs1, obs2, cand_pairs, thresh, bpy.context.scene.surface_dist)
+
+        write_all_contacts_data(contacts, self)
+
+        t2 = datetime.datetime.now()
+        print("Total processing time: ", t2-t1)
+
+        return {'FINISHED'}
+
+
+# Return world-space bounding boxes of obs as (n,3) arrays of min and max corners
+def get_world_bounds(obs):
+    mins = np.empty((len(obs), 3))
+    maxs = np.empty((len(obs), 3))
+    for ind, ob in enumerate(obs):
+        corners = np.array([ob.matrix_world * Vector(c) for c in ob.bound_box])
+        mins[ind] = corners.min(axis=0)
+        maxs[ind] = corners.max(axis=0)
+    return ([mins, maxs])
+
+
+# Build a bounding box tree over the boxes (mins, maxs) of a population of objects.
+# Each node is [box_min, box_max, left, right, leaf_inds]; boxes are split at the median
+# of their centers along the longest axis until at most leaf_size remain.
+def build_box_tree(mins, maxs, inds=None, leaf_size=8):
+    if inds is None:
+        inds = np.arange(len(mins))
+    node_min = mins[inds].min(axis=0)
+    node_max = maxs[inds].max(axis=0)
+    if len(inds) <= leaf_size:
+        return ([node_min, node_max, None, None, inds])
+
+    axis = np.argmax(node_max - node_min)
+    centers = (mins[inds, axis] + maxs[inds, axis]) / 2
+    order = np.argsort(centers, kind='mergesort')
+    half = len(inds) // 2
+    left = build_box_tree(mins, maxs, inds[order[:half]], leaf_size)
+    right = build_box_tree(mins, maxs, inds[order[half:]], leaf_size)
+    return ([node_min, node_max, left, right, None])
+
+
+# Return indices of the boxes in the tree that overlap the box (qmin, qmax)
+def query_box_tree(node, mins, maxs, qmin, qmax):
+    node_min, node_max, left, right, leaf_inds = node
+    if np.any(node_min > qmax) or np.any(node_max < qmin):
+        return ([])
+    if leaf_inds is not None:
+        overlap = np.all(mins[leaf_inds] <= qmax, axis=1) & np.all(maxs[leaf_inds] >= qmin, axis=1)
+        return (leaf_inds[overlap].tolist())
+    return (query_box_tree(left, mins, maxs, qmin, qmax) + query_box_tree(right, mins, maxs, qmin, qmax))
+
+
+# Broad phase:  return list of (i1, i2) index pairs into obs1, obs2 whose bounding boxes are within thresh
+def get_candidate_pairs(obs1, obs2, thresh):
+    mins1, maxs1 = get_world_bounds(obs1)
+    mins2, maxs2 = get_world_bounds(obs2)
+    tree2 = build_box_tree(mins2, maxs2)
+
+    cand_pairs = []
+    for i1, ob1 in enumerate(obs1):
+        for i2 in query_box_tree(tree2, mins2, maxs2, mins1[i1] - thresh, maxs1[i1] + thresh):
+            if obs2[i2] != ob1:
+                cand_pairs.append((i1, i2))
+    return (cand_pairs)
+
+
+# Return (n,3) array of the vertex coordinates of ob in global coordinates
+def get_world_coords(ob, co):
+    mat = np.array(ob.matrix_world)
+    return (co.dot(mat[:3,:3].T) + mat[:3,3])
+
+
+# Return area of every face of a mesh with vertex coordinates co, any number of vertices:
+# the signed cross products of the fan triangles are summed per face before taking the norm,
+# which is exact for concave faces too
+def get_face_areas(co, loop_verts, loop_starts):
+    nloops = len(loop_verts)
+    loop_ends = np.append(loop_starts[1:], nloops)
+    face_of_loop = np.repeat(np.arange(len(loop_starts)), loop_ends - loop_starts)
+    nxt = np.arange(1, nloops + 1)
+    nxt[loop_ends - 1] = loop_starts  # wrap to first loop of face
+
+    p0 = co[loop_verts[loop_starts]][face_of_loop]
+    cross = np.cross(co[loop_verts] - p0, co[loop_verts[nxt]] - p0)
+    face_cross = np.add.reduceat(cross, loop_starts, axis=0)
+    return (np.sqrt(np.einsum('ij,ij->i', face_cross, face_cross)) / 2)
+
+
+# Mesh arrays of ob as get_mesh_arrays(), in global coordinates (the object is left untouched)
+def get_world_mesh_arrays(ob):
+    mesh = get_mesh_arrays(ob)
+    mesh["co"] = get_world_coords(ob, mesh["co"])
+    mesh["face_areas"] = get_face_areas(mesh["co"], mesh["loop_verts"], mesh["loop_starts"])
+    return (mesh)
+
+
+# Narrow phase:  close vertices, contact regions and areas for every candidate pair,
+# returns list of [name1, name2, nregions, SA1, SA2, centroid]
+def get_all_contacts(obs1, obs2, cand_pairs, thresh, surface_dist=False):
+    # Geometry is read once per object, in global coordinates (objects are left untouched)
+    meshes = {}
+    def get_mesh(ob):
+        if ob.name not in meshes:
+            meshes[ob.name] = get_world_mesh_arrays(ob)
+        return (meshes[ob.name])
+
+    contacts = []
+    for i1, i2 in cand_pairs:
+        ob1 = obs1[i1]
+        ob2 = obs2[i2]
+        mesh1 = get_mesh(ob1)
+        mesh2 = get_mesh(ob2)
+
+        verts1, verts2 = get_close_verts(mesh1, mesh2, thresh, surface_dist)
+        if len(verts1) == 0:
+            continue
+        verts1 = np.fromiter(verts1, dtype=np.int64)
+        verts2 = np.fromiter(verts2, dtype=np.int64)
+
+        nregions = len(get_distinct_regions(mesh1, verts1))
+        SA1, SA2, cntrd = get_SAs_and_centroid(mesh1, verts1, mesh2, verts2)
+        contacts.append([ob1.name, ob2.name, nregions, SA1, SA2, cntrd])
+
+    return (contacts)
+
+
+# Write table of all pairwise contacts to file, one row per (object 1, object 2) pair in contact
+def write_all_contacts_data(contacts, self):
+    full_filename = bpy.context.scene.filename
+
+    f = open(full_filename, 'w')
+    f.write("Object 1;Object 2;Number of Contact Regions;Contact Surface Area Object 1;" + \
+            "Contact Surface Area Object 2;Centroid of Interaction\n\n")
+
+    for name1_here, name2_here, nregions, SA1, SA2, cntrd in contacts:
+        coord_str = "[" + str(cntrd[0]) + "," + str(cntrd[1]) + "," + str(cntrd[2]) + "]"  # use commas
+        f.write(name1_here + ";" + name2_here + ";" + str(nregions) + ";" + str(SA1) + ";" + str(SA2) + ";" + coord_str + "\n")
+
+    f.close()
+    self.report({'INFO'}, "Finished exporting file, " + str(len(contacts)) + " object pairs in contact.")
+
+
+
+
+
+
+
 
 
 #######################################################################################################
@@ -672,21 +1062,31 @@ class DefineFile2(bpy.types.Operator):
         return {"RUNNING_MODAL"}
 
 
-# Write distances data to file
-def write_distance_data(dists, all_vesicles, synapse_name, mean_dist):
+# Write distances data to file, one line per vesicle
+def write_distance_data(dists, vesicle_names, synapse_name, mean_dist):
     full_filename2 = bpy.context.scene.filename2
 
-    f = open(full_filename2, 'w')
+    f = open(full_filename2, 'w', buffering=1024*1024)
     f.write('Vesicle Name,Distance to ' + synapse_name + '\n\n')
 
-    for ind, d in enumerate(dists):
-        f.write(all_vesicles[ind].name + "," + str(d) + '\n')
+    for name, d in zip(vesicle_names, dists):
+        f.write(name + "," + str(d) + '\n')
 
     f.write('\n')
     f.write('mean distance,' + str(mean_dist))
     f.close()
 
 
+# Return (n,3) array of the global center (vertex mean) of each object in obs
+def get_object_centers(obs):
+    centers = np.empty((len(obs), 3))
+    for ind, ob in enumerate(obs):
+        # the mean of the transformed vertices is the transformed mean
+        local_mean = get_vert_coords(ob).mean(axis=0)
+        centers[ind] = get_world_coords(ob, local_mean[np.newaxis,:])[0]
+    return (centers)
+
+
 # Calculate distance from center of every child object to the active object, and write file
 class CalculateVesicleDistances(bpy.types.Operator):
     """Calculate distances to the selected surface (synapse) from each of its child spheres (vesicles)"""
@@ -704,43 +1104,47 @@ class CalculateVesicleDistances(bpy.types.Operator):
             return {'FINISHED'}
 
         # Calculate center coordinates of each vesicle
-        vesicle_centers = []
-        for vscl in all_vesicles:
-            mat_vscl = vscl.matrix_world
-            these_verts = vscl.data.vertices
-            nverts = len(these_verts)
-            v_sum = Vector([0,0,0])
-            for vert in these_verts:
-                these_global_coords = mat_vscl * vert.co
-                v_sum += these_global_coords
-            this_mean = v_sum / nverts
-            vesicle_centers.append(this_mean)
-
-        # Calculate distance from each vesicle center to each vertex on synapse
-        dists = []
-        inds = []
-        mat_syn = the_synapse.matrix_world
-        for v_ind, v_ctr in enumerate(vesicle_centers):
-            this_min = sys.maxsize
-            this_ind = -1
-            for s_ind, s_vrt in enumerate(the_synapse.data.vertices):
-                this_dist = get_dist_sq(v_ctr, mat_syn*s_vrt.co)
-                if this_dist < this_min:
-                    this_min = this_dist
-                    this_ind = s_ind
-                    
-            dists.append(math.sqrt(this_min))
-            inds.append(this_ind)
+        vesicle_centers, vesicle_names = get_vesicle_centers(all_vesicles)
+
+        # Synapse vertices are transformed to global coordinates once
+        syn_mesh = get_mesh_arrays(the_synapse)
+        syn_mesh["co"] = get_world_coords(the_synapse, syn_mesh["co"])
+
+        if len(syn_mesh["co"]) == 0:
+            self.report({'ERROR'}, 'Active object has no vertices.')
+            return {'FINISHED'}
+
+        # Calculate distance from each vesicle center to the synapse surface
+        if bpy.context.scene.surface_dist:
+            if len(syn_mesh["loop_starts"]) == 0:
+                self.report({'ERROR'}, 'Active object has no faces.')
+                return {'FINISHED'}
+            bvh, face_inds, reach, face_verts = get_surface_bvh(syn_mesh)
+            dists = [bvh.find_nearest(Vector(v_ctr))[3] for v_ctr in vesicle_centers]
+
+        # Or calculate distance from each vesicle center to the closest vertex on synapse
+        else:
+            kd = get_kdtree(syn_mesh["co"])
+            dists = [kd.find(Vector(v_ctr))[2] for v_ctr in vesicle_centers]
 
         mean_dist = sum(dists) / len(dists)
         # mean_3D = [sum(col) / float(len(col)) for col in zip(*dists)]
 
         # Write file containing all distances and mean
-        write_distance_data(dists, all_vesicles, the_synapse.name, mean_dist)
+        write_distance_data(dists, vesicle_names, the_synapse.name, mean_dist)
 
         return {'FINISHED'}
 
 
+# Return balanced KDTree containing the points co
+def get_kdtree(co):
+    kd = mathutils.kdtree.KDTree(len(co))
+    for ind, pt in enumerate(co.tolist()):
+        kd.insert(pt, ind)
+    kd.balance()
+    return (kd)
+
+
 # Calculate distance from center of every child object to the active object, and write file
 class Sphere2Point(bpy.types.Operator):
     """Optional: Replace each child mesh of selected object by single point at the mesh's center \n(useful for slow scenes containing many objects)"""
@@ -765,13 +1169,12 @@ class Sphere2Point(bpy.types.Operator):
                 parent_ob.select = True
                 bpy.context.scene.objects.active = parent_ob
                 bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
-                for ob in vscl_list:
-                    ob.select = True
-                    bpy.context.scene.objects.active = ob
-                    bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
 
-                # Convert to points
-                vert_ob_list = spheres2pts(vscl_list)
+                # Convert to points (sphere centers are computed in world coordinates)
+                if bpy.context.scene.single_point_cloud:
+                    vert_ob_list = [spheres2pointcloud(vscl_list, parent_ob.name + "_points")]
+                else:
+                    vert_ob_list = spheres2pts(vscl_list)
 
                 # Reassign parent object
                 for vert_ob in vert_ob_list:
@@ -817,29 +1220,12 @@ class Sphere2Point(bpy.types.Operator):
 # Calculate center of sphere, delete sphere, add new object 
 # with single vertex at center of sphere, same name as sphere
 def spheres2pts(spherelist):
-    vert_ob_list = []
-    for vscl in spherelist:
-        # Select object and all vertices
-        bpy.ops.object.mode_set(mode='OBJECT')
-        bpy.ops.object.select_all(action='DESELECT')
-        vscl.select = True
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='SELECT')
-
-        these_verts = vscl.data.vertices
-        nverts = len(these_verts)
-        v_sum = Vector([0,0,0])
-        for vert in these_verts:
-            v_sum += vert.co
-
-        this_mean = v_sum / nverts
-
-        # Delete vscl object
-        # To delete selected vertices:  bpy.ops.mesh.delete(type='VERT')
-        this_name = vscl.name
-        bpy.ops.object.mode_set(mode='OBJECT')
-        bpy.ops.object.delete()
+    centers = get_object_centers(spherelist)
+    names = [vscl.name for vscl in spherelist]
+    delete_objects(spherelist)
 
+    vert_ob_list = []
+    for this_name, this_mean in zip(names, centers.tolist()):
         # Create new single vertex object at vscl_mean
         me = bpy.data.meshes.new(this_name)
         vscl_ctr_ob = bpy.data.objects.new(this_name, me)
@@ -855,6 +1241,58 @@ def spheres2pts(spherelist):
     return(vert_ob_list)
 
 
+# Calculate centers of all spheres, delete spheres, add a single new object with one vertex
+# at the center of each sphere; sphere names are stored in vertex order in ob["vesicle_names"]
+def spheres2pointcloud(spherelist, ob_name):
+    centers = get_object_centers(spherelist)
+    names = [vscl.name for vscl in spherelist]
+    delete_objects(spherelist)
+
+    me = bpy.data.meshes.new(ob_name)
+    me.vertices.add(len(centers))
+    me.vertices.foreach_set("co", centers.astype(np.float32).ravel())
+    me.update()
+    pts_ob = bpy.data.objects.new(ob_name, me)
+    bpy.context.scene.objects.link(pts_ob)
+    pts_ob["vesicle_names"] = names
+
+    pts_ob.select = True
+    bpy.context.scene.objects.active = pts_ob
+
+    return(pts_ob)
+
+
+# Delete all objects in obs and their meshes (if not used elsewhere) without operators;
+# objects are unlinked from their scenes first, as remove(do_unlink=True) needs Blender 2.78
+def delete_objects(obs):
+    meshes = [ob.data for ob in obs]
+    for ob in obs:
+        for scene in ob.users_scene:
+            scene.objects.unlink(ob)
+        bpy.data.objects.remove(ob)
+    for me in meshes:
+        if me.users == 0:
+            bpy.data.meshes.remove(me)
+
+
+# Return centers and names of all vesicles represented by obs, where each object is either
+# a single vesicle (center = vertex mean) or a point cloud from spheres2pointcloud()
+def get_vesicle_centers(obs):
+    centers = []
+    names = []
+    single_obs = []
+    for ob in obs:
+        if "vesicle_names" in ob:
+            centers.append(get_world_coords(ob, get_vert_coords(ob)))
+            names.extend(ob["vesicle_names"])
+        else:
+            single_obs.append(ob)
+    if len(single_obs) > 0:
+        centers.append(get_object_centers(single_obs))
+        names.extend([ob.name for ob in single_obs])
+    return ([np.concatenate(centers), names])
+
+
 
 
 
@@ -876,6 +1314,13 @@ def register():
         default = "/"
     )
 
+    bpy.types.Scene.single_point_cloud = bpy.props.BoolProperty \
+    (
+        name = "As Single Point Cloud",
+        description = "Reduce spheres to one object with a vertex per sphere, instead of one object per sphere",
+        default = False
+    )
+
     bpy.types.Scene.name1 = bpy.props.StringProperty \
     (
         name = "Object 1", 
@@ -889,6 +1334,33 @@ def register():
         default = ""
     )
 
+    bpy.types.Scene.dist_thresh_sweep = bpy.props.StringProperty \
+    (
+        name = "Sweep",
+        description = "List of distance thresholds for the threshold sweep, e.g. 0.02, 0.03, 0.05",
+        default = ""
+    )
+
+    bpy.types.Scene.surface_dist = bpy.props.BoolProperty \
+    (
+        name = "Point-to-Surface Distances",
+        description = "Measure distances to the nearest point on the other surface instead of to its nearest vertex",
+        default = False
+    )
+
+    bpy.types.Scene.prefix1 = bpy.props.StringProperty \
+    (
+        name = "Prefix 1",
+        description = "Name prefix of all objects of the first population",
+        default = ""
+    )
+    bpy.types.Scene.prefix2 = bpy.props.StringProperty \
+    (
+        name = "Prefix 2",
+        description = "Name prefix of all objects of the second population",
+        default = ""
+    )
+
     bpy.types.Scene.dist_thresh = bpy.props.FloatProperty \
     (
         name = "Max Distance",
@@ -900,8 +1372,13 @@ def unregister():
     bpy.utils.unregister_module(__name__)
 
     del bpy.types.Scene.dist_thresh
+    del bpy.types.Scene.prefix2
+    del bpy.types.Scene.prefix1
+    del bpy.types.Scene.surface_dist
+    del bpy.types.Scene.dist_thresh_sweep
     del bpy.types.Scene.name2
     del bpy.types.Scene.name1 
+    del bpy.types.Scene.single_point_cloud
     del bpy.types.Scene.filename2
     del bpy.types.Scene.filename
 
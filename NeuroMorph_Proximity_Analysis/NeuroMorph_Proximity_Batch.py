@@ -0,0 +1,204 @@
+#    NeuroMorph_Proximity_Batch.py, part of NeuroMorph
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+# Headless Proximity Analysis over a whole dataset, without the Blender UI.
+#
+# Usage:
+#   blender --background --python NeuroMorph_Proximity_Batch.py -- manifest.csv output.csv [--workers 4] [--surface-dist]
+#
+# manifest.csv has one tissue block per line (lines starting with # are ignored):
+#   block name;path/to/object1.obj;path/to/object2.obj;thresholds
+# e.g.
+#   block_001;/data/block_001/axon.obj;/data/block_001/dendrite.obj;0.02,0.03,0.05
+# Relative paths are relative to the manifest.  Each block is processed in its own background
+# Blender process, and all results are merged into output.csv, with the processing time per block.
+# NeuroMorph_Proximity_Analysis.py must be in the same folder as this file.
+
+import bpy
+import os
+import sys
+import re
+import json
+import datetime
+import argparse
+import subprocess
+import tempfile
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import NeuroMorph_Proximity_Analysis as pa
+
+
+def parse_args():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(prog="blender --background --python NeuroMorph_Proximity_Batch.py --")
+    parser.add_argument("manifest", help="csv file listing block name;object 1 file;object 2 file;thresholds")
+    parser.add_argument("output", help="csv file for the merged results")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of Blender processes")
+    parser.add_argument("--surface-dist", action="store_true", help="use point-to-surface distances")
+    parser.add_argument("--worker-block", help=argparse.SUPPRESS)   # used internally
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)  # used internally
+    return (parser.parse_args(argv))
+
+
+# Raises ValueError naming the manifest file and line of any malformed line
+def read_manifest(manifest_file):
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_file))
+    blocks = []
+    f = open(manifest_file, 'r')
+    for line_num, line in enumerate(f, 1):
+        line = line.strip()
+        if line == "" or line.startswith("#"):
+            continue
+        fields = [elt.strip() for elt in line.split(";")]
+        if len(fields) != 4:
+            f.close()
+            raise ValueError(manifest_file + ", line " + str(line_num) + ": expected 4 fields " + \
+                             "(block name;object 1 file;object 2 file;thresholds), found " + str(len(fields)))
+        name, file1, file2, threshs = fields
+        try:
+            threshs = sorted(set([float(t) for t in re.split("[, ]+", threshs)]))
+        except ValueError:
+            f.close()
+            raise ValueError(manifest_file + ", line " + str(line_num) + ": thresholds must be a list of numbers, " + \
+                             "e.g. 0.02,0.03,0.05")
+        blocks.append({"name": name,
+                       "file1": os.path.join(manifest_dir, file1),
+                       "file2": os.path.join(manifest_dir, file2),
+                       "threshs": threshs})
+    f.close()
+    return (blocks)
+
+
+# Import all objects of an .obj file and join them into a single object, as expected by the analysis
+def import_joined_obj(filepath):
+    obs_before = set(bpy.data.objects)
+    bpy.ops.import_scene.obj(filepath=filepath)
+    new_obs = [ob for ob in bpy.data.objects if ob not in obs_before and ob.type == 'MESH']
+    if len(new_obs) == 0:
+        raise ValueError("no mesh objects found in " + filepath)
+
+    bpy.ops.object.select_all(action='DESELECT')
+    for ob in new_obs:
+        ob.select = True
+    bpy.context.scene.objects.active = new_obs[0]
+    if len(new_obs) > 1:
+        bpy.ops.object.join()
+    return (bpy.context.scene.objects.active)
+
+
+# Run inside each worker process:  analyse one block, write its rows to a json file
+def run_worker(block, output_file, surface_dist):
+    t1 = datetime.datetime.now()
+    pa.delete_objects(list(bpy.data.objects))  # start from an empty scene
+
+    ob1 = import_joined_obj(block["file1"])
+    ob2 = import_joined_obj(block["file2"])
+    mesh1 = pa.get_world_mesh_arrays(ob1)
+    mesh2 = pa.get_world_mesh_arrays(ob2)
+    sweep_rows = pa.get_sweep_rows(mesh1, mesh2, block["threshs"], surface_dist)
+
+    rows = []
+    for thresh, region, SA1, SA2, cntrd in sweep_rows:
+        coords = list(cntrd) if cntrd is not None else None
+        rows.append([thresh, region, SA1, SA2, coords])
+
+    t2 = datetime.datetime.now()
+    f = open(output_file, 'w')
+    json.dump({"rows": rows, "seconds": (t2-t1).total_seconds()}, f)
+    f.close()
+
+
+# Run one background Blender process for a block, return (block, results or error message)
+def process_block(block, args, tmp_dir, ind):
+    output_file = os.path.join(tmp_dir, "block_" + str(ind) + ".json")
+    cmd = [bpy.app.binary_path, "--background", "--factory-startup",
+           "--python", os.path.abspath(__file__), "--",
+           args.manifest, args.output,
+           "--worker-block", json.dumps(block), "--worker-output", output_file]
+    if args.surface_dist:
+        cmd.append("--surface-dist")
+
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    if proc.returncode != 0 or not os.path.exists(output_file):
+        return ([block, proc.stdout[-2000:]])
+    f = open(output_file, 'r')
+    results = json.load(f)
+    f.close()
+    return ([block, results])
+
+
+# Merge the results of all blocks into a single table
+def write_merged_data(all_results, output_file):
+    f = open(output_file, 'w')
+    f.write("Block;Object 1 file;Object 2 file;Threshold;Region;Surface Area Object 1;" + \
+            "Surface Area Object 2;Centroid of Interaction;Block Processing Time (s)\n\n")
+
+    for block, results in all_results:
+        prefix = block["name"] + ";" + block["file1"] + ";" + block["file2"] + ";"
+        if not isinstance(results, dict):
+            # Captured Blender output, on one line
+            message = " | ".join([elt.strip() for elt in results.splitlines() if elt.strip() != ""])
+            f.write(prefix + "ERROR: " + message.replace(";", ",") + ";;;;;\n")
+            continue
+        for thresh, region, SA1, SA2, cntrd in results["rows"]:
+            coord_str = ""
+            if cntrd is not None:
+                coord_str = "[" + str(cntrd[0]) + "," + str(cntrd[1]) + "," + str(cntrd[2]) + "]"  # use commas
+            f.write(prefix + str(thresh) + ";" + str(region) + ";" + str(SA1) + ";" + str(SA2) + ";" + \
+                    coord_str + ";" + str(results["seconds"]) + "\n")
+    f.close()
+
+
+def main():
+    args = parse_args()
+
+    if args.worker_block is not None:
+        run_worker(json.loads(args.worker_block), args.worker_output, args.surface_dist)
+        return
+
+    t1 = datetime.datetime.now()
+    try:
+        blocks = read_manifest(args.manifest)
+    except ValueError as err:
+        print("Error reading manifest:", err)
+        sys.exit(1)
+    print("Processing", len(blocks), "blocks with", args.workers, "workers")
+
+    # Each thread waits on its own Blender process
+    tmp_dir = tempfile.mkdtemp(prefix="neuromorph_proximity_")
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            futures = [pool.submit(process_block, block, args, tmp_dir, ind) for ind, block in enumerate(blocks)]
+            all_results = []
+            for future in futures:
+                block, results = future.result()
+                if isinstance(results, dict):
+                    print(block["name"], "finished in", results["seconds"], "s")
+                else:
+                    print(block["name"], "FAILED:\n", results)
+                all_results.append([block, results])
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    write_merged_data(all_results, args.output)
+
+    t2 = datetime.datetime.now()
+    print("Total processing time: ", t2-t1)
+
+
+if __name__ == "__main__":
+    main()